@@ -1,26 +1,37 @@
 # Fitting Bayesian model for Mpro given some constraints on parameters
 import os
+import json
 import pickle
+import numpy as np
 
-import arviz as az
+from _lazy_import import lazy_import
+az = lazy_import('arviz')
 
 import jax
 import jax.numpy as jnp
 from jax import random
 import jax.random as random
 
-import numpyro
-from numpyro.infer import MCMC, NUTS, init_to_value
-
-from _plotting import plotting_trace
 from _model import global_fitting
+from _model_fitting import _mcmc_sampling, _nuts_kernel
+from _approximate_inference import _approximate_posterior
 
 from _pIC50 import scaling_data
-from _plotting import plotting_trace 
+from _plotting import plotting_trace, plot_data_conc_log
+
+from _load_data import load_data_one_inhibitor
+from _define_model import Model
+from _model_fitting import _run_mcmc
+from _MAP_mpro import _map_running, _load_extra_fields
+from _params_extraction import extract_logK_n_idx, extract_kcat_n_idx
+from _trace_analysis import TraceExtraction
+from _posterior_predictive import posterior_predictive_bands
+from _timing import _timed, _save_timings
 
-import matplotlib.pyplot as plt
+plt = lazy_import('matplotlib.pyplot')
 
 
+@_timed('mcmc')
 def _run_mcmc_CRC(expts, prior_infor, shared_params, init_values, last_run_dir, out_dir, args):
     """
     Parameters:
@@ -46,135 +57,319 @@ def _run_mcmc_CRC(expts, prior_infor, shared_params, init_values, last_run_dir,
     traces_name = args.traces_name
 
     if not os.path.isfile(traces_name+'.pickle'):
-        if not init_values is None:
-            kernel = NUTS(model=global_fitting, init_strategy=init_to_value(values=init_values))
-        else:
-            kernel = NUTS(global_fitting)
+        kernel = _nuts_kernel(global_fitting, init_values, rng_key, args, experiments=expts, prior_infor=prior_infor,
+                              shared_params=shared_params)
 
         if os.path.isfile(os.path.join(last_run_dir, "Last_state.pickle")):
             last_state = pickle.load(open(os.path.join(last_run_dir, "Last_state.pickle"), "rb"))
             print("\nKeep running from last state.")
-            mcmc = MCMC(kernel, num_warmup=args.nburn, num_samples=args.niters, num_chains=args.nchain, progress_bar=True)
-            mcmc.post_warmup_state = last_state
-            mcmc.run(mcmc.post_warmup_state.rng_key, experiments=expts, 
-                     prior_infor=prior_infor, shared_params=shared_params, args=args)
         else:
-            mcmc = MCMC(kernel, num_warmup=args.nburn, num_samples=args.niters, num_chains=args.nchain, progress_bar=True)
-            mcmc.run(rng_key_, experiments=expts, prior_infor=prior_infor, shared_params=shared_params, args=args)
-        
-        mcmc.print_summary()
+            last_state = None
+
+        trace_group, extra_fields, last_state = _mcmc_sampling(kernel, rng_key_, last_state, args, out_dir=out_dir,
+                                                               experiments=expts, prior_infor=prior_infor, 
+                                                               shared_params=shared_params)
 
         print("Saving last state.")
-        mcmc.post_warmup_state = mcmc.last_state
-        pickle.dump(jax.device_get(mcmc.post_warmup_state), open("Last_state.pickle", "wb"))
+        pickle.dump(jax.device_get(last_state), open("Last_state.pickle", "wb"))
 
-        trace = mcmc.get_samples(group_by_chain=False)
+        trace = {key: np.reshape(trace_group[key], (-1, )+trace_group[key].shape[2:]) for key in trace_group.keys()}
         pickle.dump(trace, open(os.path.join(traces_name+'.pickle'), "wb"))
 
+        extra_fields = {key: np.reshape(extra_fields[key], (-1, )+extra_fields[key].shape[2:]) for key in extra_fields.keys()}
+        pickle.dump(extra_fields, open(os.path.join(traces_name+'_extra_fields.pickle'), "wb"))
+
         ## Trace and autocorrelation plots
         plotting_trace(trace=trace, out_dir=out_dir, nchain=args.nchain)
 
-        trace = mcmc.get_samples(group_by_chain=True)
-        az.summary(trace).to_csv(traces_name+"_summary.csv")
-
-        trace = mcmc.get_samples(group_by_chain=False)
+        az.summary(trace_group).to_csv(traces_name+"_summary.csv")
     else:
         trace = pickle.load(open(traces_name+'.pickle', "rb"))
 
     return trace
 
 
-def _CRC_check_noise(response, logItot, Z=2.5, plotting=False, scaling_plot=False, OUTFILE=''):
+def _run_approximate_CRC(expts, prior_infor, shared_params, init_values, out_dir, args, method='laplace',
+                         khat_threshold=0.7, num_steps=2000):
     """
     Parameters:
     ----------
-    response  : np.array, response of the CRC dataset
-    logItot   : np.array, log concentration of inhibitor
+    expts           : list of dict of multiple enzymes
+    prior_infor     : list of dict to assign prior distribution for kinetics parameters
+    shared_params   : dict, information for shared parameters
+    init_values     : dict, initial value for model fitting
+    out_dir         : str, directory of the output 
+    args            : dict, other model arguments
+    method          : 'laplace' or 'svi', see _approximate_inference.py
+    khat_threshold  : float, the approximation is accepted if the Pareto k-hat is lower than this value
+    num_steps       : int, number of steps of SVI
+    ----------
+    Fast approximation of the posterior instead of mcmc. args.niters*args.nchain samples are drawn from the 
+    approximation and saved as the mcmc trace, with the potential energy as extra fields. The diagnostics 
+    of the approximation are saved in approximation.json.
+
+    Return [trace, diagnostics]
+
+    This function is modified from _run_mcmc_CRC
+    """
+    rng_key, rng_key_ = random.split(random.PRNGKey(args.random_key))
+    os.chdir(out_dir)
+    traces_name = args.traces_name
+
+    if not os.path.isfile(traces_name+'.pickle') or not os.path.isfile('approximation.json'):
+        model_kwargs = {'experiments': expts, 'prior_infor': prior_infor, 'shared_params': shared_params, 'args': args}
+        [trace, extra_fields, diagnostics] = _approximate_posterior(global_fitting, model_kwargs, rng_key_, method=method,
+                                                                    nsamples=args.niters*args.nchain, init_values=init_values,
+                                                                    num_steps=num_steps, khat_threshold=khat_threshold)
+        pickle.dump(trace, open(os.path.join(traces_name+'.pickle'), "wb"))
+        pickle.dump(extra_fields, open(os.path.join(traces_name+'_extra_fields.pickle'), "wb"))
+        with open('approximation.json', 'w') as f:
+            json.dump(diagnostics, f, indent=2)
+
+        az.summary({key: trace[key][None, :] for key in trace.keys()}).to_csv(traces_name+"_summary.csv")
+    else:
+        trace = pickle.load(open(traces_name+'.pickle', "rb"))
+        diagnostics = json.load(open('approximation.json'))
+
+    return [trace, diagnostics]
+
+
+def _CRC_fitting_one_inhibitor(df_mers, args):
+    """
+    Parameters:
+    ----------
+    df_mers     : pandas dataframe of the data of the inhibitor, e.g. from _read_inhibitor_data
+    args        : class comprises the arguments of run_CRC_fitting.py
+    ----------
+    Fitting the CRC of args.name_inhibitor, finding the MAP and plotting the fitted curves in args.out_dir
+
+    Return [trace, trace_map, map_index], None if there is no data
+    """
+    inhibitor_name = np.array([args.name_inhibitor])
+    for i, name in enumerate(inhibitor_name):
+        expts_init, expts_plot = load_data_one_inhibitor(df_mers[(df_mers['Inhibitor_ID']==name)*(df_mers['Drop']!=1.0)],
+                                                         multi_var=args.multi_var)
+
+    if len(expts_plot)==0:
+        print("There is no data found.")
+        return None
+
+    ## Outlier detection and trend checking
+    [expts_outliers, outliers, _, _] = _expt_check_noise_trend(expts_init)
+    if args.outlier_removal:
+        print("Checking outlier(s) in the curve...")
+        expts = expts_outliers.copy()
+        outliers = _outliers_each_curve(expts_init, outliers, expts_plot)
+    else:
+        expts = expts_init.copy()
+        outliers = None
+
+    os.chdir(args.out_dir)
+
+    ## Create a model to run
+    model = Model(len(expts))
+    model.check_model(args)
+
+    ## Fitting model
+    trace = _run_mcmc(expts=expts, prior_infor=model.prior_infor, shared_params=model.shared_params,
+                      init_values=model.init_values, args=model.args)
+
+    ## Finding MAP
+    [trace_map, map_index] = _map_running(trace=trace.copy(), expts=expts, prior_infor=model.prior_infor,
+                                          shared_params=model.shared_params, args=model.args,
+                                          extra_fields=_load_extra_fields(args.out_dir, model.args.traces_name))
+
+    ## Fitting plot
+    params_logK, params_kcat = TraceExtraction(trace=trace_map).extract_params_from_map_and_prior(map_index, model.prior_infor)
+
+    if args.set_lognormal_dE and args.dE>0:
+        E_list = {key: trace[key][map_index] for key in trace.keys() if key.startswith('dE')}
+    else: E_list = None
+
+    alpha_list = {key: trace[key][map_index] for key in trace.keys() if key.startswith('alpha')}
+    if len(alpha_list) == 0:
+        alpha_list = None
+
+    n = 0
+    if args.posterior_band:
+        bands = posterior_predictive_bands(expts_plot, trace, model.prior_infor, model.shared_params, n,
+                                           nsamples=args.posterior_nsamples,
+                                           cache_file=os.path.join(args.out_dir, 'posterior_bands.pickle'))
+    else:
+        bands = None
+
+    plot_data_conc_log(expts_plot, extract_logK_n_idx(params_logK, n, model.shared_params),
+                       extract_kcat_n_idx(params_kcat, n, model.shared_params),
+                       alpha_list=alpha_list, E_list=E_list, outliers=outliers,
+                       OUTFILE=os.path.join(args.out_dir,'EI'), bands=bands)
+
+    _save_timings(args.out_dir)
+    return [trace, trace_map, map_index]
+
+
+def _CRC_group_mean(curve_idx, logconcs, values):
+    """
+    Parameters:
+    ----------
+    curve_idx : np.array, index of the curve of each data point
+    logconcs  : np.array, log concentration of each data point
+    values    : np.array, value to be averaged
+    ----------
+    Return [groups, means, inverse], the unique (curve, concentration) pairs sorted by curve and then by
+    concentration, the mean of each group, and the group of each data point
+    """
+    groups, inverse = np.unique(np.stack([curve_idx, logconcs], axis=1), axis=0, return_inverse=True)
+    inverse = np.ravel(inverse)
+    means = np.bincount(inverse, weights=values)/np.bincount(inverse)
+    return [groups, means, inverse]
+
+
+def _CRC_scaling(curve_idx, responses):
+    """
+    Scaling each curve to the %Activity by its minimum and maximum, similar to scaling_data
+    """
+    ncurves = np.max(curve_idx)+1
+    r_min = np.full(ncurves, np.inf)
+    r_max = np.full(ncurves, -np.inf)
+    np.minimum.at(r_min, curve_idx, responses)
+    np.maximum.at(r_max, curve_idx, responses)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (responses - r_min[curve_idx])/np.abs(r_max - r_min)[curve_idx]*100
+
+
+def _CRC_detect_noise(responses, logItots, Z=2.5):
+    """
+    Parameters:
+    ----------
+    responses : list of np.array, response of each CRC dataset
+    logItots  : list of np.array, log concentration of inhibitor of each CRC dataset
     Z         : integer, Z factor to detect outliers, default = 2.5
-    plotting  : optional, boolean for plotting the figure
-    OUTFILE   : optional, string, saving plot file
     ----------
+    A data point is an outlier if its scaled response is not within Z standard errors of the mean of 
+    all responses of the curve, from the mean at its concentration.
 
-    return [filtered_v, filtered_logItot, count_noisy_points] after outlier detection/removal
+    Return list of boolean masks of outliers, in the same order as the data of each CRC
     """
-    scaled_r = scaling_data(response, min(response), max(response))
+    lengths = [len(r) for r in responses]
+    curve_idx = np.repeat(np.arange(len(responses)), lengths)
+    logItot = np.concatenate(logItots).astype(np.float64)
+    scaled_r = _CRC_scaling(curve_idx, np.concatenate(responses).astype(np.float64))
 
-    var = np.var(scaled_r)/len(scaled_r) #variance of the mean
-    std = np.sqrt(var) #std of the mean
+    n = np.bincount(curve_idx)
+    mean_all = np.bincount(curve_idx, weights=scaled_r)/n
+    var = np.bincount(curve_idx, weights=(scaled_r-mean_all[curve_idx])**2)/n
+    std = np.sqrt(var/n)[curve_idx] #std of the mean
 
-    # Calculated mean of each concentration and save the mean array as mean_r
-    mean_r = []
-    mean_response = []
-    for logI in np.unique(logItot):
-        mean_r.append(np.mean(scaled_r[logItot==logI]))
-        mean_response.append(np.mean(response[logItot==logI]))
-    mean_r = np.array(mean_r)
-    mean_response = np.array(mean_response)
+    [_, mean_r, inverse] = _CRC_group_mean(curve_idx, logItot, scaled_r)
+    outliers = (scaled_r<=mean_r[inverse]-Z*std) + (scaled_r>=mean_r[inverse]+Z*std)
+    return np.split(outliers, np.cumsum(lengths)[:-1])
 
-    filter_logI = []
-    filter_r_scale = []
-    filter_r = []
-    outlier_pos = []
 
-    fig, ax = plt.subplots(figsize=(6.4, 4.8))
+def _CRC_detect_trend(responses, logconcs, scaling=True):
+    """
+    Parameters:
+    ----------
+    responses : list of np.array, response of each CRC dataset
+    logconcs  : list of np.array, log concentration of each CRC dataset
+    scaling   : boolean, if True, convert the response to the %Activity or %Inhibition
+    ----------
+    Return list of [flag_up, flag_down] of each curve, if the mean response of each concentration is
+    upward (flag_up) or downward (flag_down) with the concentration
+    """
+    lengths = [len(r) for r in responses]
+    curve_idx = np.repeat(np.arange(len(responses)), lengths)
+    Rs = np.concatenate(responses).astype(np.float64)
+    if scaling:
+        Rs = _CRC_scaling(curve_idx, Rs)
 
-    for idx, logI in enumerate(np.unique(logItot)):
-        r_each_logI = scaled_r[logItot==logI]
-        for _r in r_each_logI:
-            if _r>mean_r[idx]-Z*std and _r<mean_r[idx]+Z*std:
-                filter_logI.append(logItot[scaled_r==_r])
-                filter_r_scale.append(scaled_r[scaled_r==_r])
-                filter_r.append(response[scaled_r==_r])
-                outlier_pos.append(False)
-            else:
-                if plotting:
-                    if scaling_plot:
-                        ax.plot(np.log10(np.exp(logI)), _r, 'rx', label='Outlier', markersize=16)
-                    else:
-                        ax.plot(np.log10(np.exp(logI)), response[scaled_r==_r], 'rx', label='Outlier',  markersize=12)
-                    handles, labels = ax.get_legend_handles_labels()
-                outlier_pos.append(True)
+    [groups, mean_Rs, _] = _CRC_group_mean(curve_idx, np.concatenate(logconcs).astype(np.float64), Rs)
+    group_curve = groups[:, 0].astype(int)
+    size = np.bincount(group_curve, minlength=len(responses))
 
-        if plotting:
-            if scaling_plot:
-                ax.plot(np.log10(np.exp(logI)), mean_r[idx], "g^", label='Mean of each conc')
-            else:
-                ax.plot(np.log10(np.exp(logI)), mean_response[idx], "g^", label='Mean of each conc')
-            handles, labels = ax.get_legend_handles_labels()
+    # Gradient of the mean responses of each curve, similar to np.gradient(mean_Rs, mean_Rs.size)
+    start = np.concatenate([[0], np.cumsum(size)[:-1]])
+    pos = np.arange(len(mean_Rs)) - start[group_curve]
+    h = size[group_curve].astype(np.float64)
+    forward = np.append(np.diff(mean_Rs), 0.)
+    backward = np.insert(np.diff(mean_Rs), 0, 0.)
+    grad = np.where(pos==0, forward/h, np.where(pos==h-1, backward/h, (forward+backward)/(2*h)))
+    grad = np.where(h>1, grad, 0.)
 
-    if plotting:
-        if scaling_plot:
-            ax.plot(np.log10(np.exp(logItot)), scaled_r, 'b.', label='Observed data')
-            ax.set_ylabel("% Activity")
-        else:
-            ax.plot(np.log10(np.exp(logItot)), response, 'b.', label='Observed data')
-            ax.set_ylabel("Response")
-        handles, labels = ax.get_legend_handles_labels()
-        ax.set_xlabel("Log$_{10}$[I]")
+    check_up = np.bincount(group_curve, weights=np.around(grad, 1)>=0, minlength=len(responses))
+    check_down = np.bincount(group_curve, weights=np.around(grad, 1)<=0, minlength=len(responses))
+    return [[bool(check_up[i]==size[i] and check_down[i]==0), bool(check_up[i]==0 and check_down[i]==size[i])]
+            for i in range(len(responses))]
 
-        by_label = dict(zip(labels, handles))
-        ax.legend(by_label.values(), by_label.keys())
-        plt.tight_layout()
 
-    filter_logI = np.concatenate(filter_logI)
-    filter_r_scale = np.concatenate(filter_r_scale)
-    filter_r = np.concatenate(filter_r)
+def _CRC_plot_noise(response, logItot, outlier_pos, scaling_plot=False, OUTFILE=''):
+    """
+    Parameters:
+    ----------
+    response    : np.array, response of the CRC dataset
+    logItot     : np.array, log concentration of inhibitor
+    outlier_pos : np.array, boolean mask of outliers (_CRC_detect_noise)
+    OUTFILE     : optional, string, saving plot file
+    ----------
+    Plot the data, the mean of each concentration and the outliers of one CRC
+    """
+    if scaling_plot:
+        r = scaling_data(response, min(response), max(response))
+    else:
+        r = np.asarray(response)
+    logI, inverse = np.unique(logItot, return_inverse=True)
+    mean_r = np.bincount(np.ravel(inverse), weights=r)/np.bincount(np.ravel(inverse))
 
-    outlier_pos = np.flip(np.array(outlier_pos))
+    fig, ax = plt.subplots(figsize=(6.4, 4.8))
+    if np.sum(outlier_pos)>0:
+        ax.plot(np.log10(np.exp(logItot[outlier_pos])), r[outlier_pos], 'rx', label='Outlier', 
+                markersize=16 if scaling_plot else 12)
+    ax.plot(np.log10(np.exp(logI)), mean_r, "g^", label='Mean of each conc')
+    ax.plot(np.log10(np.exp(logItot)), r, 'b.', label='Observed data')
+    if scaling_plot:
+        ax.set_ylabel("% Activity")
+    else:
+        ax.set_ylabel("Response")
+    ax.set_xlabel("Log$_{10}$[I]")
+    ax.legend()
+    plt.tight_layout()
 
-    if np.sum(outlier_pos)>0 and len(OUTFILE)>0:
+    if len(OUTFILE)>0:
         plt.savefig(OUTFILE, bbox_inches='tight')
+    plt.close(fig)
+
 
-    return [filter_logI, filter_r, outlier_pos]
+def _CRC_check_noise(response, logItot, Z=2.5, plotting=False, scaling_plot=False, OUTFILE=''):
+    """
+    Parameters:
+    ----------
+    response  : np.array, response of the CRC dataset
+    logItot   : np.array, log concentration of inhibitor
+    Z         : integer, Z factor to detect outliers, default = 2.5
+    plotting  : optional, boolean for plotting the figure
+    OUTFILE   : optional, string, saving plot file
+    ----------
+
+    return [filtered_logItot, filtered_v, outlier_pos] after outlier detection/removal
+    """
+    response = np.asarray(response)
+    logItot = np.asarray(logItot)
+    outlier_pos = _CRC_detect_noise([response], [logItot], Z)[0]
 
+    if plotting and np.sum(outlier_pos)>0 and len(OUTFILE)>0:
+        _CRC_plot_noise(response, logItot, outlier_pos, scaling_plot, OUTFILE)
 
-def _expt_check_noise_trend(expts, OUT_DIR=''):
+    return [logItot[~outlier_pos], response[~outlier_pos], outlier_pos]
+
+
+def _expt_check_noise_trend(expts, OUT_DIR='', Z=2.5):
     """
     Parameters:
     ----------
     expts     : list of experiment
-    OUT_DIR   : optional, string, directory for saving plot file
+    OUT_DIR   : optional, string, directory for saving plot file of the curves with outlier(s)
+    Z         : integer, Z factor to detect outliers, default = 2.5
     ----------
+    The outliers and the trend of all curves of one experiment are detected together.
 
     Return a updated set of experiment similar to output of load_data_mers 
     after outlier detection and removal.
@@ -185,65 +380,66 @@ def _expt_check_noise_trend(expts, OUT_DIR=''):
     mes_trend = []
     for expt in expts:
         expt_update = {}
+        name_expt = expt.get('index', expt.get('figure', ''))
+        curves = []
         for key in expt.keys():
-            if not key in ['kinetics', 'AUC', 'ICE']:
+            if not key in ['CRC', 'kinetics', 'AUC', 'ICE']:
                 expt_update[key] = expt[key]
             else:
                 data = expt[key]
                 if data is not None:
                     if type(data) is dict:
-                        data_update = {}
                         for i in range(len(data)):
-                            [r, logMtot, logStot, logItot] = data[i]
-                            if len(OUT_DIR)>0:
-                                output = os.path.join(OUT_DIR, expt['index']+'_'+key+'_'+str(i))
-                            else:
-                                output = ''
-                            [filter_logItot, filter_r, outlier_pos] = _CRC_check_noise(r, logItot, plotting=True, OUTFILE=output)
-                            outliers.append(outlier_pos)
-
-                            if np.sum(outlier_pos)==0:
-                                data_update[i] = data[i]
-                            else:
-                                filter_logMtot = np.repeat(np.unique(logMtot), len(filter_logItot))
-                                filter_logStot = np.repeat(np.unique(logStot), len(filter_logItot))
-                                data_update[i] = [filter_r, filter_logMtot, filter_logStot, filter_logItot]
-                        
-                                percent_noise = np.sum(outlier_pos)/len(logItot)
-                                mes_noise.append(_CRC_report_noise(percent_noise, expt['index']+'_'+key+'_'+str(i)))
-
-                            mes = _CRC_report_trend(*_CRC_check_trend(filter_logItot, filter_r, scaling=True), "Curve "+expt['index']+'_'+key+'_'+str(i))
-                            if len(mes)>0:
-                                mes_trend.append(mes)
-
-                        expt_update[key] = data_update
-                        del data_update
-                    
+                            curves.append([key, i, data[i], name_expt+'_'+key+'_'+str(i)])
+                        expt_update[key] = {}
                     else:
-                        data_update = []
-                        [r, logMtot, logStot, logItot] = data
-                        if len(OUT_DIR)>0:
-                            output = os.path.join(OUT_DIR, expt['index']+'_'+key)
-                        else:
-                            output = ''
-                        [filter_logItot, filter_r, outlier_pos] = _CRC_check_noise(r, logItot, plotting=True, OUTFILE=output)
-                        outliers.append(outlier_pos)
-
-                        if np.sum(outlier_pos)==0:
-                            data_update = data
-                        else:
-                            filter_logMtot = np.repeat(np.unique(logMtot), len(filter_logItot))
-                            filter_logStot = np.repeat(np.unique(logStot), len(filter_logItot))
-                            data_update = [filter_r, filter_logMtot, logStot, filter_logItot]
-                        
-                            percent_noise = np.sum(outlier_pos)/len(logItot)
-                            mes_noise.append(_CRC_report_noise(percent_noise))
-
-                        mes = _CRC_report_trend(*_CRC_check_trend(filter_logItot, filter_r, scaling=True), "Curve")
-                        if len(mes)>0:
-                            mes_trend.append(mes)
-
-                        expt_update[key] = data_update
+                        curves.append([key, None, data, None])
+                        expt_update[key] = None
+
+        if len(curves)==0:
+            expts_update.append(expt_update)
+            continue
+
+        ## Outliers and trend of all curves of the experiment
+        responses = [np.asarray(data[0]) for (_, _, data, _) in curves]
+        logItots = [np.asarray(data[3]) for (_, _, data, _) in curves]
+        outlier_list = _CRC_detect_noise(responses, logItots, Z)
+        filter_r_list = [r[~outlier_pos] for r, outlier_pos in zip(responses, outlier_list)]
+        filter_logItot_list = [logI[~outlier_pos] for logI, outlier_pos in zip(logItots, outlier_list)]
+        trend_list = _CRC_detect_trend(filter_r_list, filter_logItot_list)
+
+        for n, [key, i, data, name] in enumerate(curves):
+            [r, logMtot, logStot, logItot] = data
+            outlier_pos = outlier_list[n]
+            filter_r = filter_r_list[n]
+            filter_logItot = filter_logItot_list[n]
+            outliers.append(outlier_pos)
+
+            if np.sum(outlier_pos)==0:
+                data_update = data
+            else:
+                if len(OUT_DIR)>0:
+                    output = os.path.join(OUT_DIR, name_expt+'_'+key+('' if i is None else '_'+str(i)))
+                    _CRC_plot_noise(responses[n], logItots[n], outlier_pos, OUTFILE=output)
+
+                filter_logMtot = np.repeat(np.unique(logMtot), len(filter_logItot))
+                filter_logStot = np.repeat(np.unique(logStot), len(filter_logItot))
+                data_update = [filter_r, filter_logMtot, filter_logStot, filter_logItot]
+
+                percent_noise = np.sum(outlier_pos)/len(logItot)
+                if i is None:
+                    mes_noise.append(_CRC_report_noise(percent_noise))
+                else:
+                    mes_noise.append(_CRC_report_noise(percent_noise, name))
+
+            mes = _CRC_report_trend(*trend_list[n], "Curve" if i is None else "Curve "+name)
+            if len(mes)>0:
+                mes_trend.append(mes)
+
+            if i is None:
+                expt_update[key] = data_update
+            else:
+                expt_update[key][i] = data_update
 
         expts_update.append(expt_update)
 
@@ -256,6 +452,37 @@ def _expt_check_noise_trend(expts, OUT_DIR=''):
     return [expts_update, outliers, mes_noise, mes_trend]
 
 
+def _outliers_each_curve(expts, outliers, expts_plot):
+    """
+    Parameters:
+    ----------
+    expts       : list of experiment of one inhibitor (load_data_one_inhibitor)
+    outliers    : list of boolean masks of outliers of the CRC of expts (_expt_check_noise_trend)
+    expts_plot  : list of curves of each plate and enzyme concentration (load_data_one_inhibitor),
+                  each curve contains the rows of its data points (_group_plate_enzyme)
+    ----------
+    The CRC of each plate concatenates the curves of this plate, or all rows without multi_var. 
+    The masks are split back into the curves by their rows.
+
+    Return list of boolean masks of outliers, one for each curve of expts_plot
+    """
+    outlier_rows = {}
+    n = 0
+    for expt in expts:
+        if expt.get('CRC', None) is None:
+            continue
+        if type(expt['CRC']) is dict:
+            for i in range(len(expt['CRC'])):
+                rows = [curve['rows'] for curve in expts_plot if curve['plate']==expt['plate'][i]]
+                if len(rows)>0:
+                    outlier_rows.update(zip(np.concatenate(rows), outliers[n]))
+                n += 1
+        else:
+            outlier_rows.update(enumerate(outliers[n]))
+            n += 1
+    return [np.array([outlier_rows[row] for row in curve['rows']], dtype=bool) for curve in expts_plot]
+
+
 def _CRC_check_trend(logconcs, response, scaling=False):
     """
     Parameters:
@@ -266,33 +493,7 @@ def _CRC_check_trend(logconcs, response, scaling=False):
     ----------
     Report if curve is upward (flag_up) or downward (flag_down)
     """
-    if scaling:
-        Rs = scaling_data(response, min(response), max(response))
-    else: 
-        Rs = response
-
-    # Calculating mean of response (mean_Rs) for each log10 of concentration (xs):
-    mean_Rs = []
-    for (key, group) in itertools.groupby(sorted(list(zip(logconcs, Rs))), lambda x : x[0]):
-        Rgs = np.array(list(group))
-        mean_Rgs = np.mean(Rgs[:,1])
-        mean_Rs.append(mean_Rgs)
-    mean_Rs = np.array(mean_Rs)
-
-    check_up = np.around(np.gradient(mean_Rs, mean_Rs.size), 1)>=0
-    check_down = np.around(np.gradient(mean_Rs, mean_Rs.size), 1)<=0
-
-    if sum(check_up)==len(mean_Rs) and sum(check_down)==0:
-        flag_up = True
-        flag_down = False
-    elif sum(check_up)==0 and sum(check_down)==len(mean_Rs):
-        flag_up = False
-        flag_down = True
-    else:
-        flag_up = False
-        flag_down = False
-    
-    return [flag_up, flag_down]
+    return _CRC_detect_trend([np.asarray(response)], [np.asarray(logconcs)], scaling)[0]
 
 
 def _CRC_report_trend(flag_up, flag_downn, CRC_index='Curve'):
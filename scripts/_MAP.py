@@ -152,7 +152,7 @@ def _log_likelihood_normal(response_actual, response_model, sigma):
     Return:
         Sum of log PDF of response_actual given normal distribution N(response_model, sigma^2)
     """
-    return jnp.nansum(dist.Normal(0, 1).log_prob((response_model - response_actual)/sigma))
+    return jnp.nansum(dist.Normal(response_model, sigma).log_prob(response_actual))
 
 
 def _map_adjust_trace(mcmc_trace, experiments, prior_infor, set_K_I_M_equal_K_S_M=False,
@@ -13,8 +13,10 @@ from _kinetics import DimerBindingModel, Enzyme_Substrate, ReactionRate, Monomer
 from _kinetics import adjust_DimerBindingModel, adjust_ReactionRate, adjust_MonomerConcentration, adjust_CatalyticEfficiency
 
 from _MAP import _extract_logK_kcat_trace, _uniform_pdf, _gaussian_pdf, _lognormal_pdf, _log_likelihood_normal, _map_adjust_trace, _log_prior_sigma
-from _model import _dE_find_prior, _alpha_find_prior
+from _model import _dE_find_prior, _alpha_find_prior, global_fitting
+from _MAP_refinement import _log_density_trace, _log_prob_from_potential_energy, _potential_energy_matches, _map_refining
 from _trace_analysis import TraceAdjustment
+from _timing import _timed
 
 
 def _map_finding(mcmc_trace, experiments, prior_infor, args, nsamples=None, 
@@ -60,7 +62,8 @@ def _map_finding(mcmc_trace, experiments, prior_infor, args, nsamples=None,
                                           show_progress=show_progress)
 
     log_likelihoods = _log_likelihoods(mcmc_trace=mcmc_trace_update, experiments=experiments, alpha_list=args.alpha_list, E_list=args.E_list,
-                                       nsamples=nsamples, adjust_fit=adjust_fit, show_progress=show_progress)
+                                       nsamples=nsamples, adjust_fit=adjust_fit, show_progress=show_progress,
+                                       chunk_size=getattr(args, 'chunk_size_MAP', None))
 
     log_probs = log_priors + log_likelihoods
     map_idx = np.nanargmax(log_probs)
@@ -74,7 +77,8 @@ def _map_finding(mcmc_trace, experiments, prior_infor, args, nsamples=None,
     return [map_idx, map_params, log_probs]
 
 
-def _map_running(trace, expts, prior_infor, shared_params, args, adjust_fit=True):
+@_timed('MAP')
+def _map_running(trace, expts, prior_infor, shared_params, args, adjust_fit=True, model=None, extra_fields=None):
     """
     Evaluate probability of a parameter set using posterior distribution
     Finding MAP (maximum a posterior) given prior distributions of parameters information
@@ -88,7 +92,17 @@ def _map_running(trace, expts, prior_infor, shared_params, args, adjust_fit=True
     shared_params   : dict, information for shared parameters
     adjust_fit      : boolean, use adjustable fitting
     args            : class comprises other model arguments. For more information, check _define_model.py
+    model           : numpyro model used for sampling, default is global_fitting
+    extra_fields    : dict, extra fields of the sampler that produced the trace, e.g. from _load_extra_fields
     ----------
+    If the potential energy of each sample is given in the extra fields and matches the log density of the model 
+    at a few samples of the trace, the log posterior of the samples is obtained from it directly. Otherwise, the samples are scored by the log density of the model if refinement 
+    is used, or by the log prior and log likelihood of each dataset.
+
+    If args.map_refine_topk > 0, the MAP is refined by BFGS starting from the args.map_refine_topk best samples. 
+    The refined values and their uncertainties are saved in map_refined.pickle, and the refined values are 
+    reported in map.txt and map.pickle. The posterior samples of the traces are not changed.
+
     Return          : adjusted trace and map index
     """
     traces_name = args.traces_name
@@ -102,25 +116,79 @@ def _map_running(trace, expts, prior_infor, shared_params, args, adjust_fit=True
             if key.startswith('log_sigma'):
                 trace_map[key] = jnp.repeat(log_sigmas[key], args.niters*args.nchain)
 
-    [map_index, map_params, log_probs] = _map_finding(mcmc_trace=trace_map, experiments=expts, prior_infor=prior_infor, 
-                                                      args=args, nsamples=args.nsamples_MAP, adjust_fit=adjust_fit)
+    if model is None:
+        model = global_fitting
+    model_kwargs = {'experiments': expts, 'prior_infor': prior_infor, 'shared_params': shared_params, 'args': args}
+
+    log_probs = None
+    if extra_fields is not None and 'potential_energy' in extra_fields.keys() and \
+        len(extra_fields['potential_energy']) == len(trace[list(trace.keys())[0]]):
+        log_probs = _log_prob_from_potential_energy(model, model_kwargs, trace, extra_fields['potential_energy'], 
+                                                    nsamples=args.nsamples_MAP)
+        if _potential_energy_matches(model, model_kwargs, trace, log_probs):
+            print("Calculing log probabilities from potential energy.")
+        else:
+            print("The potential energy does not match the trace, it is not used.")
+            log_probs = None
+
+    if log_probs is not None:
+        map_index = np.nanargmax(log_probs)
+        print("Map index: %d" % map_index)
+    elif getattr(args, 'map_refine_topk', 0) > 0:
+        print("Calculing log probabilities.")
+        if getattr(args, 'chunk_size_MAP', None) is not None:
+            log_probs = _log_density_trace(model, model_kwargs, trace, nsamples=args.nsamples_MAP, chunk_size=args.chunk_size_MAP)
+        else:
+            log_probs = _log_density_trace(model, model_kwargs, trace, nsamples=args.nsamples_MAP)
+        map_index = np.nanargmax(log_probs)
+        print("Map index: %d" % map_index)
+    else:
+        [map_index, map_params, log_probs] = _map_finding(mcmc_trace=trace_map, experiments=expts, prior_infor=prior_infor, 
+                                                          args=args, nsamples=args.nsamples_MAP, adjust_fit=adjust_fit)
+
+    map_std = None
+    map_refined = {}
+    if getattr(args, 'map_refine_topk', 0) > 0:
+        [map_refined, map_std, map_log_prob] = _map_refining(model, model_kwargs, trace, log_probs, topk=args.map_refine_topk)
+        pickle.dump({'params': map_refined, 'std': map_std, 'log_prob': map_log_prob}, open('map_refined.pickle', "wb"))
+
+    map_values = {}
+    for key in trace.keys():
+        if key in map_refined.keys():
+            map_values[key] = map_refined[key]
+        else:
+            map_values[key] = trace[key][map_index]
 
     with open("map.txt", "w") as f:
         print("MAP index:" + str(map_index), file=f)
         print("\nKinetics parameters:", file=f)
-        for key in trace.keys():
-            print(key, ': %.3f' %trace[key][map_index], file=f)
+        for key in map_values.keys():
+            if map_std is not None and key in map_std.keys():
+                print(key, ': %.3f +/- %.3f' %(map_values[key], map_std[key]), file=f)
+            else:
+                print(key, ': %.3f' %map_values[key], file=f)
 
     pickle.dump(log_probs, open('log_probs.pickle', "wb"))
-
-    map_values = {}
-    for key in trace.keys():
-        map_values[key] = trace[key][map_index]
     pickle.dump(map_values, open('map.pickle', "wb"))
 
     return [trace_map, map_index]
 
 
+def _load_extra_fields(out_dir, traces_name):
+    """
+    Parameters:
+    ----------
+    out_dir         : str, directory of the mcmc output
+    traces_name     : str, name of the traces, e.g. args.traces_name
+    ----------
+    Return the extra fields of the sampler saved with out_dir/traces_name.pickle, None if they are not saved
+    """
+    extra_fields_file = os.path.join(out_dir, traces_name+'_extra_fields.pickle')
+    if os.path.isfile(extra_fields_file):
+        return pickle.load(open(extra_fields_file, "rb"))
+    return None
+
+
 ## Log Prior --------------------------------------------------------------------------------------
 
 def _log_prior_sigma_each_expt(type_expt, expt, idx_expt, mcmc_trace, nsamples):
@@ -229,7 +297,7 @@ def _log_priors(mcmc_trace, experiments, prior_infor, nsamples=None,
             conc = int(key[3:])
             # If dE follow lognormal
             if set_lognormal_dE and dE>0:
-                log_priors = jnp.log(_lognormal_pdf(mcmc_trace[key][: nsamples], conc, dE*conc))
+                log_priors += jnp.log(_lognormal_pdf(mcmc_trace[key][: nsamples], conc, dE*conc))
             # If dE follow uniform
             elif dE>0 and dE<1:
                 log_priors += jnp.log(_uniform_pdf(mcmc_trace[key][: nsamples], (1-dE)*conc, (1+dE)*conc))
@@ -253,8 +321,61 @@ def _extract_conc_lognormal(logConc, expt_value):
     return logConc + jnp.log(ratio)
 
 
+def _extract_CRC_trace(mcmc_trace, data, index, plate, alpha_list=None, E_list=None, nsamples=None):
+    """
+    Parameters:
+    ----------
+    mcmc_trace      : list of dict, trace of Bayesian sampling
+    data            : list, dataset contains response, logMtot, lotStot, logItot
+    index           : str, index of the dataset, used for the name of alpha and sigma
+    plate           : information about plate of the dataset
+    alpha_list      : dict, provided normalization factor for multiple plates
+    E_list          : dict, provided enzyme concentration, used if the enzyme concentration is not in mcmc_trace
+    nsamples        : int, number of samples to find MAP
+    ----------
+    The parameters that are not sampled are given as constants with vmap in_axis None, 
+    instead of being repeated for all samples.
+
+    Return [trace_alpha, trace_sigma, trace_error_E, in_axes] for the CRC dataset
+    """
+    in_axes = []
+    if f'alpha:{index}' in mcmc_trace.keys(): #multiple alpha for each experiment
+        trace_alpha = mcmc_trace[f'alpha:{index}'][: nsamples]
+        in_axes.append(0)
+    elif f'alpha:{plate}' in mcmc_trace.keys(): #shared alpha among experiments with same plate
+        trace_alpha = mcmc_trace[f'alpha:{plate}'][: nsamples]
+        in_axes.append(0)
+    elif alpha_list is not None and f'alpha:{plate}' in alpha_list: #provided alpha list for multiple plates
+        trace_alpha = alpha_list[f'alpha:{plate}']
+        in_axes.append(None)
+    else:
+        trace_alpha = 1.
+        in_axes.append(None)
+
+    if f'log_sigma_CRC:{index}' in mcmc_trace.keys():
+        trace_sigma = jnp.exp(mcmc_trace[f'log_sigma_CRC:{index}'][: nsamples])
+        in_axes.append(0)
+    else:
+        trace_sigma = 1.
+        in_axes.append(None)
+
+    trace_error_E = _dE_find_prior(data, mcmc_trace)
+    if np.size(trace_error_E)>0: #sampled enzyme concentration, as in global_fitting
+        trace_error_E = trace_error_E[:, : nsamples].T
+        in_axis_E = 0
+    elif E_list is not None and len(E_list)>0: #provided enzyme concentration
+        trace_error_E = _dE_find_prior(data, E_list)
+        in_axis_E = None
+    if np.size(trace_error_E) == 0:
+        trace_error_E = None
+        in_axis_E = None
+    in_axes.append(in_axis_E)
+
+    return [trace_alpha, trace_sigma, trace_error_E, in_axes]
+
+
 def _log_likelihoods(mcmc_trace, experiments, alpha_list=None, E_list=None, nsamples=None, 
-                     adjust_fit=False, show_progress=True):
+                     adjust_fit=False, show_progress=True, chunk_size=None):
     """
     Sum of log likelihood of all parameters given their distribution information in params_dist
 
@@ -264,6 +385,7 @@ def _log_likelihoods(mcmc_trace, experiments, alpha_list=None, E_list=None, nsam
     experiments     : list of dict
         Each dataset contains response, logMtot, lotStot, logItot
     adjust_fit      : boolean, use adjustable fitting
+    chunk_size      : int, number of samples evaluated at once for each dataset. If None, all samples are evaluated at once.
     ----------
     Return:
         Sum of log likelihood given experiments, mcmc_trace, enzyme/ligand concentration uncertainty
@@ -280,8 +402,7 @@ def _log_likelihoods(mcmc_trace, experiments, alpha_list=None, E_list=None, nsam
         nsamples = len(mcmc_trace[params_name_logK[0]])
     assert nsamples <= len(mcmc_trace[params_name_logK[0]]), "nsamples too big"
 
-    log_likelihoods = jnp.zeros(nsamples)
-
+    tasks = []
     for idx, expt in enumerate(experiments):
         # in_axis_nth = []
         try: idx_expt = expt['index']
@@ -290,7 +411,6 @@ def _log_likelihoods(mcmc_trace, experiments, alpha_list=None, E_list=None, nsam
         trace_nth, in_axis_nth = _extract_logK_kcat_trace(mcmc_trace, idx, nsamples)
 
         if 'CRC' in expt.keys():
-            func = _log_likelihood_each_dataset
             if type(expt['CRC']) is dict:
                 for n in range(len(expt['CRC'])):
                     data_rate = expt['CRC'][n]
@@ -299,40 +419,15 @@ def _log_likelihoods(mcmc_trace, experiments, alpha_list=None, E_list=None, nsam
                         if show_progress:
                             print("CRC experiment", idx_expt, ":", n)
 
-                        if f'alpha:{idx_expt}:{n}' in mcmc_trace.keys(): #multiple alpha for each experiment
-                            trace_alpha = mcmc_trace[f'alpha:{idx_expt}:{n}'][: nsamples]
-                        elif f'alpha:{plate}' in mcmc_trace.keys(): #shared alpha among experiments with same plate
-                            trace_alpha = mcmc_trace[f'alpha:{plate}'][: nsamples]
-                        elif alpha_list is not None and f'alpha:{plate}' in alpha_list: #provided alpha list for multiple plates
-                            trace_alpha = jnp.ones(nsamples)*alpha_list[f'alpha:{plate}']
-                        else:
-                            trace_alpha = jnp.ones(nsamples)
-                        if n == 0: in_axis_nth.append(0) #index of vmap for alpha
-
-                        if f'log_sigma_CRC:{idx_expt}:{n}' in mcmc_trace.keys():
-                            trace_sigma = jnp.exp(mcmc_trace[f'log_sigma_CRC:{idx_expt}:{n}'][: nsamples])
-                        else:
-                            trace_sigma = jnp.ones(nsamples)
-                        if n == 0: in_axis_nth.append(0) #index of vmap for sigma
-
-                        if E_list is not None:
-                            _trace_error_E = _dE_find_prior(data_rate, E_list)
-                            _trace_error_E = np.reshape(np.repeat(_trace_error_E, len(mcmc_trace[params_name_logK[0]])), (len(_trace_error_E), len(mcmc_trace[params_name_logK[0]])))
-                        else:
-                            _trace_error_E = _dE_find_prior(data_rate, mcmc_trace)
-                        if np.size(_trace_error_E)>0:
-                            trace_error_E = _trace_error_E[:, : nsamples].T
-                            if n==0: in_axis_nth.append(0)
-                        else:
-                            trace_error_E = None
-                            if n==0: in_axis_nth.append(None)
-
-                        log_likelihoods += func(type_expt='CRC', data=data_rate,
-                                                trace_logK=trace_nth, trace_kcat=trace_nth,
-                                                trace_alpha=trace_alpha, trace_sigma=trace_sigma,
-                                                trace_error_E=trace_error_E,
-                                                in_axes_nth=in_axis_nth, nsamples=nsamples,
-                                                adjust_fit=adjust_fit)
+                        [trace_alpha, trace_sigma, trace_error_E, in_axes_CRC] = _extract_CRC_trace(mcmc_trace, data_rate, f'{idx_expt}:{n}', plate,
+                                                                                                    alpha_list, E_list, nsamples)
+
+                        tasks.append(dict(type_expt='CRC', data=data_rate,
+                                          trace_logK=trace_nth, trace_kcat=trace_nth,
+                                          trace_alpha=trace_alpha, trace_sigma=trace_sigma,
+                                          trace_error_E=trace_error_E,
+                                          in_axes_nth=[*in_axis_nth, *in_axes_CRC], nsamples=nsamples,
+                                          adjust_fit=adjust_fit, chunk_size=chunk_size))
 
             else:
                 data_rate = expt['CRC']
@@ -341,54 +436,48 @@ def _log_likelihoods(mcmc_trace, experiments, alpha_list=None, E_list=None, nsam
                     if show_progress:
                         print("CRC experiment", idx_expt)
 
-                    if f'alpha:{idx_expt}' in mcmc_trace.keys(): #multiple alpha for each experiment
-                        trace_alpha = mcmc_trace[f'alpha:{idx_expt}'][: nsamples]
-                    elif f'alpha:{plate}' in mcmc_trace.keys(): #shared alpha among experiments with same plate
-                        trace_alpha = mcmc_trace[f'alpha:{plate}'][: nsamples]
-                    elif alpha_list is not None and f'alpha:{plate}' in alpha_list: #provided alpha list for multiple plates
-                        trace_alpha = jnp.one(nsamples)*alpha_list[f'alpha:{plate}']
-                    else:
-                        trace_alpha = jnp.ones(nsamples)
-                    in_axis_nth.append(0)
-
-                    if f'log_sigma_CRC:{idx_expt}' in mcmc_trace.keys():
-                        trace_sigma = jnp.exp(mcmc_trace[f'log_sigma_CRC:{idx_expt}'][: nsamples])
-                    else:
-                        trace_sigma = jnp.ones(nsamples)
-                    in_axis_nth.append(0)
-
-                    if E_list is not None:
-                        _trace_error_E = _dE_find_prior(data_rate, E_list)
-                        _trace_error_E = np.reshape(np.repeat(_trace_error_E, len(mcmc_trace[params_name_logK[0]])), (len(_trace_error_E), len(mcmc_trace[params_name_logK[0]])))
-                    else:
-                        _trace_error_E = _dE_find_prior(data_rate, mcmc_trace)
-                    if np.size(_trace_error_E)>0:
-                        trace_error_E = _trace_error_E[:, : nsamples].T
-                        in_axis_nth.append(0)
-                    else:
-                        trace_error_E = None
-                        in_axis_nth.append(None)
-
-                    log_likelihoods += func(type_expt='CRC', data=data_rate,
-                                            trace_logK=trace_nth, trace_kcat=trace_nth,
-                                            trace_alpha=trace_alpha, trace_sigma=trace_sigma,
-                                            trace_error_E=trace_error_E,
-                                            in_axes_nth=in_axis_nth, nsamples=nsamples,
-                                            adjust_fit=adjust_fit)
+                    [trace_alpha, trace_sigma, trace_error_E, in_axes_CRC] = _extract_CRC_trace(mcmc_trace, data_rate, f'{idx_expt}', plate,
+                                                                                                alpha_list, E_list, nsamples)
+
+                    tasks.append(dict(type_expt='CRC', data=data_rate,
+                                      trace_logK=trace_nth, trace_kcat=trace_nth,
+                                      trace_alpha=trace_alpha, trace_sigma=trace_sigma,
+                                      trace_error_E=trace_error_E,
+                                      in_axes_nth=[*in_axis_nth, *in_axes_CRC], nsamples=nsamples,
+                                      adjust_fit=adjust_fit, chunk_size=chunk_size))
 
         for _type_expt in ['kinetics', 'AUC', 'ICE']:
-            func = _log_likelihood_each_expt
             if _type_expt in expt.keys():
-                log_likelihoods += _log_likelihood_each_expt(type_expt=_type_expt, expt=expt, 
-                                                             idx_expt=idx_expt, mcmc_trace=mcmc_trace, 
-                                                             idx=idx, nsamples=nsamples,
-                                                             adjust_fit=adjust_fit)
-
+                tasks += _tasks_each_expt(type_expt=_type_expt, expt=expt, 
+                                          idx_expt=idx_expt, mcmc_trace=mcmc_trace, 
+                                          idx=idx, nsamples=nsamples,
+                                          adjust_fit=adjust_fit, chunk_size=chunk_size)
+
+    log_likelihoods = _evaluate_tasks(tasks)
+    if log_likelihoods is None:
+        log_likelihoods = jnp.zeros(nsamples)
     return np.array(log_likelihoods)
 
 
+def _evaluate_tasks(tasks):
+    """
+    Parameters:
+    ----------
+    tasks       : list of dict, arguments of _log_likelihood_each_dataset for each dataset
+    ----------
+    Return sum of log likelihood of all datasets, None if there is no dataset
+    """
+    if len(tasks) == 0:
+        return None
+
+    log_likelihoods = _log_likelihood_each_dataset(**tasks[0])
+    for task in tasks[1:]:
+        log_likelihoods = log_likelihoods + _log_likelihood_each_dataset(**task)
+    return log_likelihoods
+
+
 def _log_likelihood_each_expt(type_expt, expt, idx_expt, mcmc_trace, idx, nsamples=None,
-                              adjust_fit=False):
+                              adjust_fit=False, chunk_size=None):
     """
     Parameters:
     ----------
@@ -400,12 +489,30 @@ def _log_likelihood_each_expt(type_expt, expt, idx_expt, mcmc_trace, idx, nsampl
     idx             : int, ordered index of experiment
     nsamples        : int, number of samples to find MAP
     adjust_fit      : boolean, use adjustable fitting
+    chunk_size      : int, number of samples evaluated at once
     ----------
     Return log likelihood given type of experiment, experiment, mcmc_trace, and nsamples
     
+    """
+    tasks = _tasks_each_expt(type_expt, expt, idx_expt, mcmc_trace, idx, nsamples=nsamples,
+                             adjust_fit=adjust_fit, chunk_size=chunk_size)
+    log_likelihoods = _evaluate_tasks(tasks)
+    if log_likelihoods is None:
+        log_likelihoods = 0.
+    return log_likelihoods
+
+
+def _tasks_each_expt(type_expt, expt, idx_expt, mcmc_trace, idx, nsamples=None,
+                     adjust_fit=False, chunk_size=None):
+    """
+    Parameters:
+    ----------
+    Similar to _log_likelihood_each_expt
+    ----------
+    Return list of arguments of _log_likelihood_each_dataset for all datasets of the experiment
     """
     assert type_expt in ['kinetics', 'AUC', 'ICE'], "Experiments type should be kinetics, AUC, ICE."
-    log_likelihoods = 0.
+    tasks = []
     
     trace_nth, in_axis_nth = _extract_logK_kcat_trace(mcmc_trace, idx, nsamples)
     in_axis_nth.append(0) #adding one more in_axis for sigma
@@ -418,8 +525,6 @@ def _log_likelihood_each_expt(type_expt, expt, idx_expt, mcmc_trace, idx, nsampl
     elif type_expt == 'ICE':
         prefix = 'ICE'
 
-    func = _log_likelihood_each_dataset
-
     if type(expt[type_expt]) is dict:
         for n in range(len(expt[type_expt])):
             data = expt[type_expt][n]
@@ -429,11 +534,11 @@ def _log_likelihood_each_expt(type_expt, expt, idx_expt, mcmc_trace, idx, nsampl
                     trace_sigma = jnp.exp(mcmc_trace[f'log_sigma_{prefix}:{idx_expt}:{n}'][:nsamples])
                 else:
                     trace_sigma = jnp.ones(nsamples)
-                log_likelihoods += func(type_expt=type_expt, data=data,
-                                        trace_logK=trace_nth, trace_kcat=trace_nth,
-                                        trace_alpha=None, trace_sigma=trace_sigma, 
-                                        trace_error_E=None, in_axes_nth=in_axis_nth, 
-                                        nsamples=nsamples, adjust_fit=adjust_fit)
+                tasks.append(dict(type_expt=type_expt, data=data,
+                                  trace_logK=trace_nth, trace_kcat=trace_nth,
+                                  trace_alpha=None, trace_sigma=trace_sigma, 
+                                  trace_error_E=None, in_axes_nth=in_axis_nth, 
+                                  nsamples=nsamples, adjust_fit=adjust_fit, chunk_size=chunk_size))
     else:
         data = expt[type_expt]
         if data is not None:
@@ -442,18 +547,43 @@ def _log_likelihood_each_expt(type_expt, expt, idx_expt, mcmc_trace, idx, nsampl
                 trace_sigma = jnp.exp(mcmc_trace[f'log_sigma_{prefix}:{idx_expt}'][:nsamples])
             else:
                 trace_sigma = jnp.ones(nsamples)
-            log_likelihoods += func(type_expt=type_expt, data=data,
-                                    trace_logK=trace_nth, trace_kcat=trace_nth,
-                                    trace_alpha=None, trace_sigma=trace_sigma, 
-                                    trace_error_E=None, in_axes_nth=in_axis_nth, 
-                                    nsamples=nsamples, adjust_fit=adjust_fit)
+            tasks.append(dict(type_expt=type_expt, data=data,
+                              trace_logK=trace_nth, trace_kcat=trace_nth,
+                              trace_alpha=None, trace_sigma=trace_sigma, 
+                              trace_error_E=None, in_axes_nth=in_axis_nth, 
+                              nsamples=nsamples, adjust_fit=adjust_fit, chunk_size=chunk_size))
 
-    return log_likelihoods
+    return tasks
+
+
+def _vmap_by_chunk(f, inputs, in_axes, nsamples, chunk_size=None):
+    """
+    Parameters:
+    ----------
+    f           : vmapped function
+    inputs      : list of inputs of f
+    in_axes     : list of vmap axis of each input, 0 for traces and None for constants
+    nsamples    : int, number of samples
+    chunk_size  : int, number of samples evaluated at once. If None, all samples are evaluated at once.
+    ----------
+    Evaluating f by chunks of samples, so that the memory is bounded by chunk_size x number of data points.
+
+    Return array of outputs of f for all samples
+    """
+    if chunk_size is None or chunk_size >= nsamples:
+        return f(*inputs)
+
+    outputs = []
+    for start in range(0, nsamples, chunk_size):
+        end = min(start+chunk_size, nsamples)
+        chunk = [x[start:end] if axis == 0 else x for x, axis in zip(inputs, in_axes)]
+        outputs.append(f(*chunk))
+    return jnp.concatenate(outputs)
 
 
 def _log_likelihood_each_dataset(type_expt, data, trace_logK, trace_kcat, trace_alpha,
                                  trace_sigma, trace_error_E, in_axes_nth, nsamples=None,
-                                 adjust_fit=False):
+                                 adjust_fit=False, chunk_size=None):
     """
     Parameters:
     ----------
@@ -466,11 +596,11 @@ def _log_likelihood_each_dataset(type_expt, data, trace_logK, trace_kcat, trace_
     in_axes_nth   : index to fun jax.vmap
     nsamples        : int, number of samples to find MAP
     adjust_fit    : boolean, use adjustable fitting
+    chunk_size    : int, number of samples evaluated at once. If None, all samples are evaluated at once.
     ----------
     Return log likelihood given the experiment, mcmc_trace, enzyme/ligand concentration uncertainty
     """
     assert type_expt in ['CRC', 'kinetics', 'AUC', 'ICE'], "Experiments type should be kinetics, AUC, ICE, or CRC."
-    log_likelihoods = jnp.zeros(nsamples, dtype=jnp.float64)
 
     if type_expt == 'kinetics':
         [rate, kinetics_logMtot, kinetics_logStot, kinetics_logItot] = data
@@ -485,11 +615,11 @@ def _log_likelihood_each_dataset(type_expt, data, trace_logK, trace_kcat, trace_
                                                                                                                                                                                  kcat_MS, kcat_DS, kcat_DSI, kcat_DSS),
                                                                                                                                                                             sigma),
                  in_axes=list(in_axes_nth))
-        log_likelihoods += f(trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
-                             trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
-                             trace_logK['logK_I_DI'], trace_logK['logK_S_DI'], trace_kcat['kcat_MS'],
-                             trace_kcat['kcat_DS'], trace_kcat['kcat_DSI'], trace_kcat['kcat_DSS'],
-                             trace_sigma)
+        inputs = [trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
+                  trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
+                  trace_logK['logK_I_DI'], trace_logK['logK_S_DI'], trace_kcat['kcat_MS'],
+                  trace_kcat['kcat_DS'], trace_kcat['kcat_DSI'], trace_kcat['kcat_DSS'],
+                  trace_sigma]
     if type_expt == 'AUC':
         [auc, AUC_logMtot, AUC_logStot, AUC_logItot] = data
         if adjust_fit:
@@ -502,10 +632,10 @@ def _log_likelihood_each_dataset(type_expt, data, trace_logK, trace_kcat, trace_
                                                                                                                                            logK_I_M, logK_I_D, logK_I_DI, logK_S_DI),
                                                                                                                                       sigma),
                  in_axes=list(in_axes_nth))
-        log_likelihoods += f(trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
-                             trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
-                             trace_logK['logK_I_DI'], trace_logK['logK_S_DI'],
-                             trace_sigma)
+        inputs = [trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
+                  trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
+                  trace_logK['logK_I_DI'], trace_logK['logK_S_DI'],
+                  trace_sigma]
 
     if type_expt == 'ICE':
         [ice, ice_logMtot, ice_logStot, ice_logItot] = data
@@ -521,11 +651,11 @@ def _log_likelihood_each_dataset(type_expt, data, trace_logK, trace_kcat, trace_
                                                                                                                                                                                     ice_logItot),
                                                                                                                                                                             sigma),
                  in_axes=list(in_axes_nth))
-        log_likelihoods += f(trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
-                             trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
-                             trace_logK['logK_I_DI'], trace_logK['logK_S_DI'], trace_kcat['kcat_MS'],
-                             trace_kcat['kcat_DS'], trace_kcat['kcat_DSI'], trace_kcat['kcat_DSS'],
-                             trace_sigma)
+        inputs = [trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
+                  trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
+                  trace_logK['logK_I_DI'], trace_logK['logK_S_DI'], trace_kcat['kcat_MS'],
+                  trace_kcat['kcat_DS'], trace_kcat['kcat_DSI'], trace_kcat['kcat_DSS'],
+                  trace_sigma]
 
     if type_expt == 'CRC':
         [rate, kinetics_logMtot, kinetics_logStot, kinetics_logItot] = data
@@ -540,13 +670,13 @@ def _log_likelihood_each_dataset(type_expt, data, trace_logK, trace_kcat, trace_
                                                                                                                                                                                                 kcat_MS, kcat_DS, kcat_DSI, kcat_DSS, error_E)*alpha,
                                                                                                                                                                                             sigma),
                  in_axes=list(in_axes_nth))
-        log_likelihoods += f(trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
-                             trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
-                             trace_logK['logK_I_DI'], trace_logK['logK_S_DI'],
-                             trace_kcat['kcat_MS'], trace_kcat['kcat_DS'], trace_kcat['kcat_DSI'], trace_kcat['kcat_DSS'],
-                             trace_alpha, trace_sigma, trace_error_E)
+        inputs = [trace_logK['logKd'], trace_logK['logK_S_M'], trace_logK['logK_S_D'],
+                  trace_logK['logK_S_DS'], trace_logK['logK_I_M'], trace_logK['logK_I_D'],
+                  trace_logK['logK_I_DI'], trace_logK['logK_S_DI'],
+                  trace_kcat['kcat_MS'], trace_kcat['kcat_DS'], trace_kcat['kcat_DSI'], trace_kcat['kcat_DSS'],
+                  trace_alpha, trace_sigma, trace_error_E]
 
-    return log_likelihoods
+    return _vmap_by_chunk(f, inputs, in_axes_nth, nsamples, chunk_size)
 
 
 def _ReactionRate_uncertainty_conc(logMtot, logStot, logItot,
@@ -0,0 +1,180 @@
+"""
+Finding MAP by gradient-based optimization of the numpyro model, starting from the best mcmc samples.
+The optimization is performed in the unconstrained space of the parameters, while the objective is
+the log posterior (log prior + log likelihood) of the constrained parameters.
+"""
+import numpy as np
+
+import jax
+import jax.numpy as jnp
+from jax import vmap
+from jax.flatten_util import ravel_pytree
+from jax.scipy.optimize import minimize
+
+from numpyro import handlers
+from numpyro.distributions import biject_to
+from numpyro.infer.util import log_density
+
+
+def _site_transforms(model, model_kwargs):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    model_kwargs    : dict, arguments of the model
+    ----------
+    Return dict of transforms from the unconstrained space to the support of each latent parameter
+    """
+    model_trace = handlers.trace(handlers.seed(model, jax.random.PRNGKey(0))).get_trace(**model_kwargs)
+    transforms = {}
+    for name, site in model_trace.items():
+        if site['type'] == 'sample' and not site['is_observed']:
+            transforms[name] = biject_to(site['fn'].support)
+    return transforms
+
+
+def _log_density_trace(model, model_kwargs, mcmc_trace, nsamples=None, chunk_size=1000):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    model_kwargs    : dict, arguments of the model
+    mcmc_trace      : dict, trace of Bayesian sampling (group_by_chain=False)
+    nsamples        : int, number of samples to be evaluated
+    chunk_size      : int, number of samples evaluated at once
+    ----------
+    Return array of log posterior (log prior + log likelihood) of each sample
+    """
+    transforms = _site_transforms(model, model_kwargs)
+    if nsamples is None:
+        nsamples = len(mcmc_trace[list(transforms.keys())[0]])
+
+    f_log_density = jax.jit(vmap(lambda params: log_density(model, (), model_kwargs, params)[0]))
+    log_probs = []
+    for start in range(0, nsamples, chunk_size):
+        end = min(start+chunk_size, nsamples)
+        params = {name: jnp.asarray(mcmc_trace[name][start:end]) for name in transforms.keys()}
+        log_probs.append(np.asarray(f_log_density(params)))
+    return np.concatenate(log_probs)
+
+
+def _map_refining(model, model_kwargs, mcmc_trace, log_probs, topk=5, maxiter=200, show_progress=True):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    model_kwargs    : dict, arguments of the model
+    mcmc_trace      : dict, trace of Bayesian sampling (group_by_chain=False)
+    log_probs       : array, log posterior of the samples, used to select the starting points
+    topk            : int, number of best samples used as starting points of the optimization
+    maxiter         : int, maximum number of iterations of BFGS
+    ----------
+    The starting points are optimized together by BFGS. The uncertainty of the optimum is estimated from
+    the inverse Hessian in the unconstrained space and then transformed to the constrained parameters.
+
+    Return [map_params, map_std, map_log_prob]
+    """
+    transforms = _site_transforms(model, model_kwargs)
+    names = list(transforms.keys())
+
+    log_probs = np.asarray(log_probs)
+    topk = min(topk, np.sum(np.isfinite(log_probs)))
+    assert topk > 0, "No finite log probability to start the optimization."
+    seed_idx = np.argsort(np.where(np.isfinite(log_probs), log_probs, -np.inf))[::-1][:topk]
+
+    def _unconstrain(params):
+        return {name: transforms[name].inv(params[name]) for name in names}
+
+    def _constrain(params):
+        return {name: transforms[name](params[name]) for name in names}
+
+    _, unravel = ravel_pytree(_unconstrain({name: jnp.asarray(mcmc_trace[name][seed_idx[0]]) for name in names}))
+
+    def neg_log_prob(x):
+        return -log_density(model, (), model_kwargs, _constrain(unravel(x)))[0]
+
+    x0 = jnp.stack([ravel_pytree(_unconstrain({name: jnp.asarray(mcmc_trace[name][i]) for name in names}))[0] for i in seed_idx])
+
+    if show_progress:
+        print("Refining MAP from %d sample(s)." %topk)
+    results = jax.jit(vmap(lambda x: minimize(neg_log_prob, x, method='BFGS', options={'maxiter': maxiter})))(x0)
+
+    fun = np.asarray(results.fun)
+    best = np.nanargmin(np.where(np.isfinite(fun), fun, np.nan))
+    x_best = results.x[best]
+    if show_progress:
+        print("Log probability: %.3f (best sample) -> %.3f (refined), %d iterations."
+              %(log_probs[seed_idx[0]], -fun[best], results.nit[best]))
+
+    ## Delta method: covariance in the unconstrained space transformed by the Jacobian of the bijection
+    hessian = jax.hessian(neg_log_prob)(x_best)
+    jacobian = jax.jacfwd(lambda x: ravel_pytree(_constrain(unravel(x)))[0])(x_best)
+    eigvals = np.linalg.eigvalsh(np.asarray(hessian))
+    if np.all(eigvals > 0):
+        cov = jacobian @ jnp.linalg.inv(hessian) @ jacobian.T
+        std_flat = jnp.sqrt(jnp.diag(cov))
+    else:
+        if show_progress:
+            print("The Hessian at the optimum is not positive definite, uncertainty is not estimated.")
+        std_flat = jnp.full(x_best.shape, jnp.nan)
+
+    map_params = _constrain(unravel(x_best))
+    map_std = ravel_pytree(map_params)[1](std_flat)
+    map_params = {name: np.asarray(map_params[name]) for name in names}
+    map_std = {name: np.asarray(map_std[name]) for name in names}
+
+    return [map_params, map_std, -fun[best]]
+
+
+def _log_prob_from_potential_energy(model, model_kwargs, mcmc_trace, potential_energy, nsamples=None):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    model_kwargs    : dict, arguments of the model
+    mcmc_trace      : dict, trace of Bayesian sampling (group_by_chain=False)
+    potential_energy: array, potential energy of each sample collected by the sampler
+    nsamples        : int, number of samples to be evaluated
+    ----------
+    The potential energy is the negative log posterior in the unconstrained space. The log posterior of 
+    the constrained parameters is obtained by removing the log absolute determinant of the Jacobian 
+    of the transforms, without evaluating the model for each sample.
+
+    Return array of log posterior (log prior + log likelihood) of each sample
+    """
+    transforms = _site_transforms(model, model_kwargs)
+    if nsamples is None:
+        nsamples = len(potential_energy)
+
+    log_probs = -np.asarray(potential_energy[:nsamples], dtype=np.float64)
+    for name in transforms.keys():
+        x = jnp.asarray(mcmc_trace[name][:nsamples])
+        log_det = transforms[name].log_abs_det_jacobian(transforms[name].inv(x), x)
+        log_probs = log_probs - np.reshape(np.asarray(log_det), (nsamples, -1)).sum(axis=1)
+    return log_probs
+
+
+def _potential_energy_matches(model, model_kwargs, mcmc_trace, log_probs, ndraws=3, rtol=1e-5):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    model_kwargs    : dict, arguments of the model
+    mcmc_trace      : dict, trace of Bayesian sampling (group_by_chain=False)
+    log_probs       : array, log posterior of the samples obtained from the potential energy
+    ndraws          : int, number of samples to be checked
+    rtol            : float, relative tolerance
+    ----------
+    The log posterior obtained from the potential energy is compared to the log density of the model 
+    at ndraws samples spread over the trace, to check that the extra fields belong to this trace.
+
+    Return True if they are equal
+    """
+    log_probs = np.asarray(log_probs)
+    draws = np.unique(np.linspace(0, len(log_probs)-1, ndraws).astype(int))
+    transforms = _site_transforms(model, model_kwargs)
+    if not all(name in mcmc_trace.keys() for name in transforms.keys()):
+        return False
+    trace_draws = {name: np.asarray(mcmc_trace[name])[draws] for name in transforms.keys()}
+    log_density = _log_density_trace(model, model_kwargs, trace_draws)
+    return bool(np.allclose(log_density, log_probs[draws], rtol=rtol, atol=rtol))
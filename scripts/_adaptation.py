@@ -0,0 +1,173 @@
+"""
+Transfer of the NUTS adaptation state (step size and inverse mass matrix in the unconstrained space)
+from a reference fit to new fits of the same model, e.g. from the global fit to the CRC fits of each
+inhibitor, so that the new fits only need a short warm-up.
+
+The profile is a json file with the step size, the blocks of the inverse mass matrix (diagonal or dense)
+with their site names, and the sampling efficiency of the reference fit. The sites of the new model
+which are not in the profile but belong to the same family (the name before ':', e.g. alpha:plate or
+log_sigma_CRC:...) are given the median variance of this family, and the mass matrix is then adapted.
+"""
+import json
+import numpy as np
+
+import jax
+from numpyro.infer.util import initialize_model
+from numpyro.diagnostics import effective_sample_size
+
+
+def _site_family(site):
+    """
+    Return the name of the site without the plate/curve index, e.g. alpha:19701-MERS2 -> alpha
+    """
+    return site.split(':')[0]
+
+
+def _save_adaptation_profile(last_state, out_file, efficiency=None):
+    """
+    Parameters:
+    ----------
+    last_state  : last state of the mcmc, e.g. Last_state.pickle
+    out_file    : str, json file to save the profile
+    efficiency  : dict, sampling efficiency of the fit, see _sampling_efficiency()
+    ----------
+    The step size and the inverse mass matrix are averaged over the chains.
+
+    Return the profile
+    """
+    last_state = jax.device_get(last_state)
+    adapt_state = last_state.adapt_state
+    step_size = np.asarray(adapt_state.step_size)
+    z = last_state.z
+    inverse_mass_matrix = adapt_state.inverse_mass_matrix
+    if not isinstance(inverse_mass_matrix, dict):
+        inverse_mass_matrix = {tuple(sorted(z)): inverse_mass_matrix}
+
+    if step_size.ndim == 0:
+        ## Single chain, without the chain axis
+        step_size = step_size[None]
+        z = {key: np.asarray(value)[None] for key, value in z.items()}
+        inverse_mass_matrix = {key: np.asarray(value)[None] for key, value in inverse_mass_matrix.items()}
+
+    blocks = []
+    for sites, inverse_mm in inverse_mass_matrix.items():
+        blocks.append({'sites': list(sites),
+                       'sizes': [int(np.size(z[site][0])) for site in sites],
+                       'inverse_mass_matrix': np.mean(np.asarray(inverse_mm), axis=0).tolist()})
+
+    profile = {'step_size': float(np.median(step_size)), 'blocks': blocks, 'sampling_efficiency': efficiency}
+    with open(out_file, 'w') as f:
+        json.dump(profile, f, indent=2)
+    return profile
+
+
+def _load_adaptation_profile(adaptation_file, model, rng_key, init_strategy=None, **model_kwargs):
+    """
+    Parameters:
+    ----------
+    adaptation_file : str, json file saved by _save_adaptation_profile()
+    model           : numpyro model of the new fit, e.g. global_fitting
+    rng_key         : random key to initialize the model
+    init_strategy   : initialization strategy of the new fit
+    model_kwargs    : arguments of the model, e.g. experiments, prior_infor, shared_params, args
+    ----------
+    The blocks of the profile are restricted to the sites of the new model. The missing sites are filled by
+    the median variance of their family. The mass matrix is kept fixed during the warm-up only if all sites
+    have their own entry in the profile, otherwise it is adapted starting from the profile.
+
+    Return dict of the arguments of NUTS (step_size, inverse_mass_matrix, adapt_mass_matrix, dense_mass)
+    """
+    profile = json.load(open(adaptation_file))
+    if init_strategy is None:
+        model_info = initialize_model(rng_key, model, model_kwargs=model_kwargs)
+    else:
+        model_info = initialize_model(rng_key, model, init_strategy=init_strategy, model_kwargs=model_kwargs)
+    sizes = {site: int(np.size(value)) for site, value in model_info.param_info.z.items()}
+
+    inverse_mass_matrix = {}
+    dense_mass = []
+    family_variances = {}
+    for block in profile['blocks']:
+        inverse_mm = np.asarray(block['inverse_mass_matrix'])
+        variances = inverse_mm if inverse_mm.ndim == 1 else np.diag(inverse_mm)
+        starts = np.cumsum([0]+block['sizes'])
+
+        sites = []
+        idx = []
+        for i, site in enumerate(block['sites']):
+            family_variances.setdefault(_site_family(site), []).extend(variances[starts[i]:starts[i+1]])
+            if sizes.get(site, None) == block['sizes'][i]:
+                sites.append(site)
+                idx.extend(range(starts[i], starts[i+1]))
+        if len(sites) == 0:
+            continue
+
+        if inverse_mm.ndim == 1:
+            inverse_mass_matrix[tuple(sites)] = inverse_mm[idx]
+        else:
+            inverse_mass_matrix[tuple(sites)] = inverse_mm[np.ix_(idx, idx)]
+            dense_mass.append(tuple(sites))
+
+    ## The sites filled by their family were never adapted, the mass matrix is then adapted from the profile
+    missing_sites = sorted(set(sizes) - set().union(*inverse_mass_matrix))
+    for site in missing_sites:
+        if _site_family(site) in family_variances:
+            inverse_mass_matrix[(site, )] = np.repeat(np.median(family_variances[_site_family(site)]), sizes[site])
+
+    if len(missing_sites) > 0:
+        print("Sites not found in the adaptation profile:", ', '.join(missing_sites))
+        print("The mass matrix is adapted during the warm-up.")
+    else:
+        print("Using the step size and mass matrix in", adaptation_file)
+
+    nuts_kwargs = {'step_size': profile['step_size'], 'inverse_mass_matrix': inverse_mass_matrix,
+                   'adapt_mass_matrix': len(missing_sites) > 0}
+    if len(dense_mass) > 0:
+        nuts_kwargs['dense_mass'] = dense_mass
+    return nuts_kwargs
+
+
+def _sampling_efficiency(trace_group, extra_fields, elapsed_time, args, reference=None, cpu_time=None,
+                         chain_method=None):
+    """
+    Parameters:
+    ----------
+    trace_group     : dict of samples grouped by chain
+    extra_fields    : dict of extra fields grouped by chain, e.g. diverging
+    elapsed_time    : float, time of the warm-up and sampling in seconds
+    args            : class comprises other model arguments. For more information, check _define_model.py
+    reference       : dict, sampling efficiency of the reference fit, e.g. from the adaptation profile
+    cpu_time        : float, cpu time of all cores used by the warm-up and sampling in seconds
+    chain_method    : str, chain method of MCMC, see _chain_method.py
+    ----------
+    The effective sample size (ESS) is estimated for each element of the parameters. The gain is the ratio
+    between the ESS per second of this fit and of the reference fit. The ESS per cpu second is the throughput
+    per core, which can be compared between the chain methods.
+
+    Return dict of the sampling efficiency
+    """
+    ess = np.concatenate([np.ravel(effective_sample_size(np.asarray(trace_group[key], dtype=np.float64)))
+                          for key in trace_group.keys()])
+    ess = ess[np.isfinite(ess)]
+    if len(ess) == 0:
+        ess = np.array([np.nan])
+
+    efficiency = {'nburn': int(args.nburn), 'niters': int(args.niters), 'nchain': int(args.nchain),
+                  'elapsed_time': float(elapsed_time),
+                  'ess_min': float(np.min(ess)), 'ess_median': float(np.median(ess)),
+                  'ess_min_per_second': float(np.min(ess)/elapsed_time),
+                  'ess_median_per_second': float(np.median(ess)/elapsed_time)}
+    if chain_method is not None:
+        efficiency['chain_method'] = chain_method
+    if cpu_time is not None and cpu_time > 0:
+        efficiency['cpu_time'] = float(cpu_time)
+        efficiency['ess_min_per_cpu_second'] = float(np.min(ess)/cpu_time)
+        efficiency['ess_median_per_cpu_second'] = float(np.median(ess)/cpu_time)
+    if 'diverging' in extra_fields:
+        efficiency['divergences'] = int(np.sum(extra_fields['diverging']))
+
+    if reference is not None:
+        efficiency['reference'] = reference
+        for key in ['ess_min_per_second', 'ess_median_per_second']:
+            efficiency['gain_'+key] = efficiency[key]/reference[key]
+    return efficiency
@@ -0,0 +1,107 @@
+"""
+Grid of concentrations for simulating concentration-response curves (CRC). The points are placed densely
+around the transition of the curves, which is located by a cheap coarse pass, and sparsely on the plateaus.
+The evenly spaced grid used by default for plotting the fitted curves is also defined here.
+"""
+import numpy as np
+
+
+def _transition_range(x, ys, band=(0.05, 0.95)):
+    """
+    Parameters:
+    ----------
+    x       : vector of the coarse grid
+    ys      : array (ncurves, len(x)) of responses on the coarse grid
+    band    : the transition is where the normalized response (between 0 and 1) is within this band
+    ----------
+    Return the range [x_lower, x_upper] covering the transition of all curves, None if all curves are flat
+    """
+    ys = np.atleast_2d(np.asarray(ys, dtype=np.float64))
+    y_min = np.min(ys, axis=1, keepdims=True)
+    y_range = np.max(ys, axis=1, keepdims=True) - y_min
+    valid = (y_range[:, 0]>0)*np.all(np.isfinite(ys), axis=1)
+    if not np.any(valid):
+        return None
+
+    ys_norm = (ys[valid] - y_min[valid])/y_range[valid]
+    lower = np.minimum(ys_norm[:, :-1], ys_norm[:, 1:])
+    upper = np.maximum(ys_norm[:, :-1], ys_norm[:, 1:])
+    ## Intervals of the coarse grid in which any curve passes through the band
+    active = np.where(np.any((lower<band[1])*(upper>band[0]), axis=0))[0]
+    return [x[active[0]], x[active[-1]+1]]
+
+
+def _adaptive_grid(f, x_min, x_max, n_points=50, n_coarse=10, dense_fraction=0.7, band=(0.05, 0.95)):
+    """
+    Parameters:
+    ----------
+    f               : function of a vector of x, return the responses of one or multiple curves,
+                      array of len(x) or (ncurves, len(x))
+    x_min, x_max    : range of the grid, e.g. log of the minimum and maximum inhibitor concentrations
+    n_points        : number of points of the grid
+    n_coarse        : number of points of the coarse grid to locate the transition
+    dense_fraction  : fraction of n_points placed within the transition
+    band            : the transition is where the normalized response (between 0 and 1) is within this band
+    ----------
+    The grid always includes x_min and x_max, and the remaining points are shared between the two plateaus
+    proportionally to their length. If all curves are flat, the grid is evenly spaced.
+
+    Return the increasing vector of n_points values of x
+    """
+    x_coarse = np.linspace(x_min, x_max, n_coarse)
+    transition = _transition_range(x_coarse, f(x_coarse), band)
+    if transition is None:
+        return x_coarse if n_points==n_coarse else np.linspace(x_min, x_max, n_points)
+    [x_lower, x_upper] = transition
+
+    len_left = x_lower - x_min
+    len_right = x_max - x_upper
+    ## Number of plateaus, each of them keeps at least one point so that x_min and x_max are in the grid
+    n_ends = int(len_left > 0) + int(len_right > 0)
+    if n_ends == 0:
+        n_dense = n_points
+    else:
+        n_dense = min(max(int(round(dense_fraction*n_points)), 2), n_points - n_ends)
+    n_sparse = n_points - n_dense
+    if n_sparse > 0:
+        n_left = int(round(n_sparse*len_left/(len_left+len_right)))
+        n_left = min(max(n_left, int(len_left > 0)), n_sparse - int(len_right > 0))
+    else:
+        n_left = 0
+    n_right = n_sparse - n_left
+
+    left = np.linspace(x_min, x_lower, n_left+1)[:-1]
+    dense = np.linspace(x_lower, x_upper, n_dense)
+    right = np.linspace(x_upper, x_max, n_right+1)[1:]
+    return np.concatenate([left, dense, right])
+
+
+def _plot_grid(experiment, npoints=50):
+    """
+    Parameters:
+    ----------
+    experiment  : dict, dataset contains response, logMtot, lotStot, logItot
+    npoints     : number of points of the grid
+    ----------
+    Return [x, logMtot, logStot, logItot], the evenly spaced grid of the varied concentration x,
+    the other concentrations are fixed at their first value. logItot is None if there is no inhibitor.
+    """
+    if experiment['x']=='logMtot':
+        logMtot = np.linspace(max(experiment['logMtot']), min(experiment['logMtot']), npoints)
+        logStot = experiment['logStot'][0]*np.ones(npoints)
+        logItot = experiment['logItot'][0]*np.ones(npoints)
+        x = logMtot
+    elif experiment['x']=='logStot':
+        logMtot = experiment['logMtot'][0]*np.ones(npoints)
+        logStot = np.linspace(max(experiment['logStot']), min(experiment['logStot']), npoints)
+        if experiment['logItot'] is not None:
+            logItot = experiment['logItot'][0]*np.ones(npoints)
+        else:
+            logItot = None
+        x = logStot
+    elif experiment['x']=='logItot':
+        logMtot = experiment['logMtot'][0]*np.ones(npoints)
+        logStot = experiment['logStot'][0]*np.ones(npoints)
+        logItot = np.linspace(max(experiment['logItot']), min(experiment['logItot']), npoints)
+        x = logItot
+    return [x, logMtot, logStot, logItot]
@@ -0,0 +1,149 @@
+"""
+Fast approximate posterior of the numpyro model, used to pre-screen the CRC before running NUTS.
+
+Both approximations are multivariate normal distributions in the unconstrained space of the parameters:
+    - 'laplace': MAP found by L-BFGS-B and covariance from the inverse Hessian of the potential energy,
+    - 'svi'    : stochastic variational inference with an AutoMultivariateNormal guide.
+The samples of the approximation are returned as a trace (group_by_chain=False) with the same keys as the
+mcmc traces, so that they can be used by _map_running, _pIC and the plotting functions.
+
+The quality of the approximation is checked by Pareto-smoothed importance sampling (PSIS): the shape
+parameter k-hat of the importance weights p/q is reliable below 0.7.
+"""
+import numpy as np
+
+from _lazy_import import lazy_import
+az = lazy_import('arviz')
+
+import jax
+import jax.numpy as jnp
+from jax import vmap
+from jax.flatten_util import ravel_pytree
+from scipy.optimize import minimize
+
+import numpyro.distributions as dist
+from numpyro.infer import SVI, Trace_ELBO, init_to_value, init_to_median
+from numpyro.infer.autoguide import AutoMultivariateNormal
+from numpyro.infer.util import initialize_model
+from numpyro.optim import Adam
+
+from _timing import _timed
+
+
+def _laplace_approximation(potential_fn, x0, maxiter=2000):
+    """
+    Parameters:
+    ----------
+    potential_fn    : function of the flattened unconstrained parameters, negative log joint
+    x0              : array, starting point of the optimization
+    maxiter         : int, maximum number of iterations of L-BFGS-B
+    ----------
+    The MAP is found by L-BFGS-B of scipy with the gradient given by jax.
+
+    Return [loc, scale_tril] of the normal approximation, scale_tril is None if the Hessian at the optimum
+    is not positive definite
+    """
+    value_and_grad = jax.jit(jax.value_and_grad(potential_fn))
+    def _fun(x):
+        [value, grad] = value_and_grad(jnp.asarray(x))
+        return [float(value), np.asarray(grad, dtype=np.float64)]
+
+    results = minimize(_fun, np.asarray(x0, dtype=np.float64), jac=True, method='L-BFGS-B', options={'maxiter': maxiter})
+    if not results.success:
+        print("The optimization of the Laplace approximation did not converge:", results.message)
+    loc = jnp.asarray(results.x)
+    hessian = np.asarray(jax.hessian(potential_fn)(loc))
+    if not np.all(np.isfinite(hessian)) or not np.all(np.linalg.eigvalsh(hessian) > 0):
+        print("The Hessian at the optimum is not positive definite.")
+        return [loc, None]
+    cov = np.linalg.inv(hessian)
+    return [loc, jnp.linalg.cholesky(jnp.asarray((cov+cov.T)/2))]
+
+
+def _svi_approximation(model, model_kwargs, rng_key, init_values=None, num_steps=2000, learning_rate=0.01):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    model_kwargs    : dict, arguments of the model
+    rng_key         : random key of the optimization
+    init_values     : dict, initial value of the parameters, None if not available
+    num_steps       : int, number of steps of the optimization
+    learning_rate   : float, step size of Adam
+    ----------
+    Return [loc, scale_tril] of the AutoMultivariateNormal guide in the unconstrained space
+    """
+    if init_values is None:
+        guide = AutoMultivariateNormal(model, init_loc_fn=init_to_median)
+    else:
+        guide = AutoMultivariateNormal(model, init_loc_fn=init_to_value(values=init_values))
+    svi = SVI(model, guide, Adam(learning_rate), Trace_ELBO())
+    results = svi.run(rng_key, num_steps, progress_bar=False, **model_kwargs)
+    posterior = guide.get_posterior(results.params)
+    return [posterior.loc, posterior.scale_tril]
+
+
+@_timed('approximation')
+def _approximate_posterior(model, model_kwargs, rng_key, method='laplace', nsamples=1000, init_values=None,
+                           num_steps=2000, khat_threshold=0.7):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    model_kwargs    : dict, arguments of the model
+    rng_key         : random key
+    method          : 'laplace' or 'svi'
+    nsamples        : int, number of samples drawn from the approximation
+    init_values     : dict, initial value of the parameters, None if not available
+    num_steps       : int, number of steps of SVI
+    khat_threshold  : float, the approximation is accepted if the Pareto k-hat is lower than this value
+    ----------
+    Return [trace, extra_fields, diagnostics]
+        trace        : dict of samples (group_by_chain=False), including the deterministic sites
+        extra_fields : dict with the potential energy of each sample, as the extra fields of mcmc
+        diagnostics  : dict with the Pareto k-hat, the ESS of the importance weights and if the approximation is accepted
+    """
+    assert method in ['laplace', 'svi'], "The approximation should be laplace or svi."
+    rng_key_init, rng_key_svi, rng_key_sample = jax.random.split(rng_key, 3)
+
+    if init_values is None:
+        model_info = initialize_model(rng_key_init, model, model_kwargs=model_kwargs)
+    else:
+        model_info = initialize_model(rng_key_init, model, init_strategy=init_to_value(values=init_values),
+                                      model_kwargs=model_kwargs)
+    x0, unravel = ravel_pytree(model_info.param_info.z)
+    potential_fn = lambda x: model_info.potential_fn(unravel(x))
+
+    if method == 'laplace':
+        [loc, scale_tril] = _laplace_approximation(potential_fn, x0)
+    else:
+        [loc, scale_tril] = _svi_approximation(model, model_kwargs, rng_key_svi, init_values=init_values,
+                                               num_steps=num_steps)
+
+    if scale_tril is None:
+        ## Only the optimum, the approximation is rejected
+        samples = jnp.repeat(loc[None, :], nsamples, axis=0)
+    else:
+        q = dist.MultivariateNormal(loc, scale_tril=scale_tril)
+        samples = q.sample(rng_key_sample, (nsamples, ))
+    potential_energy = np.asarray(vmap(potential_fn)(samples))
+
+    ## Importance weights p/q smoothed by PSIS
+    khat = np.inf
+    ess = 0.
+    if scale_tril is not None:
+        log_weights = -potential_energy - np.asarray(q.log_prob(samples))
+        if np.any(np.isfinite(log_weights)):
+            log_weights = np.where(np.isfinite(log_weights), log_weights, -np.inf)
+            [smoothed_log_weights, khat] = az.psislw(log_weights)
+            weights = np.exp(smoothed_log_weights - np.max(smoothed_log_weights))
+            ess = np.sum(weights)**2/np.sum(weights**2)
+
+    trace = jax.device_get(vmap(lambda x: model_info.postprocess_fn(unravel(x)))(samples))
+    trace = {key: np.asarray(value) for key, value in trace.items()}
+
+    diagnostics = {'method': method, 'nsamples': nsamples, 'khat': float(khat),
+                   'ess_importance': float(ess), 'khat_threshold': khat_threshold,
+                   'passed': bool(khat < khat_threshold)}
+    print("Approximation by %s: k-hat = %0.3f, ESS of the importance weights = %0.1f" %(method, khat, ess))
+    return [trace, {'potential_energy': potential_energy}, diagnostics]
@@ -2,11 +2,10 @@
 https://doi.org/10.1371/journal.pone.0273656
 """
 import numpy as np
-from scipy.stats import norm
-from scipy.stats import iqr
-
-from sklearn.mixture import GaussianMixture
-import pymbar
+from _lazy_import import lazy_import
+stats = lazy_import('scipy.stats')
+mixture = lazy_import('sklearn.mixture')
+pymbar = lazy_import('pymbar')
 
 def log_marginal_likelihood(log_likelihoods):
     """
@@ -91,12 +90,12 @@ def get_values_from_traces(model, traces, thin=1, burn=0):
 
 
 def std_from_iqr(data):
-    return iqr(data) / 1.35
+    return stats.iqr(data) / 1.35
 
 
 def fit_normal(x, sigma_robust=False):
     # mu, sigma = norm.fit(x[~np.isnan(x)])
-    mu, sigma = norm.fit(x[np.isfinite(x)])
+    mu, sigma = stats.norm.fit(x[np.isfinite(x)])
     if sigma_robust:
         sigma = std_from_iqr(x)
     res = {"mu": mu, "sigma": sigma}
@@ -198,7 +197,7 @@ class GaussMix(object):
         """
         self._n_components = n_components
         self._vars = []
-        self._gm = GaussianMixture(n_components=self._n_components, covariance_type=covariance_type)
+        self._gm = mixture.GaussianMixture(n_components=self._n_components, covariance_type=covariance_type)
 
     def fit(self, sample_dict):
         """
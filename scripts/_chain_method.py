@@ -0,0 +1,91 @@
+"""
+Selection of the chain method of numpyro MCMC: the chains of NUTS can be run on separate devices ('parallel',
+one cpu core per chain by numpyro.set_host_device_count), one after another ('sequential') or together on one
+device ('vectorized', the model is evaluated for all chains at once by jax.vmap).
+
+For small models, e.g. the CRC of one inhibitor, the cost of one gradient is too low to use one core per chain
+efficiently. On one core, the sequential chains gave a higher throughput per core (ESS per cpu second) than the
+vectorized chains, which wait at each step for the chain with the longest trajectory. With 'auto', the chains
+are parallel only if the model is large and there is one core available for each chain, sequential otherwise.
+"""
+import os
+import numpy as np
+
+import jax
+from numpyro import handlers
+
+CHAIN_METHODS = ['parallel', 'sequential', 'vectorized', 'auto']
+
+## Minimum number of observations and parameters of the model to run the chains parallel with 'auto'
+PARALLEL_MIN_SIZE = 5000
+
+
+def _available_cores():
+    """
+    Return the number of cpu cores available to this process, e.g. the cores given by run_scheduler.py
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def _use_host_devices(chain_method, nchain):
+    """
+    Parameters:
+    ----------
+    chain_method    : str, 'parallel', 'sequential', 'vectorized' or 'auto'
+    nchain          : int, number of chains
+    ----------
+    Return True if one device should be created for each chain by numpyro.set_host_device_count(nchain).
+    This has to be decided before jax starts, so 'auto' only checks the available cores.
+    """
+    assert chain_method in CHAIN_METHODS, "The chain method should be parallel, sequential, vectorized or auto."
+    if chain_method == 'parallel':
+        return True
+    if chain_method == 'auto':
+        return nchain > 1 and _available_cores() >= nchain
+    return False
+
+
+def _model_size(model, rng_key, **model_kwargs):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    rng_key         : random key to trace the model
+    model_kwargs    : arguments of the model, e.g. experiments, prior_infor, shared_params, args
+    ----------
+    Return the total number of observations and parameters of the model
+    """
+    model_trace = handlers.trace(handlers.seed(model, rng_key)).get_trace(**model_kwargs)
+    return int(sum(np.size(site['value']) for site in model_trace.values() if site['type'] == 'sample'))
+
+
+def _select_chain_method(model, rng_key, args, **model_kwargs):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    rng_key         : random key to trace the model
+    args            : class comprises other model arguments. For more information, check _define_model.py
+    model_kwargs    : other arguments of the model, e.g. experiments, prior_infor, shared_params
+    ----------
+    With args.chain_method = 'auto', the chains are parallel if the model has more than PARALLEL_MIN_SIZE
+    observations and parameters and there is one device for each chain, and sequential otherwise.
+
+    Return the chain method of MCMC
+    """
+    chain_method = getattr(args, 'chain_method', 'parallel')
+    assert chain_method in CHAIN_METHODS, "The chain method should be parallel, sequential, vectorized or auto."
+    if chain_method != 'auto':
+        return chain_method
+    if args.nchain == 1:
+        return 'sequential'
+
+    size = _model_size(model, rng_key, args=args, **model_kwargs)
+    if size > PARALLEL_MIN_SIZE and jax.local_device_count() >= args.nchain:
+        chain_method = 'parallel'
+    else:
+        chain_method = 'sequential'
+    print(f"Model size: {size}, {_available_cores()} cpu cores available, running {args.nchain} chains {chain_method}.")
+    return chain_method
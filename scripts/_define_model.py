@@ -52,6 +52,11 @@ class Model:
             nthin           : int, number of thinning
             nchain          : int, number of chains
             random_key      : int, random key
+            adaptation_file : str, adaptation profile (step size, mass matrix) to start the warm-up, see _adaptation.py
+            save_adaptation : boolean, saving the adaptation profile of the fit in Adaptation_profile.json
+            dense_mass      : str, mass matrix of NUTS, 'diag', 'dense' or 'block' (dense for the kinetic parameters of each enzyme)
+            decorrelate_logK: boolean, sampling logK_I_DI and logK_S_DI decorrelated from logK_I_D, see _reparam.py
+            chain_method    : str, chain method of MCMC, 'parallel', 'sequential', 'vectorized' or 'auto', see _chain_method.py
             lnKd_min        : float, lower values of uniform distribution for prior of dissociation constants
             lnKd_max        : float, upper values of uniform distribution for prior of dissociation constants
             kcat_min        : float, lower values of uniform distribution for prior of kcat
@@ -107,6 +112,12 @@ class Model:
             'nthin':            getattr(input_args, 'nthin', 1),
             'nchain':           getattr(input_args, 'nchain', 4),
             'random_key':       getattr(input_args, 'random_key', 0),
+            'status_every':     getattr(input_args, 'status_every', 0),
+            'adaptation_file':  getattr(input_args, 'adaptation_file', ""),
+            'save_adaptation':  getattr(input_args, 'save_adaptation', False),
+            'dense_mass':       getattr(input_args, 'dense_mass', 'diag'),
+            'decorrelate_logK': getattr(input_args, 'decorrelate_logK', False),
+            'chain_method':     getattr(input_args, 'chain_method', 'parallel'),
             'lnKd_min':         getattr(input_args, 'lnKd_min', -20.73),
             'lnKd_max':         getattr(input_args, 'lnKd_max', 0),
             'kcat_min':         getattr(input_args, 'kcat_min', 0),
@@ -120,6 +131,8 @@ class Model:
             'E_list':           E_list,
             'log_sigmas':       log_sigmas,
             'nsamples_MAP':                 getattr(input_args, 'nsamples_MAP', None),
+            'map_refine_topk':              getattr(input_args, 'map_refine_topk', 0),
+            'chunk_size_MAP':               getattr(input_args, 'chunk_size_MAP', None),
             'set_K_I_M_equal_K_S_M':        getattr(input_args, 'set_K_I_M_equal_K_S_M', False), 
             'set_K_S_DS_equal_K_S_D':       getattr(input_args, 'set_K_S_DS_equal_K_S_D', False),
             'set_K_S_DI_equal_K_S_DS':      getattr(input_args, 'set_K_S_DI_equal_K_S_DS', False),
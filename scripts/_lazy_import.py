@@ -0,0 +1,42 @@
+"""
+Lazy import of the heavy packages (jax, numpyro, arviz, seaborn, matplotlib, pymbar, sklearn). The module
+is only loaded when one of its attributes is used for the first time, so that the scripts which do not
+need a package do not pay for its import.
+"""
+import sys
+import importlib.util
+import importlib.machinery
+
+
+def _find_spec(name):
+    """
+    Return the spec of the module without importing its parent packages
+    """
+    parent_name = name.rpartition('.')[0]
+    if len(parent_name)==0 or parent_name in sys.modules:
+        return importlib.util.find_spec(name)
+    parent_spec = _find_spec(parent_name)
+    if parent_spec is None or parent_spec.submodule_search_locations is None:
+        return None
+    return importlib.machinery.PathFinder.find_spec(name, parent_spec.submodule_search_locations)
+
+
+def lazy_import(name):
+    """
+    Parameters:
+    ----------
+    name    : string, name of the module, e.g. 'arviz' or 'matplotlib.pyplot'
+    ----------
+    Return the module, which is loaded at the first access to its attributes, together with its parent packages
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = _find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
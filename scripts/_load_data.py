@@ -1,8 +1,174 @@
+import os
+import re
+import json
+import hashlib
 import numpy as np
 import jax
 import jax.numpy as jnp
 import pandas as pd
 
+from _timing import _timed
+
+
+def _log_conc(conc):
+    """
+    Log of the concentrations, np.log(1E-30) for the non-positive concentrations
+    """
+    conc = np.asarray(conc, dtype=np.float64)
+    return np.log(np.where(conc>0, conc, 1E-30))
+
+
+def _read_csv_cached(input_file, cache_dir=None):
+    """
+    Parameters:
+    ----------
+    input_file  : string, csv file of the plate data
+    cache_dir   : optional, string, directory of the cache file, default is the directory of input_file
+    ----------
+    The columns of the csv file are saved in a binary file (.npz) named by the sha1 of the csv file,
+    which is loaded instead of parsing the csv file again if the csv file is unchanged.
+
+    Return pandas dataframe
+    """
+    sha1 = hashlib.sha1(open(input_file, 'rb').read()).hexdigest()
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.abspath(input_file))
+    cache_file = os.path.join(cache_dir, '.'+os.path.basename(input_file)+'.'+sha1[:16]+'.npz')
+
+    if os.path.isfile(cache_file):
+        try:
+            cache = np.load(cache_file, allow_pickle=False)
+            return pd.DataFrame({name: cache[f'col_{n}'] for n, name in enumerate(cache['columns'])})
+        except Exception:
+            pass
+
+    df = pd.read_csv(input_file)
+    columns = {}
+    for n, name in enumerate(df.columns):
+        if df[name].dtype == object:
+            columns[f'col_{n}'] = np.asarray(df[name].astype(str), dtype=str)
+        else:
+            columns[f'col_{n}'] = np.asarray(df[name])
+    try:
+        np.savez(cache_file, columns=np.asarray(df.columns, dtype=str), **columns)
+    except OSError:
+        pass
+    return df
+
+
+def _write_partitions(input_file, partition_dir):
+    """
+    Parameters:
+    ----------
+    input_file      : string, csv file of the plate data, containing Inhibitor_ID
+    partition_dir   : string, directory of the partitions
+    ----------
+    The rows of each inhibitor are saved as a structured array (.npy) that can be memory mapped, and
+    index.json records the file of each inhibitor and the size and modification time of input_file.
+
+    Return dict of the index
+    """
+    df = pd.read_csv(input_file)
+    if not os.path.isdir(partition_dir):
+        os.makedirs(partition_dir)
+
+    ## Fixed-length strings so that the partitions can be memory mapped
+    dtype = []
+    for name in df.columns:
+        if df[name].dtype == object:
+            dtype.append((name, 'U%d' %max(df[name].astype(str).str.len().max(), 1)))
+        else:
+            dtype.append((name, df[name].dtype))
+
+    partitions = {}
+    for name, rows in df.groupby('Inhibitor_ID', sort=True).indices.items():
+        dat = df.iloc[np.sort(rows)]
+        records = np.empty(len(dat), dtype=dtype)
+        for column in df.columns:
+            records[column] = dat[column].astype(str) if df[column].dtype == object else dat[column]
+        file_name = re.sub(r'[^\w.-]', '_', str(name))+'.npy'
+        np.save(os.path.join(partition_dir, file_name), records)
+        partitions[str(name)] = {'file': file_name, 'nrows': len(dat)}
+
+    stat = os.stat(input_file)
+    index = {'input_file': os.path.abspath(input_file), 'size': stat.st_size, 'mtime': stat.st_mtime,
+             'columns': list(df.columns), 'partitions': partitions}
+    json.dump(index, open(os.path.join(partition_dir, 'index.json'), 'w'), indent=2)
+    return index
+
+
+@_timed('data_load')
+def _read_inhibitor_data(input_file, inhibitor_list, partition_dir=''):
+    """
+    Parameters:
+    ----------
+    input_file      : string, csv file of the plate data
+    inhibitor_list  : list of inhibitors
+    partition_dir   : optional, string, directory of the partitions (_write_partitions)
+    ----------
+    The partitions of the inhibitors are memory mapped if partition_dir is given and input_file has not 
+    been changed since the partitioning. Otherwise, the whole csv file is read.
+
+    Return pandas dataframe of the rows of the inhibitors
+    """
+    index_file = os.path.join(partition_dir, 'index.json')
+    if len(partition_dir)>0 and os.path.isfile(index_file):
+        index = json.load(open(index_file))
+        stat = os.stat(input_file) if os.path.isfile(input_file) else None
+        if stat is None or (stat.st_size == index['size'] and stat.st_mtime == index['mtime']):
+            dfs = []
+            for name in inhibitor_list:
+                if name in index['partitions'].keys():
+                    records = np.load(os.path.join(partition_dir, index['partitions'][name]['file']), mmap_mode='r')
+                    dfs.append(pd.DataFrame({column: records[column] for column in index['columns']}))
+            if len(dfs)>0:
+                return pd.concat(dfs, ignore_index=True)
+            return pd.DataFrame(columns=index['columns'])
+        print(f"{input_file} was changed after partitioning, reading the csv file.")
+
+    df = pd.read_csv(input_file)
+    return df[df['Inhibitor_ID'].isin(inhibitor_list)]
+
+
+def _plate_data_columns(df):
+    """
+    Parameters:
+    ----------
+    df          : pandas dataframe, each row containing Plate, Enzyme (nM), Substrate (nM), Inhibitor (nM),
+                  and v (nM.min^{-1})
+    ----------
+    Return dict of the columns as arrays, concentrations under M and their log
+    """
+    cols = {'Plate': np.asarray(df['Plate']),
+            'Mtot': np.asarray(df['Enzyme (nM)'], dtype=np.float64)*1E-9,
+            'Stot': np.asarray(df['Substrate (nM)'], dtype=np.float64)*1E-9,
+            'Itot': np.asarray(df['Inhibitor (nM)'], dtype=np.float64)*1E-9,
+            'v': np.asarray(df['v (nM.min^{-1})'], dtype=np.float64)*1E-9}
+    for name in ['Mtot', 'Stot', 'Itot']:
+        cols['log'+name] = _log_conc(cols[name])
+    return cols
+
+
+def _group_plate_enzyme(df, rows=None):
+    """
+    Parameters:
+    ----------
+    df          : pandas dataframe, each row containing Plate and Enzyme (nM)
+    rows        : optional, indices of the rows of df to be grouped, default is all rows
+    ----------
+    Return dict of {plate: [[conc_enzyme, rows], ...]} sorted by plate and enzyme concentration, 
+    rows are the indices of the data points in the order of df
+    """
+    if rows is None:
+        rows = np.arange(len(df))
+    groups = pd.DataFrame({'Plate': np.asarray(df['Plate'])[rows],
+                           'Enzyme': np.asarray(df['Enzyme (nM)'])[rows]}).groupby(['Plate', 'Enzyme'], sort=True).indices
+    plate_groups = {}
+    for (plate, conc_enzyme) in sorted(groups.keys()):
+        plate_groups.setdefault(plate, []).append([conc_enzyme, rows[groups[(plate, conc_enzyme)]]])
+    return plate_groups
+
+
 def load_data_one_inhibitor(df, multi_var=False, name=None):
     """
     Parameters:
@@ -19,7 +185,8 @@ def load_data_one_inhibitor(df, multi_var=False, name=None):
     ----------
     
     Return the list of dict, each dict contain the information of experiment. 
-    This function is used for inhibitior datasets.
+    This function is used for inhibitior datasets. Each curve of the second list also contains the rows 
+    of its data points in df (_group_plate_enzyme).
     """ 
     plate_list = np.unique(df['Plate'])
     multi_experiments = []
@@ -29,6 +196,9 @@ def load_data_one_inhibitor(df, multi_var=False, name=None):
         try: name = np.unique(df['Inhibitor_ID'])[0]
         except: name = 'Inhibitor'
 
+    cols = _plate_data_columns(df)
+    groups = _group_plate_enzyme(df)
+
     data_CRC = {}
     for i, plate_i in enumerate(plate_list):
         CRC_logMtot = []
@@ -36,18 +206,14 @@ def load_data_one_inhibitor(df, multi_var=False, name=None):
         CRC_logItot = []
         response = []
 
-        unique_enzyme = np.unique(df['Enzyme (nM)'])
-        for n, conc_enzyme in enumerate(unique_enzyme):
-            dat = df[(df['Enzyme (nM)']==conc_enzyme)*df['Plate']==plate_i]
-            
-            Mtot = np.array(dat['Enzyme (nM)'])*1E-9
-            Stot = np.array(dat['Substrate (nM)'])*1E-9
-            Itot = np.array(dat['Inhibitor (nM)'])*1E-9
-            v = np.array(dat['v (nM.min^{-1})'])*1E-9
+        for [conc_enzyme, rows] in groups.get(plate_i, []):
+            Stot = cols['Stot'][rows]
+            Itot = cols['Itot'][rows]
+            v = cols['v'][rows]
 
-            logMtot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Mtot])
-            logStot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Stot])
-            logItot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Itot])
+            logMtot = cols['logMtot'][rows]
+            logStot = cols['logStot'][rows]
+            logItot = cols['logItot'][rows]
 
             if len(np.unique(Itot))>1:
                 experiment.append({'type':'CRC', 'enzyme': 'mpro', 'plate': plate_i,
@@ -56,7 +222,8 @@ def load_data_one_inhibitor(df, multi_var=False, name=None):
                                    'logStot': logStot, # M
                                    'logItot': logItot, # M
                                    'v': v, # M min^{-1}
-                                   'x':'logItot'})
+                                   'x':'logItot',
+                                   'rows': rows})
                 CRC_logMtot.append(logMtot)
                 CRC_logStot.append(logStot)
                 CRC_logItot.append(logItot)
@@ -69,7 +236,8 @@ def load_data_one_inhibitor(df, multi_var=False, name=None):
                                    'logStot': logStot, # M
                                    'logItot': logItot, #None
                                    'v': v, # M min^{-1}
-                                   'x':'logStot'})
+                                   'x':'logStot',
+                                   'rows': rows})
                 CRC_logMtot.append(logMtot)
                 CRC_logStot.append(logStot)
                 CRC_logItot.append(logItot)
@@ -95,17 +263,7 @@ def load_data_one_inhibitor(df, multi_var=False, name=None):
     if multi_var:
         return multi_experiments, experiment
     else:
-        dat = df
-        Mtot = np.array(dat['Enzyme (nM)'])*1E-9
-        Stot = np.array(dat['Substrate (nM)'])*1E-9
-        Itot = np.array(dat['Inhibitor (nM)'])*1E-9
-        response = np.array(dat['v (nM.min^{-1})'])*1E-9
-
-        logMtot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Mtot])
-        logStot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Stot])
-        logItot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Itot])
-
-        data_CRC = [response, logMtot, logStot, logItot]
+        data_CRC = [cols['v'], cols['logMtot'], cols['logStot'], cols['logItot']]
         one_experiment = []
         one_experiment.append({'enzyme': 'mpro',
                                'figure': name, 'plate' : name,
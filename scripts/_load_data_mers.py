@@ -7,6 +7,8 @@ import jax.numpy as jnp
 import numpy as np
 import pandas as pd
 
+from _load_data import _read_csv_cached, _plate_data_columns, _group_plate_enzyme
+
 
 def load_data_no_inhibitor(df, multi_var=False):
     """
@@ -24,7 +26,20 @@ def load_data_no_inhibitor(df, multi_var=False):
     Return the list of dict, each dict contain the information of experiment. 
     This function is used for no inhibitior datasets.
     """ 
-    plate_list = np.unique(df['Plate'])
+    return _experiments_no_inhibitor(_plate_data_columns(df), _group_plate_enzyme(df), multi_var)
+
+
+def _experiments_no_inhibitor(cols, groups, multi_var=False):
+    """
+    Parameters:
+    ----------
+    cols        : dict of the columns of the plate data (_plate_data_columns)
+    groups      : dict of the rows of each plate and enzyme concentration (_group_plate_enzyme)
+    multi_var   : optional, boolean, return the output that can be used to fit multiple variances for each plate
+    ----------
+    Return the experiments of no inhibitior datasets, similar to load_data_no_inhibitor
+    """
+    plate_list = np.array(sorted(groups.keys()))
     multi_experiments = []
     experiment = []
     data_CRC = {}
@@ -34,15 +49,13 @@ def load_data_no_inhibitor(df, multi_var=False):
         CRC_logItot = []
         response = []
 
-        unique_enzyme = np.unique(df['Enzyme (nM)'])
-        for n, conc_enzyme in enumerate(unique_enzyme):
-            dat = df[(df['Enzyme (nM)']==conc_enzyme)*df['Plate']==plate_i]
-            Stot = np.array(dat['Substrate (nM)'])*1E-9
-            Mtot = np.ones(len(Stot))*conc_enzyme*1E-9
-            v = np.array(dat['v (nM.min^{-1})'])*1E-9
+        for [conc_enzyme, rows] in groups[plate_i]:
+            Stot = cols['Stot'][rows]
+            Mtot = cols['Mtot'][rows]
+            v = cols['v'][rows]
 
-            logMtot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Mtot])
-            logStot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Stot])
+            logMtot = cols['logMtot'][rows]
+            logStot = cols['logStot'][rows]
 
             if len(np.unique(Stot))>1:
                 experiment.append({'type':'CRC', 'enzyme': 'mers', 'plate': None,
@@ -78,15 +91,8 @@ def load_data_no_inhibitor(df, multi_var=False):
     if multi_var:
         return multi_experiments, experiment
     else:
-        dat = df
-        Mtot = np.array(dat['Enzyme (nM)'])*1E-9
-        Stot = np.array(dat['Substrate (nM)'])*1E-9
-        Itot = np.ones(len(Mtot))*1E-30
-        response = np.array(dat['v (nM.min^{-1})'])*1E-9
-
-        logMtot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Mtot])
-        logStot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Stot])
-        data_CRC = [response, logMtot, logStot, None] #np.log(Itot)]
+        rows = np.sort(np.concatenate([np.zeros(0, dtype=int)]+[rows for plate in plate_list for [_, rows] in groups[plate]]))
+        data_CRC = [cols['v'][rows], cols['logMtot'][rows], cols['logStot'][rows], None] #np.log(Itot)]
 
         one_experiment = []
         one_experiment.append({'enzyme': 'mers', 'figure': 'No Inhibitor', 'index': 'ES',
@@ -114,14 +120,28 @@ def load_data_one_inhibitor(df, multi_var=False, name=None, min_points=8):
     Return the list of dict, each dict contain the information of experiment. 
     This function is used for inhibitior datasets.
     """ 
-    plate_list = np.unique(df['Plate'])
-    multi_experiments = []
-    experiment = []
-
     if name is None:
         try: name = np.unique(df['Inhibitor_ID'])[0]
         except: name = 'Inhibitor'
 
+    return _experiments_one_inhibitor(_plate_data_columns(df), _group_plate_enzyme(df), name, multi_var)
+
+
+def _experiments_one_inhibitor(cols, groups, name, multi_var=False):
+    """
+    Parameters:
+    ----------
+    cols        : dict of the columns of the plate data (_plate_data_columns)
+    groups      : dict of the rows of each plate and enzyme concentration (_group_plate_enzyme)
+    name        : string, name of inihbitor
+    multi_var   : optional, boolean, return the output that can be used to fit multiple variances for each plate
+    ----------
+    Return the experiments of one inhibitor, similar to load_data_one_inhibitor
+    """
+    plate_list = np.array(sorted(groups.keys()))
+    multi_experiments = []
+    experiment = []
+
     data_CRC = {}
     for i, plate_i in enumerate(plate_list):
         CRC_logMtot = []
@@ -129,23 +149,20 @@ def load_data_one_inhibitor(df, multi_var=False, name=None, min_points=8):
         CRC_logItot = []
         response = []
 
-        unique_enzyme = np.unique(df['Enzyme (nM)'])
-        for n, conc_enzyme in enumerate(unique_enzyme):
-            dat = df[(df['Enzyme (nM)']==conc_enzyme)*df['Plate']==plate_i]
+        for [conc_enzyme, rows] in groups[plate_i]:
             
-            # if len(dat)<min_points:
-            #     print(f"There was only {len(dat)} data points.")
+            # if len(rows)<min_points:
+            #     print(f"There was only {len(rows)} data points.")
             #     data_CRC[i] = [None, None, None, None]
             #     break
             
-            Mtot = np.array(dat['Enzyme (nM)'])*1E-9
-            Stot = np.array(dat['Substrate (nM)'])*1E-9
-            Itot = np.array(dat['Inhibitor (nM)'])*1E-9
-            v = np.array(dat['v (nM.min^{-1})'])*1E-9
+            Stot = cols['Stot'][rows]
+            Itot = cols['Itot'][rows]
+            v = cols['v'][rows]
 
-            logMtot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Mtot])
-            logStot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Stot])
-            logItot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Itot])
+            logMtot = cols['logMtot'][rows]
+            logStot = cols['logStot'][rows]
+            logItot = cols['logItot'][rows]
 
             if len(np.unique(Itot))>1:
                 experiment.append({'type':'CRC', 'enzyme': 'mers', 'plate': plate_i,
@@ -195,21 +212,60 @@ def load_data_one_inhibitor(df, multi_var=False, name=None, min_points=8):
     if multi_var:
         return multi_experiments, experiment
     else:
-        dat = df
-        Mtot = np.array(dat['Enzyme (nM)'])*1E-9
-        Stot = np.array(dat['Substrate (nM)'])*1E-9
-        Itot = np.array(dat['Inhibitor (nM)'])*1E-9
-        response = np.array(dat['v (nM.min^{-1})'])*1E-9
-
-        logMtot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Mtot])
-        logStot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Stot])
-        logItot = np.array([np.log(conc) if conc > 0 else np.log(1E-30) for conc in Itot])
-
-        data_CRC = [response, logMtot, logStot, logItot]
+        rows = np.sort(np.concatenate([np.zeros(0, dtype=int)]+[rows for plate in plate_list for [_, rows] in groups[plate]]))
+        data_CRC = [cols['v'][rows], cols['logMtot'][rows], cols['logStot'][rows], cols['logItot'][rows]]
         one_experiment = []
         one_experiment.append({'enzyme': 'mers', 'index': name[7:12], #'index':'ESI',
                                'figure': name, 'plate' : name[7:12],
                                'CRC': data_CRC, 'kinetics': None, 'AUC': None, 'ICE': None
                                })
 
-        return one_experiment, experiment
\ No newline at end of file
+        return one_experiment, experiment
+
+
+def load_data_campaign(input_file, multi_var=False, inhibitor_list=None, cache_dir=None):
+    """
+    Parameters:
+    ----------
+    input_file      : string, csv file, each row containing Inhibitor_ID, Plate, Enzyme (nM), Substrate (nM), 
+                      Inhibitor (nM), v (nM.min^{-1}), and optionally Drop
+    multi_var       : optional, boolean, return the output that can be used to fit multiple variances for each plate
+    inhibitor_list  : optional, list of inhibitors, default is all inhibitors with non-zero concentrations
+    cache_dir       : optional, string, directory of the cache file of the csv file (_read_csv_cached)
+    ----------
+    The csv file is read once and the data points of all inhibitors are grouped by inhibitor, plate,
+    and enzyme concentration together. The datasets without inhibitor are all data points with zero 
+    inhibitor concentration, and the data points of each inhibitor exclude those with Drop=1.
+
+    Return [expts_no_I, expts_plot_no_I, expts_inhibitor], where expts_inhibitor is a dict of 
+    {inhibitor: [expts, expts_plot]}, similar to load_data_no_inhibitor and load_data_one_inhibitor
+    """
+    df = _read_csv_cached(input_file, cache_dir)
+    cols = _plate_data_columns(df)
+    ID = np.asarray(df['Inhibitor_ID']).astype(str)
+    if 'Drop' in df.columns:
+        drop = np.asarray(df['Drop'], dtype=np.float64)==1
+    else:
+        drop = np.zeros(len(df), dtype=bool)
+
+    if inhibitor_list is None:
+        inhibitor_list = np.unique(ID[cols['Itot']>0])
+    else:
+        inhibitor_list = np.unique(inhibitor_list)
+
+    expts_no_I, expts_plot_no_I = _experiments_no_inhibitor(cols, _group_plate_enzyme(df, np.where(cols['Itot']==0)[0]), multi_var)
+
+    ## One groupby over (inhibitor, plate, enzyme) for all inhibitors
+    rows = np.where(np.isin(ID, inhibitor_list)*(~drop))[0]
+    groups = pd.DataFrame({'ID': ID[rows], 'Plate': np.asarray(df['Plate'])[rows],
+                           'Enzyme': np.asarray(df['Enzyme (nM)'])[rows]}).groupby(['ID', 'Plate', 'Enzyme'], sort=True).indices
+    inhibitor_groups = {}
+    for key in sorted(groups.keys()):
+        (name, plate, conc_enzyme) = key
+        inhibitor_groups.setdefault(name, {}).setdefault(plate, []).append([conc_enzyme, rows[groups[key]]])
+
+    expts_inhibitor = {}
+    for name in inhibitor_list:
+        expts_inhibitor[name] = _experiments_one_inhibitor(cols, inhibitor_groups.get(name, {}), name, multi_var)
+
+    return [expts_no_I, expts_plot_no_I, expts_inhibitor]
@@ -1,7 +1,11 @@
 import os
+import json
+import time
 import pickle
+import numpy as np
 
-import arviz as az
+from _lazy_import import lazy_import
+az = lazy_import('arviz')
 
 import jax
 import jax.numpy as jnp
@@ -10,11 +14,200 @@ import jax.random as random
 
 import numpyro
 from numpyro.infer import MCMC, NUTS, init_to_value
+from numpyro.infer.util import initialize_model
+from numpyro.diagnostics import print_summary
 
 from _plotting import plotting_trace
 from _model import global_fitting, EI_fitting
+from _online_diagnostics import OnlineDiagnostics
+from _adaptation import _save_adaptation_profile, _load_adaptation_profile, _sampling_efficiency
+from _reparam import LoopReparam, _decorrelated_init_values, _is_decorrelated_site
+from _chain_method import _select_chain_method
+from _timing import _timed
 
+EXTRA_FIELDS = ('potential_energy', 'diverging', 'num_steps')
 
+
+def _block_dense_mass(model, rng_key, init_strategy=None, **model_kwargs):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    rng_key         : random key to initialize the model
+    init_strategy   : initialization strategy of the fit
+    model_kwargs    : arguments of the model, e.g. experiments, prior_infor, shared_params, args
+    ----------
+    The kinetic parameters (logK, kcat) of each enzyme are grouped in one dense block, the global kinetic 
+    parameters in another block. The other parameters (alpha, dE, log_sigma) have a diagonal mass matrix.
+
+    Return list of tuples of site names for the dense_mass argument of NUTS
+    """
+    if init_strategy is None:
+        model_info = initialize_model(rng_key, model, model_kwargs=model_kwargs)
+    else:
+        model_info = initialize_model(rng_key, model, init_strategy=init_strategy, model_kwargs=model_kwargs)
+
+    blocks = {}
+    for site in sorted(model_info.param_info.z.keys()):
+        name, sep, idx = site.partition(':')
+        if name.startswith('logK') or name.startswith('kcat'):
+            blocks.setdefault(idx, []).append(site)
+    return [tuple(blocks[idx]) for idx in sorted(blocks.keys())]
+
+
+def _nuts_kernel(model, init_values, rng_key, args, **model_kwargs):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    init_values     : dict, initial value for model fitting, None if not available
+    rng_key         : random key to initialize the model if there is an adaptation profile
+    args            : class comprises other model arguments. For more information, check _define_model.py
+    model_kwargs    : other arguments of the model, e.g. experiments, prior_infor, shared_params
+    ----------
+    If args.decorrelate_logK, logK_I_DI and logK_S_DI are sampled decorrelated from logK_I_D (see _reparam.py).
+
+    The mass matrix is diagonal, dense or dense for the kinetic parameters of each enzyme (args.dense_mass is
+    'diag', 'dense' or 'block'). If args.adaptation_file is given, the step size and the mass matrix of NUTS
+    start from this profile instead (see _adaptation.py), so that a shorter warm-up (args.nburn) can be used.
+
+    Return NUTS kernel
+    """
+    if getattr(args, 'decorrelate_logK', False):
+        if not init_values is None:
+            init_values = _decorrelated_init_values(model, init_values, args=args, **model_kwargs)
+        model = LoopReparam(model)
+
+    if not init_values is None:
+        init_strategy = init_to_value(values=init_values)
+    else:
+        init_strategy = None
+
+    dense_mass = getattr(args, 'dense_mass', 'diag')
+    assert dense_mass in ['diag', 'dense', 'block'], "dense_mass should be diag, dense or block."
+
+    adaptation_file = getattr(args, 'adaptation_file', '')
+    if adaptation_file is not None and len(adaptation_file)>0:
+        ## The structure of the mass matrix is given by the profile
+        nuts_kwargs = _load_adaptation_profile(adaptation_file, model, rng_key, init_strategy=init_strategy,
+                                               args=args, **model_kwargs)
+    elif dense_mass == 'dense':
+        nuts_kwargs = {'dense_mass': True}
+    elif dense_mass == 'block':
+        nuts_kwargs = {'dense_mass': _block_dense_mass(model, rng_key, init_strategy=init_strategy,
+                                                       args=args, **model_kwargs)}
+    else:
+        nuts_kwargs = {}
+
+    if not init_strategy is None:
+        return NUTS(model=model, init_strategy=init_strategy, **nuts_kwargs)
+    else:
+        return NUTS(model, **nuts_kwargs)
+
+
+def _mcmc_sampling(kernel, rng_key, last_state, args, out_dir='', **model_kwargs):
+    """
+    Parameters:
+    ----------
+    kernel          : numpyro kernel, e.g. NUTS
+    rng_key         : random key to start the sampling if there is no last state
+    last_state      : state of the last running mcmc, None if starting from the warm-up
+    args            : class comprises other model arguments. For more information, check _define_model.py
+    out_dir         : str, directory to save the status.json file
+    model_kwargs    : other arguments of the model, e.g. experiments, prior_infor, shared_params
+    ----------
+    Running mcmc by chunks of args.status_every samples per chain. After each chunk, the running statistics
+    (mean, sd, R-hat, ESS) are updated and reported in status.json, so that the convergence can be checked 
+    without loading the traces. If args.status_every is 0, all samples are drawn at once.
+
+    The potential energy (negative log joint in the unconstrained space), divergence and number of steps 
+    of each sample are collected as extra fields.
+
+    The chains are run parallel, sequential or vectorized given args.chain_method (see _chain_method.py).
+    Each run is timed as the 'warmup+sampling' phase, or 'sampling' if it continues from the last state
+    (see _timing.py).
+
+    Return the samples grouped by chain, the extra fields grouped by chain and the last state of the sampler
+    """
+    status_every = getattr(args, 'status_every', 0)
+    if status_every is None or status_every <= 0 or status_every >= args.niters:
+        chunk_sizes = [args.niters]
+    else:
+        chunk_sizes = [status_every]*(args.niters//status_every)
+        if args.niters%status_every > 0:
+            chunk_sizes.append(args.niters%status_every)
+
+    status_file = os.path.join(out_dir, 'status.json')
+    diagnostics = OnlineDiagnostics(nchain=args.nchain)
+    diagnostics.write_status(status_file, niters=args.niters, nburn=args.nburn, phase='warmup')
+
+    samples = []
+    extra_fields = []
+    mcmc_dict = {}
+    chain_method = _select_chain_method(kernel.model, rng_key, args, **model_kwargs)
+    start_time = time.time()
+    start_cpu_time = time.process_time()
+    for n, num_samples in enumerate(chunk_sizes):
+        ## The compiled sampler is reused for the chunks of the same size
+        if not num_samples in mcmc_dict:
+            mcmc_dict[num_samples] = MCMC(kernel, num_warmup=args.nburn, num_samples=num_samples, 
+                                          num_chains=args.nchain, chain_method=chain_method, progress_bar=True)
+        mcmc = mcmc_dict[num_samples]
+        if last_state is not None:
+            mcmc.post_warmup_state = last_state
+            with _timed('sampling'):
+                mcmc.run(last_state.rng_key, args=args, extra_fields=EXTRA_FIELDS, **model_kwargs)
+                jax.block_until_ready(mcmc.last_state)
+        else:
+            with _timed('warmup+sampling'):
+                mcmc.run(rng_key, args=args, extra_fields=EXTRA_FIELDS, **model_kwargs)
+                jax.block_until_ready(mcmc.last_state)
+        last_state = mcmc.last_state
+
+        chunk = jax.device_get(mcmc.get_samples(group_by_chain=True))
+        chunk = {key: chunk[key] for key in chunk.keys() if not _is_decorrelated_site(key)}
+        samples.append(chunk)
+        extra_fields.append(jax.device_get(mcmc.get_extra_fields(group_by_chain=True)))
+
+        diagnostics.update(chunk)
+        if n < len(chunk_sizes)-1:
+            diagnostics.write_status(status_file, niters=args.niters, nburn=args.nburn, phase='sampling')
+    diagnostics.write_status(status_file, niters=args.niters, nburn=args.nburn, phase='finished')
+    elapsed_time = time.time() - start_time
+    cpu_time = time.process_time() - start_cpu_time
+
+    if len(chunk_sizes) == 1:
+        mcmc.print_summary()
+        trace_group = samples[0]
+        extra_fields_group = extra_fields[0]
+    else:
+        trace_group = {key: np.concatenate([chunk[key] for chunk in samples], axis=1) for key in samples[0].keys()}
+        extra_fields_group = {key: np.concatenate([chunk[key] for chunk in extra_fields], axis=1) for key in extra_fields[0].keys()}
+        print_summary(trace_group)
+        print("Number of divergences: %d" %np.sum(extra_fields_group['diverging']))
+
+    ## ESS per second of the fit, compared to the fit of the adaptation profile if it was used
+    adaptation_file = getattr(args, 'adaptation_file', '')
+    if adaptation_file is not None and len(adaptation_file)>0:
+        reference = json.load(open(adaptation_file))['sampling_efficiency']
+    else:
+        reference = None
+    efficiency = _sampling_efficiency(trace_group, extra_fields_group, elapsed_time, args, reference=reference,
+                                      cpu_time=cpu_time, chain_method=chain_method)
+    with open(os.path.join(out_dir, 'sampling_efficiency.json'), 'w') as f:
+        json.dump(efficiency, f, indent=2)
+    if 'gain_ess_min_per_second' in efficiency:
+        print("ESS per second: %0.3f, gain compared to the adaptation profile: %0.2f" 
+              %(efficiency['ess_min_per_second'], efficiency['gain_ess_min_per_second']))
+
+    if getattr(args, 'save_adaptation', False):
+        print("Saving adaptation profile.")
+        _save_adaptation_profile(last_state, os.path.join(out_dir, 'Adaptation_profile.json'), efficiency)
+
+    return trace_group, extra_fields_group, last_state
+
+
+@_timed('mcmc')
 def _run_mcmc(expts, prior_infor, shared_params, init_values, args):
     """
     Parameters:
@@ -37,47 +230,42 @@ def _run_mcmc(expts, prior_infor, shared_params, init_values, args):
     traces_name = args.traces_name
 
     if not os.path.isfile(traces_name+'.pickle'):
-        if not init_values is None:
-            kernel = NUTS(model=global_fitting, init_strategy=init_to_value(values=init_values))
-        else:
-            kernel = NUTS(global_fitting)
+        kernel = _nuts_kernel(global_fitting, init_values, rng_key, args, experiments=expts, prior_infor=prior_infor,
+                              shared_params=shared_params)
 
         if os.path.isfile(os.path.join(args.last_run_dir, "Last_state.pickle")):
             last_state = pickle.load(open(os.path.join(args.last_run_dir, "Last_state.pickle"), "rb"))
             print("\nKeep running from last state.")
-            mcmc = MCMC(kernel, num_warmup=args.nburn, num_samples=args.niters, num_chains=args.nchain, progress_bar=True)
-            mcmc.post_warmup_state = last_state
-            mcmc.run(mcmc.post_warmup_state.rng_key, experiments=expts, 
-                     prior_infor=prior_infor, shared_params=shared_params, args=args)
         else:
-            mcmc = MCMC(kernel, num_warmup=args.nburn, num_samples=args.niters, num_chains=args.nchain, progress_bar=True)
-            mcmc.run(rng_key_, experiments=expts, prior_infor=prior_infor, shared_params=shared_params, args=args)
-        
-        mcmc.print_summary()
+            last_state = None
+
+        trace_group, extra_fields, last_state = _mcmc_sampling(kernel, rng_key_, last_state, args, out_dir=args.out_dir,
+                                                               experiments=expts, prior_infor=prior_infor, 
+                                                               shared_params=shared_params)
 
         print("Saving last state.")
-        mcmc.post_warmup_state = mcmc.last_state
-        pickle.dump(jax.device_get(mcmc.post_warmup_state), open("Last_state.pickle", "wb"))
+        pickle.dump(jax.device_get(last_state), open("Last_state.pickle", "wb"))
 
-        trace = mcmc.get_samples(group_by_chain=False)
+        trace = {key: np.reshape(trace_group[key], (-1, )+trace_group[key].shape[2:]) for key in trace_group.keys()}
         pickle.dump(trace, open(os.path.join(traces_name+'.pickle'), "wb"))
 
+        extra_fields = {key: np.reshape(extra_fields[key], (-1, )+extra_fields[key].shape[2:]) for key in extra_fields.keys()}
+        pickle.dump(extra_fields, open(os.path.join(traces_name+'_extra_fields.pickle'), "wb"))
+
         if not os.path.isdir('Trace_plot'):
             os.mkdir('Trace_plot')
 
         ## Trace and autocorrelation plots
         plotting_trace(trace=trace, out_dir=os.path.join(args.out_dir, 'Trace_plot'), nchain=args.nchain)
 
-        trace = mcmc.get_samples(group_by_chain=True)
-        az.summary(trace).to_csv(traces_name+"_summary.csv")
-
-        trace = mcmc.get_samples(group_by_chain=False)
+        az.summary(trace_group).to_csv(traces_name+"_summary.csv")
     else:
         trace = pickle.load(open(traces_name+'.pickle', "rb"))
 
     return trace
 
 
+@_timed('mcmc')
 def _run_mcmc_EI(expts, prior_infor, shared_params, init_values, args):
     """
     Parameters:
@@ -100,41 +288,35 @@ def _run_mcmc_EI(expts, prior_infor, shared_params, init_values, args):
     traces_name = args.traces_name
 
     if not os.path.isfile(traces_name+'.pickle'):
-        if not init_values is None:
-            kernel = NUTS(model=EI_fitting, init_strategy=init_to_value(values=init_values))
-        else:
-            kernel = NUTS(EI_fitting)
+        kernel = _nuts_kernel(EI_fitting, init_values, rng_key, args, experiments=expts, prior_infor=prior_infor,
+                              shared_params=shared_params)
 
         if os.path.isfile(os.path.join(args.last_run_dir, "Last_state.pickle")):
             last_state = pickle.load(open(os.path.join(args.last_run_dir, "Last_state.pickle"), "rb"))
             print("\nKeep running from last state.")
-            mcmc = MCMC(kernel, num_warmup=args.nburn, num_samples=args.niters, num_chains=args.nchain, progress_bar=True)
-            mcmc.post_warmup_state = last_state
-            mcmc.run(mcmc.post_warmup_state.rng_key, experiments=expts, 
-                     prior_infor=prior_infor, shared_params=shared_params, args=args)
         else:
-            mcmc = MCMC(kernel, num_warmup=args.nburn, num_samples=args.niters, num_chains=args.nchain, progress_bar=True)
-            mcmc.run(rng_key_, experiments=expts, prior_infor=prior_infor, shared_params=shared_params, args=args)
-        
-        mcmc.print_summary()
+            last_state = None
+
+        trace_group, extra_fields, last_state = _mcmc_sampling(kernel, rng_key_, last_state, args, out_dir=args.out_dir,
+                                                               experiments=expts, prior_infor=prior_infor, 
+                                                               shared_params=shared_params)
 
         print("Saving last state.")
-        mcmc.post_warmup_state = mcmc.last_state
-        pickle.dump(jax.device_get(mcmc.post_warmup_state), open("Last_state.pickle", "wb"))
+        pickle.dump(jax.device_get(last_state), open("Last_state.pickle", "wb"))
 
-        trace = mcmc.get_samples(group_by_chain=False)
+        trace = {key: np.reshape(trace_group[key], (-1, )+trace_group[key].shape[2:]) for key in trace_group.keys()}
         pickle.dump(trace, open(os.path.join(traces_name+'.pickle'), "wb"))
 
+        extra_fields = {key: np.reshape(extra_fields[key], (-1, )+extra_fields[key].shape[2:]) for key in extra_fields.keys()}
+        pickle.dump(extra_fields, open(os.path.join(traces_name+'_extra_fields.pickle'), "wb"))
+
         if not os.path.isdir('Trace_plot'):
             os.mkdir('Trace_plot')
 
         ## Trace and autocorrelation plots
         plotting_trace(trace=trace, out_dir=os.path.join(args.out_dir, 'Trace_plot'), nchain=args.nchain)
 
-        trace = mcmc.get_samples(group_by_chain=True)
-        az.summary(trace).to_csv(traces_name+"_summary.csv")
-
-        trace = mcmc.get_samples(group_by_chain=False)
+        az.summary(trace_group).to_csv(traces_name+"_summary.csv")
     else:
         trace = pickle.load(open(traces_name+'.pickle', "rb"))
 
@@ -0,0 +1,174 @@
+"""
+Running convergence statistics of mcmc traces, updated chunk by chunk while sampling.
+
+The statistics are accumulated without keeping the samples in memory:
+    - Welford/Chan updates of the mean and the sum of squared deviations for each chain,
+    - batch means to estimate the autocorrelation time and the effective sample size,
+    - Gelman-Rubin R-hat from the within-chain and between-chain variances.
+"""
+import os
+import json
+import time
+import numpy as np
+
+
+def _merge_moments(n_a, mean_a, M2_a, n_b, mean_b, M2_b):
+    """
+    Parameters:
+    ----------
+    n_a, mean_a, M2_a : number of samples, mean, sum of squared deviations of the accumulated samples
+    n_b, mean_b, M2_b : number of samples, mean, sum of squared deviations of the new samples
+    ----------
+    Return the number of samples, mean and sum of squared deviations of the combined samples (Chan et al.)
+    """
+    n = n_a + n_b
+    if n_a == 0:
+        return n_b, mean_b, M2_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta*n_b/n
+    M2 = M2_a + M2_b + delta**2*n_a*n_b/n
+    return n, mean, M2
+
+
+class OnlineDiagnostics:
+    """
+    Running mean, variance, R-hat and ESS of each parameter given chunks of samples grouped by chain.
+
+    Parameters:
+    ----------
+    nchain      : int, number of chains
+    batch_size  : int, number of consecutive samples used for each batch mean
+    ----------
+    """
+    def __init__(self, nchain=4, batch_size=50):
+        self.nchain = nchain
+        self.batch_size = batch_size
+        self.nsample = 0
+        self.mean = {}
+        self.M2 = {}
+        self.nbatch = 0
+        self.batch_mean = {}
+        self.batch_M2 = {}
+        self._remainder = {}
+        self._start_time = time.time()
+
+    def update(self, samples):
+        """
+        Parameters:
+        ----------
+        samples     : dict of arrays with the shape of (nchain, nsample) or (nchain, nsample, ...)
+        ----------
+        Update the running statistics with the new chunk of samples
+        """
+        n_new = None
+        nbatch_new = 0
+        for key in samples.keys():
+            x = np.asarray(samples[key], dtype=np.float64)
+            x = np.reshape(x, x.shape[:2]+(-1,))
+            n_b = x.shape[1]
+            n_new = n_b
+
+            if key in self.mean:
+                _, self.mean[key], self.M2[key] = _merge_moments(self.nsample, self.mean[key], self.M2[key],
+                                                                 n_b, x.mean(axis=1), ((x-x.mean(axis=1, keepdims=True))**2).sum(axis=1))
+            else:
+                self.mean[key] = x.mean(axis=1)
+                self.M2[key] = ((x-self.mean[key][:, None])**2).sum(axis=1)
+
+            ## Batch means, the samples not filling a batch are kept for the next chunk
+            if key in self._remainder:
+                x = np.concatenate([self._remainder[key], x], axis=1)
+            nbatch_new = x.shape[1]//self.batch_size
+            n_used = nbatch_new*self.batch_size
+            self._remainder[key] = x[:, n_used:]
+            if nbatch_new > 0:
+                means = x[:, :n_used].reshape(x.shape[0], nbatch_new, self.batch_size, -1).mean(axis=2)
+                means_avg = means.mean(axis=1)
+                means_M2 = ((means-means_avg[:, None])**2).sum(axis=1)
+                if key in self.batch_mean:
+                    _, self.batch_mean[key], self.batch_M2[key] = _merge_moments(self.nbatch, self.batch_mean[key], self.batch_M2[key],
+                                                                                 nbatch_new, means_avg, means_M2)
+                else:
+                    self.batch_mean[key] = means_avg
+                    self.batch_M2[key] = means_M2
+
+        if n_new is not None:
+            self.nsample += n_new
+            self.nbatch += nbatch_new
+
+    def rhat(self, key):
+        """
+        Return the Gelman-Rubin R-hat of one parameter, nan if only one chain or one sample is available
+        """
+        n = self.nsample
+        if self.nchain < 2 or n < 2:
+            return np.full(self.mean[key].shape[1:], np.nan)
+        W = (self.M2[key]/(n-1)).mean(axis=0)
+        B_over_n = self.mean[key].var(axis=0, ddof=1)
+        var_plus = (n-1)/n*W + B_over_n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(var_plus/W)
+
+    def ess(self, key):
+        """
+        Return the effective sample size of one parameter estimated by batch means, nan if less than two batches
+        """
+        if self.nbatch < 2:
+            return np.full(self.mean[key].shape[1:], np.nan)
+        var = self.M2[key]/(self.nsample-1)
+        var_batch = self.batch_size*self.batch_M2[key]/(self.nbatch-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tau = var_batch/var
+            ess_chain = np.where(var > 0, self.nsample/np.maximum(tau, 1./self.batch_size), np.nan)
+        return ess_chain.sum(axis=0)
+
+    def summary(self):
+        """
+        Return dict of mean, sd, rhat and ess of each parameter
+        """
+        summary = {}
+        n = self.nsample
+        for key in self.mean.keys():
+            mean = self.mean[key].mean(axis=0)
+            if n > 1:
+                ## Pooled variance of all chains
+                sd =np.sqrt((self.M2[key].sum(axis=0) + n*((self.mean[key]-mean)**2).sum(axis=0))/(self.mean[key].shape[0]*n-1))
+            else:
+                sd = np.full(mean.shape, np.nan)
+            rhat = self.rhat(key)
+            ess = self.ess(key)
+            if mean.shape == (1, ):
+                summary[key] = {'mean': float(mean[0]), 'sd': float(sd[0]), 'rhat': float(rhat[0]), 'ess': float(ess[0])}
+            else:
+                for i in range(len(mean)):
+                    summary[key+'['+str(i)+']'] = {'mean': float(mean[i]), 'sd': float(sd[i]),
+                                                   'rhat': float(rhat[i]), 'ess': float(ess[i])}
+        return summary
+
+    def write_status(self, status_file, **kwargs):
+        """
+        Parameters:
+        ----------
+        status_file : str, json file to report the running statistics
+        kwargs      : other information of the run to be reported, e.g. niters, nburn, phase
+        ----------
+        The file is replaced atomically so that it can be read at any time while sampling.
+        """
+        summary = self.summary()
+        rhats = [val['rhat'] for val in summary.values() if np.isfinite(val['rhat'])]
+        esss = [val['ess'] for val in summary.values() if np.isfinite(val['ess'])]
+
+        status = {'nchain': self.nchain, 'nsample_per_chain': self.nsample,
+                  'elapsed_time': time.time()-self._start_time,
+                  'updated': time.strftime("%Y-%m-%d %H:%M:%S"),
+                  'max_rhat': max(rhats) if len(rhats)>0 else None,
+                  'min_ess': min(esss) if len(esss)>0 else None}
+        status.update(kwargs)
+        if 'niters' in kwargs and kwargs['niters']>0:
+            status['progress'] = self.nsample/kwargs['niters']
+        status['params'] = {key: {k: (v if np.isfinite(v) else None) for k, v in val.items()} for key, val in summary.items()}
+
+        temp_file = status_file+'.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(temp_file, status_file)
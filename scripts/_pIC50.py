@@ -2,17 +2,25 @@ import numpy as np
 import jax
 import jax.numpy as jnp
 from jax import vmap
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+import time
+import sys
 import os
 import pandas as pd
 import pickle
-import arviz as az
 from scipy.optimize import minimize, curve_fit
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+from _lazy_import import lazy_import
+az = lazy_import('arviz')
+plt = lazy_import('matplotlib.pyplot')
+sns = lazy_import('seaborn')
 
 from _chemical_reactions import ChemicalReactions
 from _kinetics import ReactionRate_DimerOnly
+from _adaptive_grid import _adaptive_grid
+from _timing import _timed
 
 
 def f_curve_vec(x, R_b, R_t, x_50, H):
@@ -136,6 +144,119 @@ def f_parameter_estimation(x, y):
         return [0, 0, 0, 0, 0]
 
 
+def _f_curve_residual_jacobian(x, ys, thetas):
+    """
+    Residuals and Jacobian of the dose-response curve function for multiple curves
+
+    Parameters:
+    ----------
+    x       : vector of log10 concentration
+    ys      : array (ncurves, npoints) of responses
+    thetas  : array (ncurves, 4) of parameters (bottom response, top response, logIC50, hill slope)
+    ----------
+    return residuals (ncurves, npoints) and Jacobian (ncurves, npoints, 4)
+    """
+    [Rb, Rt, x50, H] = [thetas[:, [i]] for i in range(4)]
+    u = np.log(10)*H*(x[None, :]-x50)
+    s = 0.5*(1-np.tanh(u/2)) # 1/(1+10**(H*(x-x50))), stable for large |u|
+    ds = s*(1-s)*np.log(10)*(Rt-Rb)
+    residuals = Rb + (Rt-Rb)*s - ys
+    jacobian = np.empty(s.shape+(4, ))
+    jacobian[:, :, 0] = 1-s
+    jacobian[:, :, 1] = s
+    jacobian[:, :, 2] = ds*H
+    jacobian[:, :, 3] = -ds*(x[None, :]-x50)
+    return residuals, jacobian
+
+
+def f_parameter_estimation_batch(x, ys, maxiter=200, tol=1e-10):
+    """
+    Fitting non-linear regression for multiple concentration-response datasets at once and estimate 4 parameters.
+    The initial values and boundaries of parameters are similar to f_parameter_estimation. All curves are fitted 
+    together by Levenberg-Marquardt steps projected on the boundaries.
+    
+    Parameters:
+    ----------
+    x         : vector of log10 concentration
+    ys        : array (ncurves, npoints) of responses
+    maxiter   : maximum number of iterations
+    tol       : relative tolerance of the sum of squared residuals for convergence
+    ----------
+    return array (ncurves, 5) of Rb, Rt, pIC50, hill slope and pIC90. 
+    The curves that failed to converge have all values equal to 0, similar to f_parameter_estimation.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    ys = np.atleast_2d(np.asarray(ys, dtype=np.float64))
+    assert ys.shape[1]==len(x), print("Vectors of concentration and data should have the same length.")
+    ncurves = ys.shape[0]
+
+    min_y = np.min(ys, axis=1)
+    max_y = np.max(ys, axis=1)
+    range_y = max_y - min_y
+    ones = np.ones(ncurves)
+
+    thetas = np.stack([min_y, max_y, x[np.argmin(np.square(ys-np.mean(ys, axis=1, keepdims=True)), axis=1)], ones], axis=1)
+    upper = np.stack([min_y + 0.25*range_y, max_y + 0.25*range_y, 0*ones, 20*ones], axis=1)
+    lower = np.stack([min_y - 0.25*range_y, max_y - 0.25*range_y, -20*ones, -20*ones], axis=1)
+    thetas = np.clip(thetas, lower, upper)
+
+    valid = (range_y>0)*np.all(np.isfinite(ys), axis=1)
+    converged = ~valid
+    damping = np.full(ncurves, 1E-3)
+
+    residuals, jacobian = _f_curve_residual_jacobian(x, ys, thetas)
+    cost = 0.5*np.sum(residuals**2, axis=1)
+
+    for _ in range(maxiter):
+        active = ~converged
+        if not np.any(active):
+            break
+
+        jacobian_T = np.swapaxes(jacobian[active], 1, 2)
+        JTJ = np.matmul(jacobian_T, jacobian[active])
+        grad = np.matmul(jacobian_T, residuals[active][:, :, None])[:, :, 0]
+        diag = np.diagonal(JTJ, axis1=1, axis2=2) + 1E-12
+        A = JTJ + damping[active, None, None]*(diag[:, :, None]*np.eye(4)[None, :, :])
+
+        # Parameters at the boundaries and pushed outward are kept fixed for this step
+        fixed = ((thetas[active]<=lower[active])*(grad>0)) + ((thetas[active]>=upper[active])*(grad<0))
+        free = (~fixed).astype(np.float64)
+        A = A*free[:, :, None]*free[:, None, :] + (1-free)[:, :, None]*np.eye(4)[None, :, :]
+        grad = grad*free
+        try:
+            step = -np.linalg.solve(A, grad[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            step = -np.matmul(np.linalg.pinv(A), grad[:, :, None])[:, :, 0]
+
+        thetas_new = np.clip(thetas[active]+step, lower[active], upper[active])
+        residuals_new, jacobian_new = _f_curve_residual_jacobian(x, ys[active], thetas_new)
+        cost_new = 0.5*np.sum(residuals_new**2, axis=1)
+
+        cost_old = cost[active]
+        improved = np.isfinite(cost_new)*(cost_new<cost_old)
+        idx = np.where(active)[0]
+        idx_improved = idx[improved]
+
+        thetas[idx_improved] = thetas_new[improved]
+        residuals[idx_improved] = residuals_new[improved]
+        jacobian[idx_improved] = jacobian_new[improved]
+        cost[idx_improved] = cost_new[improved]
+        damping[idx] = np.where(improved, damping[idx]/3, damping[idx]*3)
+
+        # Converged if the decrease of cost is negligible, or no better step can be found
+        small_decrease = improved*((cost_old-cost_new) <= tol*(cost_old+1E-30))
+        no_step = (~improved)*(damping[idx]>1E10)
+        converged[idx[small_decrease+no_step]] = True
+
+    success = converged*valid*np.all(np.isfinite(thetas), axis=1)
+    [Rb, Rt, x50, H] = thetas.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pIC90 = np.where(H!=0, f_pIC90(-x50, H), 0)
+    results = np.stack([Rb, Rt, -x50, H, pIC90], axis=1)
+    results[~success] = 0
+    return results
+
+
 def _adjust_trace(dat, logK_dE_alpha):
     """
     Adjust trace by values from MAP
@@ -154,7 +275,8 @@ def _adjust_trace(dat, logK_dE_alpha):
     return dat
 
 
-def _pIC_hill(df, logDtot, logStot, logItot):
+@_timed('pIC50')
+def _pIC_hill(df, logDtot, logStot, logItot, batch=True, adaptive=False):
     """
     The function first simulates the dimer-only concentration-response curve (CRC) from mcmc trace, 
     then estimate the pIC50 and hill slopes for each CRC
@@ -165,28 +287,125 @@ def _pIC_hill(df, logDtot, logStot, logItot):
     logDtot   : vector of dimer concentration
     logStot   : vector of substrate concentration
     logItot   : vector of inhibitor concentration
+    batch     : bool, fitting all CRCs at once by f_parameter_estimation_batch, 
+                otherwise fitting each CRC by f_parameter_estimation
+    adaptive  : bool, replacing logItot by a grid of the same range and length, which is dense
+                around the transitions of the CRCs (_adaptive_grid)
     ----------
     return list of 5 parameters
     """
 
-    f_v = vmap(lambda logK_S_D, logK_S_DS, logK_I_D, logK_I_DI, logK_S_DI, kcat_DS, kcat_DSI, kcat_DSS: ReactionRate_DimerOnly(logDtot, logStot, logItot, logK_S_D, logK_S_DS, logK_I_D, logK_I_DI, logK_S_DI, kcat_DS, kcat_DSI, kcat_DSS))
-    v_sim = f_v(jnp.array(df.logK_S_D), jnp.array(df.logK_S_DS), jnp.array(df.logK_I_D), jnp.array(df.logK_I_DI), jnp.array(df.logK_S_DI), jnp.array(df.kcat_DS), jnp.array(df.kcat_DSI), jnp.array(df.kcat_DSS))
+    params = [jnp.array(df.logK_S_D), jnp.array(df.logK_S_DS), jnp.array(df.logK_I_D), jnp.array(df.logK_I_DI), jnp.array(df.logK_S_DI), jnp.array(df.kcat_DS), jnp.array(df.kcat_DSI), jnp.array(df.kcat_DSS)]
+    f_v = lambda logD, logS, logI: vmap(lambda logK_S_D, logK_S_DS, logK_I_D, logK_I_DI, logK_S_DI, kcat_DS, kcat_DSI, kcat_DSS: ReactionRate_DimerOnly(logD, logS, logI, logK_S_D, logK_S_DS, logK_I_D, logK_I_DI, logK_S_DI, kcat_DS, kcat_DSI, kcat_DSS))(*params)
 
-    v_min = [jnp.min(v) for v in v_sim]
-    v_max = [jnp.max(v) for v in v_sim]
+    if adaptive:
+        f_coarse = lambda logI: np.array(f_v(logDtot[0]*np.ones(len(logI)), logStot[0]*np.ones(len(logI)), logI))
+        logItot = _adaptive_grid(f_coarse, np.min(logItot), np.max(logItot), len(logItot))
+    v_sim = f_v(logDtot, logStot, logItot)
+
+    v_min = jnp.min(v_sim, axis=1)
+    v_max = jnp.max(v_sim, axis=1)
 
     f_scaling = vmap(lambda v, _min, _max: (v - _min)/(_max - _min)*100)
     x = np.log10(np.exp(logItot))
-    ys = f_scaling(v_sim, np.array(v_min), np.array(v_max))
+    ys = np.array(f_scaling(v_sim, v_min, v_max))
 
-    f_theta = lambda y: f_parameter_estimation(x, np.array(y))
-    thetas = np.array(list(map(f_theta, ys)))
+    if batch:
+        thetas = f_parameter_estimation_batch(x, ys)
+    else:
+        f_theta = lambda y: f_parameter_estimation(x, np.array(y))
+        thetas = np.array(list(map(f_theta, ys)))
 
     return thetas.T
 
 
+@partial(jax.jit, static_argnames=['niters'])
+def _f_pIC_direct(logD, logS, x_min, x_max, params, niters=30):
+    """
+    Bisection on the normalized dimer-only reaction rate for one sample of mcmc trace, see _pIC_direct.
+    The normalized rate is 1 at x_min and 0 at x_max (log10 of inhibitor concentration).
+
+    return log10 of IC50, log10 of IC90, hill slope, and the difference between the top and bottom rates
+    """
+    targets = jnp.array([0.5, 0.1])
+    ones = jnp.ones(len(targets))
+
+    f_v = lambda x: ReactionRate_DimerOnly(logD*ones, logS*ones, x*jnp.log(10), *params)
+    [v_top, v_bottom] = f_v(jnp.array([x_min, x_max]))
+    f_norm = lambda x: (f_v(x) - v_bottom)/(v_top - v_bottom)
+
+    ## Bisection for both targets at once
+    def body(i, bracket):
+        [lower, upper] = bracket
+        mid = (lower + upper)/2
+        above = f_norm(mid) > targets
+        return [jnp.where(above, mid, lower), jnp.where(above, upper, mid)]
+    [lower, upper] = jax.lax.fori_loop(0, niters, body, [x_min*ones, x_max*ones])
+    [x50, x90] = (lower + upper)/2
+
+    hill = -4/jnp.log(10)*jax.grad(lambda x: f_norm(x*ones)[0])(x50)
+    return jnp.array([x50, x90, hill, v_top - v_bottom])
+
+
+def _pIC_direct(df, logDtot, logStot, logItot, niters=30):
+    """
+    The function finds the inhibitor concentrations at which the normalized dimer-only reaction rate is 
+    50% and 10% of the uninhibited rate by bisection on the rate model for all samples of mcmc trace. 
+    The reaction rate is normalized by the rates at the lowest and highest inhibitor concentrations. 
+    The hill slope is obtained from the derivative of the normalized rate at IC50:
+        d(rate)/d(log10[I]) = -ln(10)*hill/4
+    
+    Parameters:
+    ----------
+    df        : dataframe, each row corresponding to one set of parameter from mcmc trace
+    logDtot   : vector of dimer concentration
+    logStot   : vector of substrate concentration
+    logItot   : vector of inhibitor concentration, the first and last values are used as the bracket
+    niters    : number of bisection steps, the precision of pIC50 is (range of log10[I])/2**niters
+    ----------
+    return list of 5 parameters similar to _pIC_hill, the bottom and top responses are 0 and 100 
+    and the samples without inhibition have all values equal to 0.
+    """
+    x_min = np.log10(np.exp(np.min(logItot)))
+    x_max = np.log10(np.exp(np.max(logItot)))
+
+    names = ['logK_S_D', 'logK_S_DS', 'logK_I_D', 'logK_I_DI', 'logK_S_DI', 'kcat_DS', 'kcat_DSI', 'kcat_DSS']
+    params = [jnp.array(df[name], dtype=jnp.float64) for name in names]
+    f_direct = vmap(_f_pIC_direct, in_axes=(None, None, None, None, 0, None))
+    [x50, x90, hill, dv] = np.array(f_direct(logDtot[0], logStot[0], x_min, x_max, params, niters)).T
+
+    success = (dv!=0)*np.isfinite(x50)*np.isfinite(x90)*np.isfinite(hill)
+    thetas = np.stack([np.zeros(len(x50)), np.full(len(x50), 100.), -x50, hill, -x90])
+    thetas[:, ~success] = 0
+    return thetas
+
+
+def _pIC(df, logDtot, logStot, logItot, method='hill', adaptive=False):
+    """
+    Estimating pIC50, hill slope and pIC90 for each sample of mcmc trace
+
+    Parameters:
+    ----------
+    df        : dataframe, each row corresponding to one set of parameter from mcmc trace
+    logDtot   : vector of dimer concentration
+    logStot   : vector of substrate concentration
+    logItot   : vector of inhibitor concentration
+    method    : 'hill' to fit the hill equation to the simulated CRCs (_pIC_hill), 
+                'direct' to find the concentrations by bisection on the rate model (_pIC_direct)
+    adaptive  : bool, simulating the CRCs on the adaptive grid of inhibitor concentrations, for method='hill'
+    ----------
+    return list of 5 parameters
+    """
+    assert method in ['hill', 'direct'], print("Please check the method to estimate pIC50 again.")
+    if method == 'direct':
+        return _pIC_direct(df, logDtot, logStot, logItot)
+    else:
+        return _pIC_hill(df, logDtot, logStot, logItot, adaptive=adaptive)
+
+
 def table_pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot, 
-                                 logK_dE_alpha=None, trace_name='traces.pickle', OUTDIR=None):
+                                 logK_dE_alpha=None, trace_name='traces.pickle', OUTDIR=None, method='hill',
+                                 adaptive=False):
     """
     For one inhibitor, dimer-only pIC50s can be simulated given the specified values of 
     dimer/substrate concentrations and kinetic parameters from mcmc trace. 
@@ -200,6 +419,8 @@ def table_pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot,
     logItot         : vector of inhibitor concentration
     measure         : statistical measure, can be 'mean' or 'median'
     logK_dE_alpha   : dict, information of fixed logK, dE and alpha
+    method          : 'hill' or 'direct', method to estimate pIC50 (see _pIC)
+    adaptive        : bool, simulating the CRCs on the adaptive grid of inhibitor concentrations
     ----------
     return table of kinetic parameters, pIC50, and hill slope for each inhibitor
     """
@@ -218,7 +439,7 @@ def table_pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot,
     else:
         df = data.iloc[::nthin, :].copy()
 
-    thetas = _pIC_hill(df, logDtot, logStot, logItot)
+    thetas = _pIC(df, logDtot, logStot, logItot, method, adaptive)
     Rb_list = thetas[0]
     Rt_list = thetas[1]
     pIC50_list = thetas[2]
@@ -236,9 +457,13 @@ def table_pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot,
             os.makedirs(os.path.join(OUTDIR, 'Plot'))
 
         plt.figure()
+        if adaptive and np.sum(hill_list>0)>0:
+            f_curves = lambda x: np.array([f_curve_vec(x, Rb_list[i], Rt_list[i], -pIC50_list[i], hill_list[i]) for i in np.where(hill_list>0)[0]])
+            temp = _adaptive_grid(f_curves, np.log10(1E-12), np.log10(1E-3), 50)
+        else:
+            temp = np.linspace(np.log10(1E-12), np.log10(1E-3), 50)
         for i in range(len(pIC50_list)):
             if hill_list[i]>0:
-                temp = np.linspace(np.log10(1E-12), np.log10(1E-3), 50)
                 plt.plot(temp, f_curve_vec(temp, Rb_list[i], Rt_list[i], -pIC50_list[i], hill_list[i]), "-")
         plt.savefig(os.path.join('Plot', 'CRC_'+inhibitor_name))
 
@@ -246,6 +471,7 @@ def table_pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot,
         plt.figure()
         sns.kdeplot(data=df[df.hill>0], x='pIC50', shade=True, alpha=0.1);
         plt.savefig(os.path.join(OUTDIR, 'Plot', inhibitor_name))
+        plt.close('all')
 
     # df_inhibitor = df[['logK_I_D', 'logK_I_DI', 'logK_S_DI', 'pIC50', 'hill', 'pIC90']]
     # df_inhibitor = df_inhibitor[df_inhibitor.hill>0]
@@ -255,7 +481,8 @@ def table_pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot,
 
 
 def _pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot, measure='mean',
-                            logK_dE_alpha=None, trace_name='traces.pickle', OUTDIR=None):
+                            logK_dE_alpha=None, trace_name='traces.pickle', OUTDIR=None, method='hill',
+                            adaptive=False):
     """
     For one inhibitor, dimer-only pIC50s can be simulated given the specified values of 
     dimer/substrate concentrations and kinetic parameters from mcmc trace. 
@@ -269,21 +496,111 @@ def _pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot, meas
     logItot         : vector of inhibitor concentration
     measure         : statistical measure, can be 'mean' or 'median'
     logK_dE_alpha   : dict, information of fixed logK, dE and alpha
+    method          : 'hill' or 'direct', method to estimate pIC50 (see _pIC)
+    adaptive        : bool, simulating the CRCs on the adaptive grid of inhibitor concentrations
     ----------
     return mean/median of pIC50 and hill slope for each inhibitor
     """
     assert measure in ['mean', 'median'], print("Please check the statistical measure again.")
         
     df = table_pIC_hill_one_inhibitor(inhibitor, mcmc_dir, logDtot, logStot, logItot, 
-                                      logK_dE_alpha, trace_name, OUTDIR)
+                                      logK_dE_alpha, trace_name, OUTDIR, method, adaptive)
+    if df is None:
+        return tuple(np.nan*np.ones(6))
     if measure == 'mean':
         return np.mean(df.pIC50), np.std(df.pIC50), np.mean(df.hill), np.std(df.hill), np.mean(df.pIC90), np.std(df.pIC90), 
     else:
         return np.median(df.pIC50), np.std(df.pIC50), np.median(df.hill), np.std(df.hill), np.median(df.pIC90), np.std(df.pIC90), 
 
 
+def _init_worker():
+    jax.config.update("jax_enable_x64", True)
+
+
+def _run_one_inhibitor(f, inhibitor, args):
+    """
+    Running f(inhibitor, *args), return [result, error message]
+    """
+    try:
+        return [f(inhibitor, *args), None]
+    except Exception as e:
+        return [None, f"{type(e).__name__}: {e}"]
+
+
+def _map_inhibitors(f, inhibitor_list, args=(), nworkers=1, show_progress=True, script_path=None):
+    """
+    Applying a function to each inhibitor, serially or in a pool of processes
+
+    Parameters:
+    ----------
+    f               : function of (inhibitor, *args) defined at module level, e.g. _pIC_hill_one_inhibitor
+    inhibitor_list  : list of inhibitor
+    args            : other arguments of f
+    nworkers        : number of processes. The processes are started by spawn to avoid forking JAX,
+                      and at most 2*nworkers inhibitors are submitted at once to bound the memory.
+    show_progress   : bool, reporting the number of finished inhibitors and the estimated remaining time
+    script_path     : str, path of the running script, e.g. __file__ of run_pIC50.py. If it is the main module,
+                      it is hidden from the spawned processes so that they do not execute the script again.
+    ----------
+    The failure of one inhibitor is reported without stopping the others.
+
+    return list of results in the order of inhibitor_list, None for the failed inhibitors
+    """
+    N = len(inhibitor_list)
+    results = [None]*N
+    start = time.time()
+
+    def _report(n_done, i, error):
+        if error is not None:
+            print(f"Failed to analyze {inhibitor_list[i]}. {error}")
+        if show_progress:
+            elapsed = time.time()-start
+            print(f"{n_done}/{N} inhibitors, elapsed {elapsed:.0f} s, ETA {elapsed/n_done*(N-n_done):.0f} s")
+
+    if nworkers is None or nworkers <= 1 or N <= 1:
+        for i, inhibitor in enumerate(inhibitor_list):
+            [results[i], error] = _run_one_inhibitor(f, inhibitor, args)
+            _report(i+1, i, error)
+        return results
+
+    ## The running scripts are not importable, the spawned processes should not execute the script again
+    main_module = sys.modules['__main__']
+    main_file = getattr(main_module, '__file__', None)
+    main_attrs = {}
+    if script_path is not None and main_file is not None and os.path.isfile(main_file) and os.path.samefile(main_file, script_path):
+        main_attrs = {'__file__': main_file, '__spec__': getattr(main_module, '__spec__', None)}
+        del main_module.__file__
+        main_module.__spec__ = None
+
+    try:
+        with ProcessPoolExecutor(max_workers=min(nworkers, N), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker) as executor:
+            pending = {}
+            n_submitted = 0
+            n_done = 0
+            while n_done < N:
+                while n_submitted < N and len(pending) < 2*nworkers:
+                    future = executor.submit(_run_one_inhibitor, f, inhibitor_list[n_submitted], args)
+                    pending[future] = n_submitted
+                    n_submitted += 1
+                finished, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = pending.pop(future)
+                    try:
+                        [results[i], error] = future.result()
+                    except Exception as e:
+                        [results[i], error] = [None, f"{type(e).__name__}: {e}"]
+                    n_done += 1
+                    _report(n_done, i, error)
+    finally:
+        for key, value in main_attrs.items():
+            setattr(main_module, key, value)
+    return results
+
+
 def table_pIC_hill_multi_inhibitor(inhibitor_list, mcmc_dir, logDtot, logStot, logItot, measure='mean', 
-                                   logK_dE_alpha=None, trace_name='traces.pickle', OUTDIR=None):
+                                   logK_dE_alpha=None, trace_name='traces.pickle', OUTDIR=None, method='hill',
+                                   adaptive=False, nworkers=1, script_path=None):
     """
     For a set of inhibitors, dimer-only pIC50s can be simulated given the specified values of 
     dimer/substrate concentrations and kinetic parameters from mcmc trace. 
@@ -297,6 +614,10 @@ def table_pIC_hill_multi_inhibitor(inhibitor_list, mcmc_dir, logDtot, logStot, l
     logItot         : vector of inhibitor concentration
     measure         : statistical measure, can be 'mean' or 'median'
     logK_dE_alpha   : dict, information of fixed logK, dE and alpha
+    method          : 'hill' or 'direct', method to estimate pIC50 (see _pIC)
+    adaptive        : bool, simulating the CRCs on the adaptive grid of inhibitor concentrations
+    nworkers        : number of processes to analyze the inhibitors in parallel (see _map_inhibitors)
+    script_path     : str, path of the running script (see _map_inhibitors)
     ----------
     return table of kinetic parameters, pIC50, and hill slope for the whole dataset of multiple inhibitors
     """
@@ -307,8 +628,9 @@ def table_pIC_hill_multi_inhibitor(inhibitor_list, mcmc_dir, logDtot, logStot, l
             os.makedirs(os.path.join(OUTDIR, 'Plot'))
 
     f_table = _pIC_hill_one_inhibitor
-    args = [mcmc_dir, logDtot, logStot, logItot, measure, logK_dE_alpha, trace_name, OUTDIR]
-    list_median_std = np.array(list(map(lambda i: f_table(i, *args), inhibitor_list)))
+    args = [mcmc_dir, logDtot, logStot, logItot, measure, logK_dE_alpha, trace_name, OUTDIR, method, adaptive]
+    results = _map_inhibitors(f_table, inhibitor_list, args, nworkers, show_progress=nworkers>1, script_path=script_path)
+    list_median_std = np.array([result if result is not None else np.nan*np.ones(6) for result in results], dtype=np.float64)
     
     pIC50_median = list_median_std.T[0]
     pIC50_std = list_median_std.T[1]
@@ -325,6 +647,181 @@ def table_pIC_hill_multi_inhibitor(inhibitor_list, mcmc_dir, logDtot, logStot, l
     return table
 
 
+def _load_thinned_traces(inhibitor_list, mcmc_dir, logK_dE_alpha=None, trace_name='traces.pickle', nsamples=100):
+    """
+    Loading and thinning the traces of multiple inhibitors once, so that the dimer-only parameters of all 
+    inhibitors can be evaluated together. The thinning is similar to table_pIC_hill_one_inhibitor.
+
+    Parameters:
+    ----------
+    inhibitor_list  : list of inhibitor
+    mcmc_dir        : str, directory of traces
+    logK_dE_alpha   : dict, information of fixed logK, dE and alpha
+    trace_name      : name of the trace file of each inhibitor
+    nsamples        : approximate number of samples kept for each inhibitor
+    ----------
+    return [IDs, params, mask]
+        IDs     : list of inhibitors of which the trace was found
+        params  : list of arrays (ninhibitors, nsamples_max) of the parameters of ReactionRate_DimerOnly. 
+                  The inhibitors with fewer samples are padded by their first sample.
+        mask    : boolean array (ninhibitors, nsamples_max), False for the padded samples
+    """
+    params_name = ['logK_S_D', 'logK_S_DS', 'logK_I_D', 'logK_I_DI', 'logK_S_DI', 'kcat_DS', 'kcat_DSI', 'kcat_DSS']
+    IDs = []
+    samples = []
+    for inhibitor in inhibitor_list:
+        trace_file = os.path.join(mcmc_dir, inhibitor[7:12], trace_name)
+        if not os.path.isfile(trace_file):
+            continue
+        trace = pickle.load(open(trace_file, "rb"))
+        n = np.size(trace[list(trace.keys())[0]])
+        nthin = max(int(n/nsamples), 1)
+
+        sample = []
+        for name in params_name:
+            if name in trace.keys():
+                sample.append(np.ravel(trace[name])[::nthin])
+            elif logK_dE_alpha is not None and name in logK_dE_alpha.keys():
+                sample.append(logK_dE_alpha[name]*np.ones(len(np.arange(n)[::nthin])))
+            else:
+                raise KeyError(f"{name} is not found in the trace of {inhibitor}.")
+        IDs.append(inhibitor)
+        samples.append(np.array(sample))
+
+    if len(samples) == 0:
+        return [IDs, None, None]
+
+    nsamples_max = max([sample.shape[1] for sample in samples])
+    params = np.zeros((len(params_name), len(samples), nsamples_max))
+    mask = np.zeros((len(samples), nsamples_max), dtype=bool)
+    for i, sample in enumerate(samples):
+        params[:, i, :] = sample[:, [0]]
+        params[:, i, :sample.shape[1]] = sample
+        mask[i, :sample.shape[1]] = True
+    return [IDs, [jnp.array(param) for param in params], jnp.array(mask)]
+
+
+def _f_pIC50_implicit(logD, logS, x_min, x_max, params, niters=30):
+    """
+    Differentiable pIC50 of the dimer-only reaction rate for one sample of mcmc trace. 
+    
+    The value is the log10 of IC50 from the bisection of _f_pIC_direct, while the derivative is the one 
+    of a Newton step on the implicit function f_norm(x50; logD, logS) = 0.5:
+        d(x50)/d(logD) = -(df_norm/dlogD)/(df_norm/dx50)
+
+    return pIC50 and whether the estimation is valid (inhibition with positive hill slope)
+    """
+    [x50, _, hill, dv] = jax.lax.stop_gradient(_f_pIC_direct(logD, logS, x_min, x_max, params, niters))
+    valid = (dv!=0)*jnp.isfinite(x50)*jnp.isfinite(hill)*(hill>0)
+    x50 = jnp.where(valid, x50, (x_min+x_max)/2)
+
+    ones = jnp.ones(3)
+    def f_norm(x):
+        [v_top, v_bottom, v] = ReactionRate_DimerOnly(logD*ones, logS*ones, jnp.array([x_min, x_max, x])*jnp.log(10), *params)
+        return (v - v_bottom)/jnp.where(valid, v_top - v_bottom, 1.)
+
+    slope = jax.lax.stop_gradient(jax.grad(f_norm)(x50))
+    slope = jnp.where(valid*(slope!=0), slope, -1.)
+    correction = (f_norm(x50) - 0.5)/slope
+    return -(x50 - (correction - jax.lax.stop_gradient(correction))), valid
+
+
+def _median_pIC50_multi_inhibitor(logDtot, logStot, params, mask, min_conc_I=1E-12, max_conc_I=1E-3):
+    """
+    Median of the dimer-only pIC50 of each inhibitor, differentiable with respect to the concentrations
+
+    Parameters:
+    ----------
+    logDtot         : float, log of dimer concentration
+    logStot         : float, log of substrate concentration
+    params          : list of arrays (ninhibitors, nsamples) of the parameters of ReactionRate_DimerOnly
+    mask            : boolean array (ninhibitors, nsamples), samples included in the median
+    min_conc_I      : float, minimum value of inhibitor concentration
+    max_conc_I      : float, maximum value of inhibitor concentration
+    ----------
+    return vector of median pIC50 of the valid samples, nan if no valid sample
+    """
+    x_min = np.log10(min_conc_I)
+    x_max = np.log10(max_conc_I)
+    f_pIC50 = lambda *p: _f_pIC50_implicit(logDtot, logStot, x_min, x_max, p)
+    [pIC50, valid] = vmap(vmap(f_pIC50))(*params)
+    pIC50 = jnp.where(valid*mask, pIC50, jnp.nan)
+    return jnp.nanmedian(pIC50, axis=1)
+
+
+def _pIC_sweep(params, mask, logDtot, logStot, min_conc_I=1E-12, max_conc_I=1E-3, method='direct', 
+               n_points=50, adaptive=False, chunk_size=10000, nworkers=1):
+    """
+    Dimer-only pIC50, hill slope and pIC90 of all samples of multiple inhibitors under multiple conditions
+
+    Parameters:
+    ----------
+    params          : list of arrays (ninhibitors, nsamples) of the parameters from _load_thinned_traces
+    mask            : boolean array (ninhibitors, nsamples) of the samples from _load_thinned_traces
+    logDtot         : vector of log of dimer concentration of each condition
+    logStot         : vector of log of substrate concentration of each condition
+    min_conc_I      : float, minimum value of inhibitor concentration
+    max_conc_I      : float, maximum value of inhibitor concentration
+    method          : 'hill' or 'direct', method to estimate pIC50 (see _pIC)
+    n_points        : number of inhibitor concentrations to simulate the CRCs, for method='hill'
+    adaptive        : bool, simulating the CRCs on the adaptive grid of inhibitor concentrations, for method='hill'
+    chunk_size      : number of CRCs evaluated at once, for method='direct'
+    nworkers        : number of threads evaluating the chunks (or the conditions for method='hill')
+    ----------
+    For method='direct', the CRCs of all conditions, inhibitors and samples are flattened and evaluated 
+    by chunks of the same size, so that the function is compiled only once.
+
+    return [pIC50, hill, pIC90], arrays (nconditions, ninhibitors, nsamples), nan for the invalid samples
+    """
+    assert method in ['hill', 'direct'], print("Please check the method to estimate pIC50 again.")
+    assert len(logDtot)==len(logStot), print("Vectors of dimer and substrate concentrations should have the same length.")
+    nconds = len(logDtot)
+    shape = (nconds, )+mask.shape
+    x_min = np.log10(min_conc_I)
+    x_max = np.log10(max_conc_I)
+
+    if method == 'direct':
+        logD = np.repeat(np.asarray(logDtot, dtype=np.float64), mask.size)
+        logS = np.repeat(np.asarray(logStot, dtype=np.float64), mask.size)
+        params_flat = [np.tile(np.ravel(param), nconds) for param in params]
+
+        ntotal = len(logD)
+        chunk_size = min(chunk_size, ntotal)
+        starts = list(range(0, ntotal, chunk_size))
+        f_direct = jax.jit(vmap(_f_pIC_direct, in_axes=(0, 0, None, None, 0)))
+
+        def f_chunk(start):
+            ## The last chunk is padded to keep the same shape
+            idx = np.minimum(np.arange(start, start+chunk_size), ntotal-1)
+            return np.array(f_direct(logD[idx], logS[idx], x_min, x_max, [param[idx] for param in params_flat]))
+
+        if nworkers is None or nworkers <= 1 or len(starts) == 1:
+            results = [f_chunk(start) for start in starts]
+        else:
+            with ThreadPoolExecutor(max_workers=min(nworkers, len(starts))) as executor:
+                results = list(executor.map(f_chunk, starts))
+        [x50, x90, hill, dv] = np.concatenate(results)[:ntotal].T
+        valid = (dv!=0)*np.isfinite(x50)*np.isfinite(x90)*np.isfinite(hill)
+        thetas = np.stack([-x50, hill, -x90])
+
+    else:
+        names = ['logK_S_D', 'logK_S_DS', 'logK_I_D', 'logK_I_DI', 'logK_S_DI', 'kcat_DS', 'kcat_DSI', 'kcat_DSS']
+        df = pd.DataFrame({name: np.ravel(param) for name, param in zip(names, params)})
+        logItot = np.linspace(np.log(min_conc_I), np.log(max_conc_I), n_points)
+        f_cond = lambda i: _pIC_hill(df, np.ones(n_points)*logDtot[i], np.ones(n_points)*logStot[i], logItot, adaptive=adaptive)
+
+        if nworkers is None or nworkers <= 1 or nconds == 1:
+            results = [f_cond(i) for i in range(nconds)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(nworkers, nconds)) as executor:
+                results = list(executor.map(f_cond, range(nconds)))
+        thetas = np.concatenate(results, axis=1)[2:]
+        valid = thetas[0]!=0
+
+    valid = np.reshape(valid*(thetas[1]>0), shape)*np.asarray(mask)[None, :, :]
+    return [np.where(valid, np.reshape(theta, shape), np.nan) for theta in thetas]
+
+
 def f_pIC90(pIC50, hill):
     """
     Calculating pIC90 given pIC50 and hill slope
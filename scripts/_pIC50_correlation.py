@@ -6,9 +6,10 @@ import scipy
 from scipy import stats
 from scipy.optimize import curve_fit
 
-import matplotlib
-import matplotlib.pyplot as plt
-import seaborn as sns
+from _lazy_import import lazy_import
+matplotlib = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+sns = lazy_import('seaborn')
 
 from _chemical_reactions import ChemicalReactions
 from _pIC50 import f_pIC90, _pd_mean_std_pIC
@@ -56,7 +57,7 @@ def corr_matrix(data, keys, method='pearsonr'):
                 text = r'n=' +str(len(dat)) +'; r=' +str('%5.3f' %coef) +'; p=' +str('%5.3e' %p)
             else:
                 text = r'n=' +str(len(dat))
-            table.iloc[i][keys[j]] = text
+            table.at[i, keys[j]] = text
     # table = table.rename(index={0: "Fluorescence", 1: "Antiviral_Leuven", 2: "Antiviral_Zitzman", 3: "Antiviral_Takeda", 4: "Antiviral_IIBR"})
     return table
 
@@ -88,7 +89,7 @@ def rmsd_matrix(data, keys, method='RMSD'):
                 text = r'n=' +str(len(dat)) +'; r=' +str('%5.3f' %rmsd)
             else:
                 text = r'n=' +str(len(dat))
-            table.iloc[i][keys[j]] = text
+            table.at[i, keys[j]] = text
     return table
 
 
@@ -147,7 +148,97 @@ def _corr_coef(x, y, method='pearsonr'):
     return corr, p
 
 
-def corr_bootstrap(x, y, n_bootstrap=100, method='pearsonr'):
+def _weighted_pearsonr(x, y, weights):
+    """
+    Parameters
+    ----------
+    x, y        : numpy.array (n, ) or (nreplicates, n), datasets of two variables
+    weights     : numpy.array (nreplicates, n), number of times each observation appears in each replicate
+
+    return the Pearson correlation coefficient of each replicate
+    """
+    n = np.sum(weights, axis=1)
+    dx = x - (np.sum(weights*x, axis=1)/n)[:, None]
+    dy = y - (np.sum(weights*y, axis=1)/n)[:, None]
+    return np.sum(weights*dx*dy, axis=1)/np.sqrt(np.sum(weights*dx**2, axis=1)*np.sum(weights*dy**2, axis=1))
+
+
+def _weighted_rank(x, weights):
+    """
+    Parameters
+    ----------
+    x           : numpy.array (n, ), dataset of one variable
+    weights     : numpy.array (nreplicates, n), number of times each observation appears in each replicate
+
+    return the average rank (starting from 1) of each observation within each replicate, 
+    equivalent to scipy.stats.rankdata of the resampled data
+    """
+    less = (x[None, :] < x[:, None]).astype(np.float64)
+    equal = (x[None, :] == x[:, None]).astype(np.float64)
+    return weights @ less.T + (weights @ equal.T + 1)/2
+
+
+def _corr_coef_resampling(x, y, weights, method='pearsonr'):
+    """
+    Parameters
+    ----------
+    x           : numpy.array (n, ), dataset of one variable
+    y           : numpy.array (n, ), dataset of other variable
+    weights     : numpy.array (nreplicates, n), number of times each observation appears in each replicate,
+                  e.g. counts of the bootstrap indices or 0/1 for leave-p-out
+    method      : The method to calculate correlation coefficients can be 'pearsonr', 'spearmanr', 'kendall', 'RMSD', or 'aRMSD'
+
+    The comparisons between observations are computed once for the original data, so that the statistic
+    of all replicates is obtained by matrix products without resampling the data.
+
+    return the correlation of each replicate, similar to _corr_coef of the resampled data
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    n = np.sum(weights, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method=='pearsonr':
+            return _weighted_pearsonr(x[None, :], y[None, :], weights)
+        elif method=='spearmanr':
+            return _weighted_pearsonr(_weighted_rank(x, weights), _weighted_rank(y, weights), weights)
+        elif method=='kendall':
+            ## Kendall tau-b: concordant minus discordant pairs, corrected by the pairs tied in x or y
+            sign_x = np.sign(x[None, :] - x[:, None])
+            sign_y = np.sign(y[None, :] - y[:, None])
+            concordance = 0.5*np.sum((weights @ (sign_x*sign_y))*weights, axis=1)
+            n0 = n*(n-1)/2
+            n1 = 0.5*(np.sum((weights @ (sign_x==0))*weights, axis=1) - n)
+            n2 = 0.5*(np.sum((weights @ (sign_y==0))*weights, axis=1) - n)
+            return concordance/np.sqrt((n0-n1)*(n0-n2))
+        elif method=='RMSD':
+            return np.sqrt(np.sum(weights*(x-y)**2, axis=1)/n)
+        elif method=='aRMSD':
+            d = x - y
+            return np.sqrt(np.sum(weights*(d - (np.sum(weights*d, axis=1)/n)[:, None])**2, axis=1)/n)
+        else:
+            raise ValueError("The method should be \'pearsonr\', \'spearmanr\', \'kendall\', \'RMSD\', \'aRMSD\'.")
+
+
+def _corr_summary(correlations, confidence=None):
+    """
+    Parameters
+    ----------
+    correlations: numpy.array, correlation of each replicate
+    confidence  : optional, float, confidence level (%) of the interval, e.g. 95
+    
+    return mean and std of the correlations, and the percentile interval if confidence is given
+    """
+    mean_corr = np.nanmean(correlations)
+    std_corr = np.nanstd(correlations)
+    if confidence is None:
+        return mean_corr, std_corr
+    confidence_interval = np.nanpercentile(correlations, [(100-confidence)/2, 100-(100-confidence)/2])
+    return mean_corr, std_corr, confidence_interval
+
+
+def corr_bootstrap(x, y, n_bootstrap=100, method='pearsonr', seed=None, confidence=None):
     """
     Parameters
     ----------
@@ -155,59 +246,53 @@ def corr_bootstrap(x, y, n_bootstrap=100, method='pearsonr'):
     y           : numpy.array, dataset of other variable
     n_bootstrap : Number of bootstrap samples
     method      : The method to calculate correlation coefficients can be 'pearsonr', 'spearmanr', 'kendall', 'RMSD', or 'aRMSD'
+    seed        : optional, int, seed of the random generator
+    confidence  : optional, float, confidence level (%) of the percentile interval, e.g. 95
+
+    All bootstrap samples are drawn as one matrix of indices (n_bootstrap, n) and evaluated together.
 
     return the correlation given a dataset consists of paired observations where each (x_i, y_i) pair is related to each other
     """
     dat = pd.DataFrame([x, y], index=['X', 'Y']).T
     dat = dat.dropna()
-    x = np.array(dat.X)
-    y = np.array(dat.Y)
-    bootstrap_correlations = []
-    for _ in range(n_bootstrap):
-        # Generate random indices with replacement
-        indices = np.random.choice(len(x), size=len(y), replace=True)
-
-        # Select corresponding elements from both x and y arrays
-        resampled_x = x[indices]
-        resampled_y = y[indices]
+    x = np.array(dat.X, dtype=np.float64)
+    y = np.array(dat.Y, dtype=np.float64)
+    n = len(x)
 
-        # Calculate correlation coefficient
-        corr, p = _corr_coef(x, y, method)
-        bootstrap_correlations.append(corr)
+    # Generate random indices with replacement, then count the occurrences of each observation
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, n, size=(n_bootstrap, n))
+    weights = np.bincount((indices + n*np.arange(n_bootstrap)[:, None]).ravel(), minlength=n_bootstrap*n).reshape(n_bootstrap, n)
 
-        # Analyze the distribution
-        mean_corr = np.mean(bootstrap_correlations)
-        std_corr = np.std(bootstrap_correlations)
-        # confidence_interval = np.percentile(bootstrap_correlations, [2.5, 97.5])
+    bootstrap_correlations = _corr_coef_resampling(x, y, weights, method)
+    return _corr_summary(bootstrap_correlations, confidence)
 
-    return mean_corr, std_corr
 
-
-def corr_bootstrap_matrix(data, keys, n_bootstrap=100, method='pearsonr'):
+def corr_bootstrap_matrix(data, keys, n_bootstrap=100, method='pearsonr', seed=None):
     """
     Parameters
     ----------
     data        : dataset contains the set of variables for correlation analysis
     keys        : column names of dataframe to calculate correlation coefficients
     method      : The method to calculate correlation coefficients can be 'pearsonr', 'spearmanr', 'kendall', 'RMSD', or 'aRMSD'
+    seed        : optional, int, seed of the random generator
     """
     table = pd.DataFrame(columns=keys, index=range(len(keys)))
     for i in range(1, len(keys)):
         for j in range(i):
-            # x = pd.DataFrame.to_numpy(data[keys[i]])
             x = data[keys[i]]
-            # y = pd.DataFrame.to_numpy(data[keys[j]])
             y = data[keys[j]]
-            if len(dat)>2:
-                mean_corr, std_corr = corr_bootstrap(x, y, n_bootstrap, method)
-                text = r'n=' +str(len(x)) +'; corr=' +str('%5.3f' %mean_corr) +' ± ' +str('%5.3e' %std_corr)
+            n = int(np.sum(x.notna()*y.notna()))
+            if n>2:
+                mean_corr, std_corr = corr_bootstrap(x, y, n_bootstrap, method, seed)
+                text = r'n=' +str(n) +'; corr=' +str('%5.3f' %mean_corr) +' ± ' +str('%5.3e' %std_corr)
             else:
-                text = r'n=' +str(len(x))
-            table.iloc[i][keys[j]] = text
+                text = r'n=' +str(n)
+            table.at[i, keys[j]] = text
     return table
 
 
-def corr_leave_p_out(x, y, p=2, method='pearsonr'):
+def corr_leave_p_out(x, y, p=2, method='pearsonr', confidence=None):
     """
     Parameters
     ----------
@@ -215,6 +300,7 @@ def corr_leave_p_out(x, y, p=2, method='pearsonr'):
     y           : numpy.array, dataset of other variable
     p           : int, number of observation that is left out of the correlation analysis
     method      : The method to calculate correlation coefficients can be 'pearsonr', 'spearmanr', 'kendall', 'RMSD', or 'aRMSD'
+    confidence  : optional, float, confidence level (%) of the percentile interval, e.g. 95
 
     return the correlation given a dataset consists of paired observations where each (x_i, y_i) pair is related to each other
     """
@@ -222,29 +308,17 @@ def corr_leave_p_out(x, y, p=2, method='pearsonr'):
 
     dat = pd.DataFrame([x, y], index=['X', 'Y']).T
     dat = dat.dropna()
-    _x = np.array(dat.X)
-    _y = np.array(dat.Y)
+    _x = np.array(dat.X, dtype=np.float64)
+    _y = np.array(dat.Y, dtype=np.float64)
+    n = len(_x)
 
-    bootstrap_correlations = []
-    # Loop over data for leave-p-out cross-validation
-    for i in range(len(_x) - p + 1):
-        # Create dataset by leaving out p data points
-        indices = np.delete(np.arange(len(_x)), np.s_[i:i+p])
+    # Each replicate leaves out p consecutive data points
+    start = np.arange(n - p + 1)[:, None]
+    idx = np.arange(n)[None, :]
+    weights = 1 - (idx>=start)*(idx<start+p)
 
-        # Select corresponding elements from both x and y arrays
-        select_x = _x[indices]
-        select_y = _y[indices]
-
-        # Calculate correlation coefficient
-        corr, _ = _corr_coef(select_x, select_y, method)
-        bootstrap_correlations.append(corr)
-
-        # Analyze the distribution
-        mean_corr = np.mean(bootstrap_correlations)
-        std_corr = np.std(bootstrap_correlations)
-        # confidence_interval = np.percentile(bootstrap_correlations, [2.5, 97.5])
-
-    return mean_corr, std_corr
+    correlations = _corr_coef_resampling(_x, _y, weights, method)
+    return _corr_summary(correlations, confidence)
 
 
 def corr_leave_p_out_matrix(data, keys, p=2, method='pearsonr'):
@@ -259,16 +333,14 @@ def corr_leave_p_out_matrix(data, keys, p=2, method='pearsonr'):
     table = pd.DataFrame(columns=keys, index=range(len(keys)))
     for i in range(1, len(keys)):
         for j in range(i):
-            # x = pd.DataFrame.to_numpy(data[keys[i]])
             x = data[keys[i]]
-            # y = pd.DataFrame.to_numpy(data[keys[j]])
             y = data[keys[j]]
             if len(x)>p:
                 mean_corr, std_corr = corr_leave_p_out(x, y, p, method)
                 text = r'n=' +str(len(x)) +'; corr=' +str('%5.3f' %mean_corr) +' ± ' +str('%5.3e' %std_corr)
             else:
                 text = r'n=' +str(len(x))
-            table.iloc[i][keys[j]] = text
+            table.at[i, keys[j]] = text
 
     return table
 
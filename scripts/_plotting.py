@@ -1,22 +1,26 @@
 import os
 import numpy as np
-import jax.numpy as jnp
 
-import seaborn as sns
-import matplotlib.pyplot as plt
-from scipy import stats
+from _lazy_import import lazy_import
+jnp = lazy_import('jax.numpy')
+sns = lazy_import('seaborn')
+plt = lazy_import('matplotlib.pyplot')
+stats = lazy_import('scipy.stats')
+az = lazy_import('arviz')
 
-import arviz as az
-
-from _kinetics import ReactionRate, MonomerConcentration, CatalyticEfficiency
-from _kinetics import adjust_ReactionRate, adjust_MonomerConcentration, adjust_CatalyticEfficiency
-from _model import _dE_find_prior
+## The kinetic model is only loaded for plotting the fitted curves
+_kinetics = lazy_import('_kinetics')
+_model = lazy_import('_model')
+from _adaptive_grid import _adaptive_grid, _plot_grid
+from _timing import _timed
 
 
+@_timed('plotting')
 def plot_data_conc_log(experiments, params_logK, params_kcat, alpha_list=None, E_list=None,
                        outliers=None, line_colors=['blue', 'green', 'orange', 'purple', 'red', 'k'], ls='-',
                        fontsize_tick=10, fontsize_label=12, combined_plots=False,
-                       fig_size=(5, 3.5), dpi=80, plot_legend=True, OUTFILE=None):
+                       fig_size=(5, 3.5), dpi=80, plot_legend=True, OUTFILE=None, adaptive_grid=False,
+                       bands=None, band_alpha=0.3):
     """
     Parameters:
     ----------
@@ -36,9 +40,15 @@ def plot_data_conc_log(experiments, params_logK, params_kcat, alpha_list=None, E
         kcat_DSS: float, Rate constant of dimer-substrate-substrate complex
     alpha           : optional, float or 1D array, normalization factor
     error_E         : optional, dict of enzyme concentration uncertainty
+    outliers        : optional, list of boolean masks of outliers of each experiment (_outliers_each_curve)
     figure_size     : (width, height) size of plot
     dpi             : quality of plot
     OUTDIR          : optional, string, directory for saving plot
+    adaptive_grid   : optional, bool, the inhibitor concentrations of the fitted curves are dense around 
+                      the transition of the curves (_adaptive_grid)
+    bands           : optional, list of dict for each experiment (x, median, lower, upper), posterior 
+                      predictive bands shaded around the fitted curves (posterior_predictive_bands)
+    band_alpha      : transparency of the bands
     ----------
     return plots of each experiments with the concentration of inhibitor under log10 scale
     """    
@@ -63,46 +73,39 @@ def plot_data_conc_log(experiments, params_logK, params_kcat, alpha_list=None, E
             plt.plot(np.log10(np.exp(x)), experiment['Km_over_kcat'], '.', color=_color)
         elif experiment['type']=='CRC' : 
             plt.plot(np.log10(np.exp(x)), experiment['v']*1E9, '.', color=_color)
-            if outliers is not None and np.sum(outliers)>0:
+            if outliers is not None and np.sum(outliers[i])>0:
                 outlier = outliers[i]
                 plt.plot(np.log10(np.exp(x[outlier])), experiment['v'][outlier]*1E9, color='r', ls=' ', marker='x', label='Outlier')
 
         # Plot fit
-        if experiment['x']=='logMtot':
-            logMtot = np.linspace(max(experiment['logMtot']), min(experiment['logMtot']), npoints)
-            logStot = experiment['logStot'][0]*np.ones(npoints)
-            logItot = experiment['logItot'][0]*np.ones(npoints)
-            x = logMtot
-        elif experiment['x']=='logStot':
-            logMtot = experiment['logMtot'][0]*np.ones(npoints)
-            logStot = np.linspace(max(experiment['logStot']), min(experiment['logStot']), npoints)
-            if experiment['logItot'] is not None:
-                logItot = experiment['logItot'][0]*np.ones(npoints)
-            else:
-                logItot = None
-            x = logStot
-        elif experiment['x']=='logItot':
-            logMtot = experiment['logMtot'][0]*np.ones(npoints)
-            logStot = experiment['logStot'][0]*np.ones(npoints)
-            logItot = np.linspace(max(experiment['logItot']), min(experiment['logItot']), npoints) #9.95E-05
+        [x, logMtot, logStot, logItot] = _plot_grid(experiment, npoints)
+        if experiment['x']=='logItot' and adaptive_grid and experiment['type'] in ['kinetics', 'CRC']:
+            f_rate = _kinetics.ReactionRate if experiment['type']=='CRC' else _kinetics.adjust_ReactionRate
+            f_v = lambda logI: np.array(f_rate(logMtot[:len(logI)], logStot[:len(logI)], logI, *params_logK, *params_kcat))
+            logItot = _adaptive_grid(f_v, min(experiment['logItot']), max(experiment['logItot']), npoints)[::-1]
             x = logItot
 
+        if bands is not None and bands[i] is not None:
+            scale = 1E9 if experiment['type'] in ['kinetics', 'CRC'] else 1
+            plt.fill_between(np.log10(np.exp(bands[i]['x'])), bands[i]['lower']*scale, bands[i]['upper']*scale,
+                             color=_color, alpha=band_alpha, lw=0)
+
         if experiment['type']=='kinetics':
-            func = adjust_ReactionRate
+            func = _kinetics.adjust_ReactionRate
             y_model = func(logMtot, logStot, logItot, *params_logK, *params_kcat)
             plt.plot(np.log10(np.exp(x)), y_model*1E9, ls=ls, color=_color, label=experiment['figure'])
             plt.xlabel(experiment['x'], fontsize=fontsize_label)
             plt.ylabel('Rate (nM min$^{-1}$)', fontsize=fontsize_label)
 
         elif experiment['type']=='AUC':
-            func = adjust_MonomerConcentration
+            func = _kinetics.adjust_MonomerConcentration
             y_model = func(logMtot, logStot, logItot, *params_logK)
             plt.plot(np.log10(np.exp(x)), y_model, ls=ls, color=_color, label=experiment['figure'])
             plt.xlabel(experiment['x'], fontsize=fontsize_label)
             plt.ylabel('Monomer concentration (M)', fontsize=fontsize_label)
 
         elif experiment['type']=='catalytic_efficiency':
-            func = adjust_CatalyticEfficiency
+            func = _kinetics.adjust_CatalyticEfficiency
             y_model = 1./func(logMtot, logItot, *params_logK, *params_kcat)
             plt.plot(np.log10(np.exp(x)), y_model, ls=ls, color=_color, label=experiment['figure'])
             plt.xlabel(experiment['x'], fontsize=fontsize_label)
@@ -110,7 +113,7 @@ def plot_data_conc_log(experiments, params_logK, params_kcat, alpha_list=None, E
 
         elif experiment['type']=='CRC':
             if E_list is not None:
-                dE = _dE_find_prior([None, logMtot, logStot, logItot], E_list)
+                dE = _model._dE_find_prior([None, logMtot, logStot, logItot], E_list)
                 logE = jnp.log(dE*1E-9)
             else: logE = logMtot
 
@@ -124,7 +127,7 @@ def plot_data_conc_log(experiments, params_logK, params_kcat, alpha_list=None, E
                     name = experiment['figure']
                     alpha = alpha_list[f'alpha:{name}']
 
-            y_model = ReactionRate(logE, logStot, logItot, *params_logK, *params_kcat)*alpha
+            y_model = _kinetics.ReactionRate(logE, logStot, logItot, *params_logK, *params_kcat)*alpha
 
             plt.plot(np.log10(np.exp(x)), y_model*1E9, ls=ls, color=_color,
                      label=experiment['sub_figure'])
@@ -155,6 +158,7 @@ def plot_data_conc_log(experiments, params_logK, params_kcat, alpha_list=None, E
         plt.savefig(f'{OUTFILE}')
 
 
+@_timed('plotting')
 def plotting_trace_global(trace, out_dir, nchain=4, nsample=None, name_expts=None):
     """
     Parameters:
@@ -272,6 +276,7 @@ def plotting_trace_global(trace, out_dir, nchain=4, nsample=None, name_expts=Non
             plt.close()
 
 
+@_timed('plotting')
 def plotting_trace(trace, out_dir, nchain=4, nsample=None):
     """
     Parameters:
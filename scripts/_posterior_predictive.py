@@ -0,0 +1,200 @@
+"""
+Posterior predictive bands of the fitted curves. The kinetic model is evaluated over a thinned set of
+posterior draws for the concentration grids of all experiments at once, and the median and highest
+density interval (HDI) of the responses are returned for plotting (plot_data_conc_log).
+"""
+import os
+import pickle
+import hashlib
+from functools import partial
+
+import numpy as np
+import jax
+import jax.numpy as jnp
+from jax import vmap
+
+from _kinetics import ReactionRate
+from _kinetics import adjust_ReactionRate, adjust_MonomerConcentration, adjust_CatalyticEfficiency
+from _model import _dE_find_prior
+from _params_extraction import extract_logK_n_idx, extract_kcat_n_idx
+from _trace_analysis import TraceExtraction
+from _adaptive_grid import _plot_grid
+
+
+def _response(response, logMtot, logStot, logItot, params_logK, params_kcat):
+    """
+    Response of the model given the type of experiment ('kinetics', 'AUC', 'catalytic_efficiency', 'CRC'),
+    similar to the fitted curves of plot_data_conc_log
+    """
+    if response=='CRC':
+        return ReactionRate(logMtot, logStot, logItot, *params_logK, *params_kcat)
+    elif response=='kinetics':
+        return adjust_ReactionRate(logMtot, logStot, logItot, *params_logK, *params_kcat)
+    elif response=='AUC':
+        return adjust_MonomerConcentration(logMtot, logStot, logItot, *params_logK)
+    elif response=='catalytic_efficiency':
+        return 1./adjust_CatalyticEfficiency(logMtot, logItot, *params_logK, *params_kcat)
+
+
+@partial(jax.jit, static_argnames=['response'])
+def _f_response_draws(response, logMtot, logStot, logItot, params_logK, params_kcat):
+    """
+    Parameters:
+    ----------
+    response    : str, type of experiment
+    logMtot, logStot, logItot       : arrays (ndraws, npoints) of concentrations, logItot can be None
+    params_logK, params_kcat        : lists of arrays (ndraws, ) or None
+    ----------
+    Return array (ndraws, npoints) of the responses of all draws
+    """
+    return vmap(lambda *args: _response(response, *args))(logMtot, logStot, logItot, params_logK, params_kcat)
+
+
+def _hdi(samples, hdi_prob=0.95):
+    """
+    Parameters:
+    ----------
+    samples     : array (ndraws, npoints)
+    hdi_prob    : probability of the interval
+    ----------
+    Return [lower, upper], the narrowest interval containing hdi_prob of the draws for each point
+    """
+    samples = np.sort(samples, axis=0)
+    ndraws = samples.shape[0]
+    width = max(int(np.ceil(hdi_prob*ndraws)), 1)
+    if width >= ndraws:
+        return [samples[0], samples[-1]]
+    intervals = samples[width:] - samples[:ndraws-width]
+    start = np.argmin(intervals, axis=0)
+    idx = np.arange(samples.shape[1])
+    return [samples[start, idx], samples[start+width, idx]]
+
+
+def _thinned_draws(trace, nsamples=100):
+    """
+    Return the indices of nsamples draws evenly spaced over the trace
+    """
+    ntotal = len(trace[list(trace.keys())[0]])
+    if nsamples is None or nsamples >= ntotal:
+        return np.arange(ntotal)
+    return np.unique(np.linspace(0, ntotal-1, nsamples).astype(int))
+
+
+def _trace_key(trace, draws, experiments, npoints, hdi_prob):
+    """
+    Return the sha1 of the draws and the settings, used to check if the cached bands are still valid
+    """
+    h = hashlib.sha1()
+    for key in sorted(trace.keys()):
+        h.update(key.encode())
+        h.update(np.ascontiguousarray(np.asarray(trace[key])[draws], dtype=np.float64).tobytes())
+    for experiment in experiments:
+        for name in ['logMtot', 'logStot', 'logItot']:
+            if experiment.get(name) is not None:
+                h.update(np.ascontiguousarray(experiment[name], dtype=np.float64).tobytes())
+    h.update(f'{npoints}_{hdi_prob}'.encode())
+    return h.hexdigest()
+
+
+def posterior_predictive_bands(experiments, trace, prior_infor, shared_params=None, idx=0,
+                               nsamples=100, npoints=50, hdi_prob=0.95, chunk_size=1000, cache_file=None):
+    """
+    Parameters:
+    ----------
+    experiments : list of dict
+        Each dataset contains response, logMtot, lotStot, logItot
+    trace       : dict, trace of Bayesian sampling (group_by_chain=False)
+    prior_infor : list of dict of assigned prior distribution for kinetics parameters
+    shared_params : dict of information for shared parameters
+    idx         : index of enzyme
+    nsamples    : number of posterior draws, evenly thinned from the trace
+    npoints     : number of points of the grid of each experiment
+    hdi_prob    : probability of the highest density interval
+    chunk_size  : number of draws evaluated at once
+    cache_file  : optional, pickle file to save the bands, which are reused if the trace is unchanged
+    ----------
+    The experiments of the same type are concatenated and evaluated together for each chunk of draws.
+    Normalization factors (alpha) and enzyme concentration errors (dE) are taken from the same draws.
+
+    Return list of dict for each experiment, including x, median, lower, upper of the response
+    """
+    draws = _thinned_draws(trace, nsamples)
+    ndraws = len(draws)
+
+    trace_key = _trace_key(trace, draws, experiments, npoints, hdi_prob)
+    if cache_file is not None and os.path.isfile(cache_file):
+        try:
+            cache = pickle.load(open(cache_file, "rb"))
+            if cache['key'] == trace_key:
+                return cache['bands']
+        except Exception:
+            pass
+
+    params_logK, params_kcat = TraceExtraction(trace=trace).extract_params_from_map_and_prior(draws, prior_infor)
+    _logK = extract_logK_n_idx(params_logK, idx, shared_params)
+    _kcat = extract_kcat_n_idx(params_kcat, idx, shared_params)
+    ## Every parameter is an array of ndraws, fixed parameters are repeated
+    _logK = [None if p is None else jnp.broadcast_to(jnp.asarray(p, dtype=jnp.float64), (ndraws, )) for p in _logK]
+    _kcat = [None if p is None else jnp.broadcast_to(jnp.asarray(p, dtype=jnp.float64), (ndraws, )) for p in _kcat]
+
+    alpha_list = {key: np.asarray(trace[key])[draws] for key in trace.keys() if key.startswith('alpha')}
+    E_list = {key: np.asarray(trace[key])[draws] for key in trace.keys() if key.startswith('dE')}
+
+    ## Grid and the per-draw factors of each experiment
+    grids = []
+    for experiment in experiments:
+        [x, logMtot, logStot, logItot] = _plot_grid(experiment, npoints)
+        logM = np.broadcast_to(logMtot, (ndraws, npoints))
+        alpha = np.ones(ndraws)
+        if experiment['type']=='CRC':
+            if len(E_list)>0:
+                dE = np.asarray(_dE_find_prior([None, logMtot, logStot, logItot], E_list))
+                if dE.shape[0] == npoints:
+                    logM = np.log(dE.T*1E-9)
+            if len(alpha_list)>0:
+                plate = experiment['plate']
+                if f'alpha:{plate}' in alpha_list.keys():
+                    alpha = alpha_list[f'alpha:{plate}']
+                else:
+                    name = experiment['figure']
+                    alpha = alpha_list[f'alpha:{name}']
+        grids.append([x, logM, logStot, logItot, alpha])
+
+    ## Evaluating the experiments of the same type together
+    responses = [None]*len(experiments)
+    groups = {}
+    for i, experiment in enumerate(experiments):
+        groups.setdefault((experiment['type'], grids[i][3] is None), []).append(i)
+
+    chunk_size = min(chunk_size, ndraws)
+    for (response, no_inhibitor), members in groups.items():
+        logM = np.concatenate([grids[i][1] for i in members], axis=1)
+        logS = np.broadcast_to(np.concatenate([grids[i][2] for i in members]), logM.shape)
+        if no_inhibitor:
+            logI = None
+        else:
+            logI = np.broadcast_to(np.concatenate([grids[i][3] for i in members]), logM.shape)
+
+        ys = []
+        for start in range(0, ndraws, chunk_size):
+            ## The last chunk is padded to keep the same shape for the compiled function
+            chunk = np.minimum(np.arange(start, start+chunk_size), ndraws-1)
+            y = _f_response_draws(response, jnp.asarray(logM[chunk]), jnp.asarray(logS[chunk]),
+                                  None if logI is None else jnp.asarray(logI[chunk]),
+                                  [None if p is None else p[chunk] for p in _logK],
+                                  [None if p is None else p[chunk] for p in _kcat])
+            ys.append(np.asarray(y)[:min(chunk_size, ndraws-start)])
+        ys = np.concatenate(ys)
+
+        for n, i in enumerate(members):
+            responses[i] = ys[:, n*npoints:(n+1)*npoints]*grids[i][4][:, None]
+
+    bands = []
+    for i in range(len(experiments)):
+        [lower, upper] = _hdi(responses[i], hdi_prob)
+        bands.append({'x': grids[i][0], 'median': np.median(responses[i], axis=0),
+                      'lower': lower, 'upper': upper})
+
+    if cache_file is not None:
+        pickle.dump({'key': trace_key, 'bands': bands}, open(cache_file, "wb"))
+    return bands
@@ -0,0 +1,138 @@
+"""
+Decorrelating reparameterization of the binding constants of the inhibitor for NUTS.
+
+The CRC only constrain the overall constants of the complexes, so that the posteriors of logK_I_D, logK_I_DI
+and logK_S_DI are strongly correlated (logK_I_D + logK_I_DI and logK_I_D + logK_S_DI are well defined, see
+AnalysisPlot.linear_corr). With LoopReparam, logK_I_DI and logK_S_DI are sampled by the sum of their
+unconstrained value and the unconstrained value of logK_I_D (scaled by the ratio of the prior widths):
+
+    u = z + r*z_I_D,    z = u - r*z_I_D,    logK = T(z)
+
+where T is the transform of the prior to the unconstrained space. The shear has a unit jacobian, so the
+posterior of the binding constants is unchanged and they are still saved in the traces under their own names.
+"""
+import jax.numpy as jnp
+
+import numpyro
+import numpyro.distributions as dist
+from numpyro import handlers
+from numpyro.distributions import constraints
+from numpyro.distributions.transforms import biject_to
+from numpyro.primitives import Messenger
+
+LOOP_PAIRS = {'logK_I_DI': 'logK_I_D', 'logK_S_DI': 'logK_I_D'}
+DECORRELATED_SUFFIX = '_decorrelated'
+
+
+def _split_site(site):
+    """
+    Return the name of the parameter and the index of the enzyme, e.g. logK_I_D:1 -> (logK_I_D, ':1')
+    """
+    name, sep, idx = site.partition(':')
+    return name, sep+idx
+
+
+def _base_site(site):
+    """
+    Return the site of logK_I_D correlated to the site, None if the site is not reparameterized
+    """
+    name, idx = _split_site(site)
+    if name in LOOP_PAIRS:
+        return LOOP_PAIRS[name]+idx
+    return None
+
+
+def _decorrelated_site(site):
+    """
+    Return the name of the sampled site, e.g. logK_I_DI:1 -> logK_I_DI_decorrelated:1
+    """
+    name, idx = _split_site(site)
+    return name+DECORRELATED_SUFFIX+idx
+
+
+def _is_decorrelated_site(site):
+    """
+    Return True if the site is a sampled site of LoopReparam, which is not saved in the traces
+    """
+    return _split_site(site)[0].endswith(DECORRELATED_SUFFIX)
+
+
+def _unconstrained_slope(fn):
+    """
+    Return the derivative of the transform of the prior at the center of the unconstrained space, e.g. (upper-lower)/4
+    for uniform prior, 1 for normal prior
+    """
+    transform = biject_to(fn.support)
+    return jnp.exp(transform.log_abs_det_jacobian(0., transform(0.)))
+
+
+class LoopReparam(Messenger):
+    """
+    Handler of a numpyro model to sample logK_I_DI and logK_S_DI decorrelated from logK_I_D.
+
+    Example:
+        kernel = NUTS(LoopReparam(global_fitting))
+    """
+    def __init__(self, fn=None):
+        self.bases = {}
+        super().__init__(fn)
+
+    def __enter__(self):
+        self.bases = {}
+        return super().__enter__()
+
+    def process_message(self, msg):
+        if msg['type'] != 'sample' or msg['is_observed']:
+            return
+        base = _base_site(msg['name'])
+        if base is None or not base in self.bases:
+            return
+
+        [base_value, base_fn] = self.bases[base]
+        fn = msg['fn']
+        transform = biject_to(fn.support)
+        ratio = _unconstrained_slope(base_fn)/_unconstrained_slope(fn)
+
+        u = numpyro.sample(_decorrelated_site(msg['name']),
+                           dist.ImproperUniform(constraints.real, fn.batch_shape, fn.event_shape))
+        z = u - ratio*biject_to(base_fn.support).inv(base_value)
+        value = transform(z)
+        numpyro.factor(_decorrelated_site(msg['name'])+'_log_prob',
+                       fn.log_prob(value) + transform.log_abs_det_jacobian(z, value))
+
+        ## The binding constant becomes a deterministic site
+        msg['type'] = 'deterministic'
+        msg['value'] = value
+        for key in list(msg.keys()):
+            if key not in ('type', 'name', 'value', 'cond_indep_stack'):
+                del msg[key]
+
+    def postprocess_message(self, msg):
+        if msg['type'] == 'sample' and not msg['is_observed'] and _split_site(msg['name'])[0] in LOOP_PAIRS.values():
+            self.bases[msg['name']] = [msg['value'], msg['fn']]
+
+
+def _decorrelated_init_values(model, init_values, **model_kwargs):
+    """
+    Parameters:
+    ----------
+    model           : numpyro model, e.g. global_fitting
+    init_values     : dict, initial value for model fitting
+    model_kwargs    : arguments of the model, e.g. experiments, prior_infor, shared_params, args
+    ----------
+    Return the initial values with the sampled sites of LoopReparam, so that the model starts from the same
+    binding constants
+    """
+    model_trace = handlers.trace(handlers.substitute(handlers.seed(model, 0), data=init_values)).get_trace(**model_kwargs)
+    init_values = dict(init_values)
+    for site in model_trace.values():
+        if site['type'] != 'sample' or site['is_observed']:
+            continue
+        base = _base_site(site['name'])
+        if base is None or not base in model_trace or not site['name'] in init_values:
+            continue
+        base_fn = model_trace[base]['fn']
+        ratio = _unconstrained_slope(base_fn)/_unconstrained_slope(site['fn'])
+        z = biject_to(site['fn'].support).inv(site['value'])
+        init_values[_decorrelated_site(site['name'])] = z + ratio*biject_to(base_fn.support).inv(model_trace[base]['value'])
+    return init_values
@@ -0,0 +1,265 @@
+"""
+Local scheduler of the fitting jobs on one multi-core Linux machine. The jobs are kept in a json queue
+file, which is updated when the jobs are added (submit_*.py --queue_file) or when their status changes,
+so that the scheduler can be stopped and resumed at any time (run_scheduler.py).
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import subprocess
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+@contextmanager
+def _locked_queue(queue_file):
+    """
+    Exclusive lock of the queue file, yield the queue and save it when the block ends
+    """
+    lock = open(queue_file+'.lock', 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    try:
+        if os.path.isfile(queue_file):
+            queue = json.load(open(queue_file))
+        else:
+            queue = {'jobs': []}
+        yield queue
+        tmp_file = queue_file+'.tmp'
+        json.dump(queue, open(tmp_file, 'w'), indent=2)
+        os.replace(tmp_file, queue_file)
+    finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+
+def _add_jobs(queue_file, jobs):
+    """
+    Parameters:
+    ----------
+    queue_file  : string, json file of the queue
+    jobs        : list of dict, each contains
+        id          : string, name of the job, jobs with the same id are only added once
+        command     : string, shell command of the job
+        cwd         : optional, string, working directory
+        log_file    : optional, string, file of the standard output and error
+        ncpu        : optional, int, number of cpu cores used by the job, e.g. nchain
+        memory_gb   : optional, float, memory reserved for the job
+    ----------
+    Return number of jobs added to the queue
+    """
+    nadded = 0
+    with _locked_queue(queue_file) as queue:
+        status = {job['id']: job['status'] for job in queue['jobs']}
+        for job in jobs:
+            if job['id'] in status:
+                print(f"{job['id']} is already in the queue ({status[job['id']]}), it is not added again.")
+                continue
+            queue['jobs'].append({'id': job['id'], 'command': job['command'], 'cwd': job.get('cwd', None),
+                                  'log_file': job.get('log_file', None), 'ncpu': int(job.get('ncpu', 1)),
+                                  'memory_gb': job.get('memory_gb', None),
+                                  'status': 'pending', 'attempts': 0, 'returncode': None,
+                                  'pid': None, 'cores': None, 'start_time': None, 'end_time': None})
+            status[job['id']] = 'pending'
+            nadded += 1
+    return nadded
+
+
+def _total_memory_gb():
+    """
+    Return the total memory of the machine from /proc/meminfo, None if unknown
+    """
+    try:
+        for line in open('/proc/meminfo'):
+            if line.startswith('MemTotal:'):
+                return float(line.split()[1])/1024**2
+    except OSError:
+        pass
+    return None
+
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def _status_table(queue):
+    """
+    Return pandas dataframe of the status of all jobs
+    """
+    now = time.time()
+    table = []
+    for job in queue['jobs']:
+        if job['start_time'] is None:
+            elapsed = None
+        else:
+            elapsed = (job['end_time'] if job['end_time'] is not None else now) - job['start_time']
+        table.append({'id': job['id'], 'status': job['status'], 'attempts': job['attempts'],
+                      'returncode': job['returncode'], 'ncpu': job['ncpu'], 'elapsed_time': elapsed,
+                      'log_file': job['log_file']})
+    return pd.DataFrame(table, columns=['id', 'status', 'attempts', 'returncode', 'ncpu', 'elapsed_time', 'log_file'])
+
+
+def _stop_running(queue_file, running, status_file=None, show_progress=True):
+    """
+    Parameters:
+    ----------
+    queue_file      : string, json file of the queue
+    running         : dict of the running jobs, {id: (process, cores, memory, log)}
+    status_file     : optional, string, csv file of the status table
+    ----------
+    Terminating the running jobs, which are pending again in the queue
+    """
+    for job_id, (process, _, _, log) in running.items():
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except OSError:
+            pass
+        log.close()
+    with _locked_queue(queue_file) as queue:
+        for job in queue['jobs']:
+            if job['id'] in running:
+                ## An interrupted job is not counted as an attempt
+                job['status'] = 'pending'
+                job['attempts'] -= 1
+                job['pid'] = None
+        table = _status_table(queue)
+    if status_file is not None:
+        table.to_csv(status_file, index=False)
+    if show_progress:
+        print("Scheduler stopped, the running jobs are pending again.")
+
+
+def _run_queue(queue_file, ncpu=None, memory_gb=None, memory_per_job_gb=0., max_retries=1, poll=5.,
+               status_file=None, retry_failed=False, show_progress=True):
+    """
+    Parameters:
+    ----------
+    queue_file          : string, json file of the queue
+    ncpu                : int, number of cpu cores shared by the jobs, default is all cores
+    memory_gb           : float, memory shared by the jobs, default is the total memory of the machine
+    memory_per_job_gb   : float, memory reserved for the jobs without memory_gb
+    max_retries         : int, number of times a failed job is run again
+    poll                : float, seconds between two checks of the running jobs
+    status_file         : optional, string, csv file of the status table, updated at every check
+    retry_failed        : boolean, if True, the failed jobs of previous runs are run again
+    ----------
+    The jobs are started in the order of the queue whenever enough cores and memory are free. Each job is
+    pinned to its own cores. The jobs left running by a stopped scheduler are run again, and the jobs
+    added to the queue while the scheduler is running are also picked up.
+
+    Return pandas dataframe of the status of all jobs
+    """
+    if ncpu is None:
+        ncpu = os.cpu_count()
+    if memory_gb is None:
+        memory_gb = _total_memory_gb()
+    cores_all = sorted(os.sched_getaffinity(0))[:ncpu] if hasattr(os, 'sched_getaffinity') else list(range(ncpu))
+    free_cores = list(cores_all)
+    free_memory = memory_gb
+
+    running = {}
+    ## Resume: the jobs of a stopped scheduler are pending again
+    with _locked_queue(queue_file) as queue:
+        for job in queue['jobs']:
+            if job['status'] == 'running' and not _pid_alive(job['pid']):
+                job['status'] = 'pending'
+            if retry_failed and job['status'] == 'failed':
+                job['status'] = 'pending'
+                job['attempts'] = 0
+
+    ## The signal handler only records the signal, the queue is updated by the main loop,
+    ## since the handler may run while the main loop holds the lock of the queue
+    stop = []
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.append(signum))
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.append(signum))
+
+    while True:
+        if len(stop) > 0:
+            _stop_running(queue_file, running, status_file, show_progress)
+            sys.exit(1)
+
+        with _locked_queue(queue_file) as queue:
+            jobs = {job['id']: job for job in queue['jobs']}
+
+            ## Checking the running jobs
+            for job_id in list(running.keys()):
+                (process, cores, memory, log) = running[job_id]
+                returncode = process.poll()
+                if returncode is None:
+                    continue
+                log.close()
+                free_cores = sorted(free_cores + cores)
+                if free_memory is not None:
+                    free_memory += memory
+                del running[job_id]
+
+                job = jobs[job_id]
+                job['returncode'] = returncode
+                job['end_time'] = time.time()
+                job['pid'] = None
+                if returncode == 0:
+                    job['status'] = 'done'
+                elif job['attempts'] <= max_retries:
+                    job['status'] = 'pending'
+                else:
+                    job['status'] = 'failed'
+                if show_progress:
+                    print(f"{job_id}: {job['status']} (return code {returncode}, attempt {job['attempts']}).")
+
+            ## Starting the pending jobs if there are enough resources
+            for job in queue['jobs']:
+                if job['status'] != 'pending':
+                    continue
+                job_ncpu = min(max(job['ncpu'], 1), len(cores_all))
+                job_memory = job['memory_gb'] if job['memory_gb'] is not None else memory_per_job_gb
+                if job_ncpu > len(free_cores) or (free_memory is not None and job_memory > free_memory and len(running)>0):
+                    continue
+
+                cores = free_cores[:job_ncpu]
+                free_cores = free_cores[job_ncpu:]
+                if free_memory is not None:
+                    free_memory -= job_memory
+
+                if job['log_file'] is not None:
+                    log = open(job['log_file'], 'a')
+                else:
+                    log = open(os.devnull, 'w')
+                env = dict(os.environ, OMP_NUM_THREADS=str(job_ncpu), MKL_NUM_THREADS=str(job_ncpu))
+                process = subprocess.Popen(job['command'], shell=True, cwd=job['cwd'], env=env,
+                                           stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+                                           preexec_fn=(lambda: os.sched_setaffinity(0, cores)) if hasattr(os, 'sched_setaffinity') else None)
+                running[job['id']] = (process, cores, job_memory, log)
+
+                job['status'] = 'running'
+                job['attempts'] += 1
+                job['pid'] = process.pid
+                job['cores'] = cores
+                job['start_time'] = time.time()
+                job['end_time'] = None
+                job['returncode'] = None
+                if show_progress:
+                    print(f"{job['id']}: started on core(s) {cores}.")
+
+            table = _status_table(queue)
+            npending = sum(job['status'] == 'pending' for job in queue['jobs'])
+
+        if status_file is not None:
+            table.to_csv(status_file, index=False)
+        if len(running) == 0 and npending == 0:
+            break
+        start = time.time()
+        while len(stop) == 0 and time.time()-start < poll:
+            time.sleep(min(0.1, poll))
+
+    if show_progress:
+        print(table.groupby('status').size().to_string())
+    return table
@@ -0,0 +1,212 @@
+"""
+Lightweight timing of the phases of a run (import, data loading, mcmc warm-up and sampling, MAP, convergence,
+pIC50, plotting).
+
+Each phase is timed by the context manager _timed(phase), which can also decorate a function. The record of a
+phase comprises the wall time, the cpu time of the process, the time spent by jax to trace and compile functions
+during the phase, and the peak resident memory (RSS) of the process, sampled every RSS_INTERVAL seconds. The
+finished records are kept in memory until _save_timings(out_dir) appends them to out_dir/timings.json, so the
+records of one fit are saved in its output directory. run_timing_summary.py summarizes the timings.json files
+of a campaign directory.
+
+Example:
+    with _timed('MAP'):
+        ...
+    _save_timings(out_dir)
+"""
+import os
+import sys
+import json
+import time
+import threading
+import resource
+from contextlib import contextmanager
+
+RSS_INTERVAL = 0.2
+JAX_COMPILE_EVENT = '/jax/core/compile/'
+
+_records = []
+_active = []
+_lock = threading.Lock()
+_local = threading.local()
+_state = {'sampler': None, 'compile_listener': False}
+
+
+def _rss_mb():
+    """
+    Return the current resident memory of the process in MB
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1024**2
+    except (OSError, ValueError):
+        return _max_rss_mb()
+
+
+def _max_rss_mb():
+    """
+    Return the peak resident memory of the process since it started in MB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def _process_age():
+    """
+    Return the time since the process started in seconds, None if it is not available
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = float(f.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks/os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _sample_rss():
+    """
+    Updating the peak memory of the running phases
+    """
+    while True:
+        rss = _rss_mb()
+        with _lock:
+            for record in _active:
+                record['peak_rss_mb'] = max(record['peak_rss_mb'], rss)
+        time.sleep(RSS_INTERVAL)
+
+
+def _compile_listener(event, duration, **kwargs):
+    """
+    Adding the duration of the jax compilation events to the running phases
+    """
+    if event.startswith(JAX_COMPILE_EVENT):
+        with _lock:
+            for record in _active:
+                record['compile_time'] += duration
+
+
+def _start_monitoring():
+    """
+    Starting the memory sampler, and the listener of the compilation events once jax is loaded
+    """
+    with _lock:
+        if _state['sampler'] is None:
+            _state['sampler'] = threading.Thread(target=_sample_rss, daemon=True)
+            _state['sampler'].start()
+        if not _state['compile_listener'] and 'jax.monitoring' in sys.modules:
+            sys.modules['jax.monitoring'].register_event_duration_secs_listener(_compile_listener)
+            _state['compile_listener'] = True
+
+
+@contextmanager
+def _timed(phase):
+    """
+    Parameters:
+    ----------
+    phase   : str, name of the phase, e.g. 'sampling' or 'MAP'
+    ----------
+    Timing the block (or the decorated function). The phase which is running when this phase starts in the
+    same thread is saved as its parent. The cpu time is the cpu time of the whole process, including the
+    other threads.
+
+    Yield the record of the phase
+    """
+    _start_monitoring()
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    if len(_local.stack)>0:
+        parent = _local.stack[-1]['phase']
+    else:
+        parent = ''
+
+    record = {'phase': phase, 'parent': parent, 'pid': os.getpid(), 'start_time': time.time(),
+              'elapsed_time': 0., 'cpu_time': 0., 'compile_time': 0., 'peak_rss_mb': _rss_mb()}
+    start_cpu_time = time.process_time()
+    _local.stack.append(record)
+    with _lock:
+        _active.append(record)
+    try:
+        yield record
+    finally:
+        record['elapsed_time'] = time.time() - record['start_time']
+        record['cpu_time'] = time.process_time() - start_cpu_time
+        record['peak_rss_mb'] = max(record['peak_rss_mb'], _rss_mb())
+        record['max_rss_mb'] = _max_rss_mb()
+        _local.stack.remove(record)
+        with _lock:
+            _active.remove(record)
+            _records.append(record)
+
+
+def _record_imports():
+    """
+    Recording the time from the start of the process to this call as the 'import' phase
+    """
+    age = _process_age()
+    if age is None:
+        return
+    rss = _rss_mb()
+    with _lock:
+        _records.append({'phase': 'import', 'parent': '', 'pid': os.getpid(), 'start_time': time.time()-age,
+                         'elapsed_time': age, 'cpu_time': time.process_time(), 'compile_time': 0.,
+                         'peak_rss_mb': rss, 'max_rss_mb': _max_rss_mb()})
+
+
+def _save_timings(out_dir, file_name='timings.json'):
+    """
+    Parameters:
+    ----------
+    out_dir     : str, directory to save the timings
+    file_name   : str, name of the file
+    ----------
+    Appending the records of the finished phases to out_dir/file_name. The records are removed from memory,
+    so that the next phases are saved in the output directory of the next fit.
+
+    Return the number of records saved
+    """
+    with _lock:
+        records = list(_records)
+        _records.clear()
+    if len(records)==0 or out_dir is None or not os.path.isdir(out_dir):
+        return 0
+
+    timing_file = os.path.join(out_dir, file_name)
+    if os.path.isfile(timing_file):
+        try:
+            timings = json.load(open(timing_file))
+        except ValueError:
+            timings = {'records': []}
+    else:
+        timings = {'records': []}
+    timings['records'].extend(records)
+
+    tmp_file = timing_file+'.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(timings, f, indent=2)
+    os.replace(tmp_file, timing_file)
+    return len(records)
+
+
+def _load_timings(campaign_dir, file_name='timings.json'):
+    """
+    Parameters:
+    ----------
+    campaign_dir    : str, directory including the output directories of the fits
+    file_name       : str, name of the timing files
+    ----------
+    Return list of the records of all timing files found in campaign_dir, with the directory of each
+    record relative to campaign_dir (out_dir)
+    """
+    records = []
+    for root, _, files in sorted(os.walk(campaign_dir)):
+        if not file_name in files:
+            continue
+        try:
+            timings = json.load(open(os.path.join(root, file_name)))
+        except ValueError:
+            print("Skipping", os.path.join(root, file_name))
+            continue
+        for record in timings['records']:
+            records.append(dict(record, out_dir=os.path.relpath(root, campaign_dir)))
+    return records
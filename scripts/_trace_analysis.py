@@ -3,8 +3,12 @@ from glob import glob
 import os
 
 import pickle
-import arviz as az
-from pymbar import timeseries
+
+from _lazy_import import lazy_import
+az = lazy_import('arviz')
+pymbar = lazy_import('pymbar')
+
+from _timing import _timed
 
 import numpy as np
 
@@ -550,7 +554,7 @@ def _trace_pymbar(trace, nskip=100, nchain=4, key_to_check=""):
     t0 = 0
     for key in key_to_check:
         trace_t = trace[key]
-        _t0, g, Neff_max = timeseries.detect_equilibration(trace_t, nskip=nskip)
+        _t0, g, Neff_max = pymbar.timeseries.detect_equilibration(trace_t, nskip=nskip)
         if _t0 > t0:
             t0 = _t0
 
@@ -562,6 +566,7 @@ def _trace_pymbar(trace, nskip=100, nchain=4, key_to_check=""):
     return [converged_trace, t0, converged_nsample]
 
 
+@_timed('convergence')
 def _trace_convergence(mcmc_files, out_dir=None, nskip=100, nchain=4, expected_nsample=0,
                        key_to_check="", converged_trace_name='Converged_trace',
                        one_chain_removal=False, digit=1):
@@ -0,0 +1,193 @@
+"""
+File-drop queue of fitting requests served by a long-lived worker (run_worker.py). A request is a json
+file in the request directory. A worker claims it by renaming it to .running, so that several workers can
+share the same directory, and marks it .done or .failed when finished. As the worker process keeps
+running between requests, the imports, the JAX initialization and the compiled functions are reused.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+
+from _scheduler import _pid_alive
+
+
+def _write_json(file_name, content):
+    """
+    Writing the json file atomically, the file is never read half-written
+    """
+    tmp_file = file_name+'.tmp'
+    json.dump(content, open(tmp_file, 'w'), indent=2)
+    os.replace(tmp_file, file_name)
+
+
+def _CRC_fitting_parser():
+    """
+    Return the parser of the options of run_CRC_fitting.py, which are also the options of each request of
+    run_worker.py
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument( "--input_file",                    type=str,               default="")
+    parser.add_argument( "--name_inhibitor",                type=str,               default="")
+    parser.add_argument( "--prior_infor",                   type=str,               default="")
+    parser.add_argument( "--shared_params_infor",           type=str,               default="")
+    parser.add_argument( "--initial_values",                type=str,               default="")
+    parser.add_argument( "--last_run_dir",                  type=str,               default="")
+    parser.add_argument( "--out_dir",                       type=str,               default="")
+    parser.add_argument( "--partition_dir",                 type=str,               default="")
+
+    parser.add_argument( "--fit_E_S",                       action="store_true",    default=False)
+    parser.add_argument( "--fit_E_I",                       action="store_true",    default=False)
+
+    parser.add_argument( "--multi_var",                     action="store_true",    default=False)
+    parser.add_argument( "--multi_alpha",                   action="store_true",    default=False)
+    parser.add_argument( "--set_lognormal_dE",              action="store_true",    default=False)
+    parser.add_argument( "--dE",                            type=float,             default=0.1)
+
+    parser.add_argument( "--set_K_S_DS_equal_K_S_D",        action="store_true",    default=False)
+    parser.add_argument( "--set_K_S_DI_equal_K_S_DS",       action="store_true",    default=False)
+
+    parser.add_argument( "--niters",                        type=int,               default=10000)
+    parser.add_argument( "--nburn",                         type=int,               default=2000)
+    parser.add_argument( "--nthin",                         type=int,               default=1)
+    parser.add_argument( "--nchain",                        type=int,               default=4)
+    parser.add_argument( "--random_key",                    type=int,               default=0)
+    parser.add_argument( "--status_every",                  type=int,               default=0)
+    parser.add_argument( "--adaptation_file",               type=str,               default="")
+    parser.add_argument( "--save_adaptation",               action="store_true",    default=False)
+    parser.add_argument( "--dense_mass",                    type=str,               default="diag")
+    parser.add_argument( "--decorrelate_logK",              action="store_true",    default=False)
+    parser.add_argument( "--chain_method",                  type=str,               default="parallel")
+    parser.add_argument( "--map_refine_topk",               type=int,               default=0)
+    parser.add_argument( "--chunk_size_MAP",                type=int,               default=None)
+
+    parser.add_argument( "--outlier_removal",               action="store_true",    default=False)
+    parser.add_argument( "--posterior_band",                action="store_true",    default=False)
+    parser.add_argument( "--posterior_nsamples",            type=int,               default=100)
+    return parser
+
+
+def _submit_request(request_dir, options, request_id, log_file=None):
+    """
+    Parameters:
+    ----------
+    request_dir : string, directory of the requests
+    options     : string, command line options of the fitting, e.g. "--name_inhibitor ... --out_dir ..."
+    request_id  : string, name of the request file
+    log_file    : optional, string, file of the standard output and error of the fitting
+    ----------
+    Return the request file
+    """
+    if not os.path.isdir(request_dir):
+        os.makedirs(request_dir)
+    request_file = os.path.join(request_dir, request_id+'.json')
+    _write_json(request_file, {'id': request_id, 'options': options, 'log_file': log_file,
+                               'submit_time': time.time()})
+    return request_file
+
+
+def _requeue_requests(request_dir):
+    """
+    The requests claimed by a worker which is not running anymore are submitted again
+
+    Return the number of requeued requests
+    """
+    nrequeued = 0
+    for running_file in glob.glob(os.path.join(request_dir, '*.running')):
+        try:
+            request = json.load(open(running_file))
+        except (OSError, ValueError):
+            continue
+        if not _pid_alive(request.get('pid', None)):
+            os.replace(running_file, running_file[:-len('.running')]+'.json')
+            nrequeued += 1
+    return nrequeued
+
+
+def _claim_request(request_dir):
+    """
+    Return [running_file, request] of the oldest request, [None, None] if there is no request
+    """
+    request_files = sorted(glob.glob(os.path.join(request_dir, '*.json')), key=os.path.getmtime)
+    for request_file in request_files:
+        running_file = request_file[:-len('.json')]+'.running'
+        try:
+            os.rename(request_file, running_file)
+        except OSError:
+            ## Claimed by another worker
+            continue
+        request = json.load(open(running_file))
+        request['pid'] = os.getpid()
+        request['start_time'] = time.time()
+        _write_json(running_file, request)
+        return [running_file, request]
+    return [None, None]
+
+
+def _serve_requests(request_dir, f_request, poll=2., max_requests=None, idle_timeout=None):
+    """
+    Parameters:
+    ----------
+    request_dir     : string, directory of the requests
+    f_request       : function of the options of a request, running the fitting
+    poll            : float, seconds between two checks of the request directory
+    max_requests    : optional, int, the worker stops after this number of requests
+    idle_timeout    : optional, float, the worker stops if there is no request for this number of seconds
+    ----------
+    The requests are run one by one in this process. The working directory is restored after each request.
+    The result of each request (status, elapsed time, error) is saved as request_id.done or request_id.failed.
+
+    Return the number of served requests
+    """
+    if not os.path.isdir(request_dir):
+        os.makedirs(request_dir)
+    nrequeued = _requeue_requests(request_dir)
+    if nrequeued>0:
+        print(f"Requeued {nrequeued} unfinished request(s).")
+
+    cwd = os.getcwd()
+    nserved = 0
+    idle_start = time.time()
+    while max_requests is None or nserved < max_requests:
+        [running_file, request] = _claim_request(request_dir)
+        if request is None:
+            if idle_timeout is not None and time.time()-idle_start > idle_timeout:
+                break
+            time.sleep(poll)
+            continue
+
+        print(f"Running request {request['id']}.")
+        if request.get('log_file', None) is not None:
+            log = open(request['log_file'], 'a')
+        else:
+            log = None
+        try:
+            if log is not None:
+                with redirect_stdout(log), redirect_stderr(log):
+                    f_request(request['options'])
+            else:
+                f_request(request['options'])
+            request['status'] = 'done'
+        except (Exception, SystemExit):
+            request['status'] = 'failed'
+            request['error'] = traceback.format_exc()
+            print(request['error'], file=sys.stderr)
+        finally:
+            if log is not None:
+                log.close()
+            os.chdir(cwd)
+
+        request['end_time'] = time.time()
+        request['elapsed_time'] = request['end_time'] - request['start_time']
+        _write_json(running_file[:-len('.running')]+'.'+request['status'], request)
+        os.remove(running_file)
+        print(f"Request {request['id']}: {request['status']} in {request['elapsed_time']:.1f} s.")
+
+        nserved += 1
+        idle_start = time.time()
+    return nserved
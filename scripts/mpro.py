@@ -0,0 +1,94 @@
+"""
+Single entry point of the scripts. Each run_*.py file is a subcommand, for example
+
+    python mpro.py trace_combining --mcmc_dir ... --out_dir ...
+
+is the same as python run_trace_combining.py --mcmc_dir ... --out_dir ..., and only the packages needed
+by this subcommand are loaded. The list of subcommands is shown by python mpro.py --list.
+
+The cold start time of the subcommands (import of the packages until the arguments are parsed) is
+measured in new processes by
+
+    python mpro.py --benchmark_imports [subcommand ...]
+"""
+
+import os
+import sys
+import glob
+import time
+import runpy
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_PACKAGES = ['jax', 'numpyro', 'arviz', 'seaborn', 'matplotlib', 'pymbar', 'sklearn', 'scipy', 'pandas']
+
+
+def _subcommands():
+    """
+    Return dict of the subcommands and their scripts
+    """
+    scripts = sorted(glob.glob(os.path.join(SCRIPT_DIR, 'run_*.py')))
+    return {os.path.basename(script)[len('run_'):-len('.py')]: script for script in scripts}
+
+
+def _loaded_packages(importtime_log):
+    """
+    Return the heavy packages found in the output of python -X importtime
+    """
+    packages = set()
+    for line in importtime_log.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.split('|')[-1].strip()
+            packages.add(name.split('.')[0])
+    return [package for package in HEAVY_PACKAGES if package in packages]
+
+
+def _benchmark_imports(subcommands, nrepeats=3):
+    """
+    Parameters:
+    ----------
+    subcommands : list of subcommands
+    nrepeats    : number of runs of each subcommand, the fastest one is reported
+    ----------
+    Each subcommand is run with --help in a new process, so that the time includes the start of python
+    and the import of all packages before the arguments are parsed.
+
+    Return list of [subcommand, time, loaded heavy packages]
+    """
+    scripts = _subcommands()
+    results = []
+    for subcommand in subcommands:
+        times = []
+        for n in range(nrepeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-X', 'importtime', scripts[subcommand], '--help'],
+                                    cwd=SCRIPT_DIR, capture_output=True, text=True)
+            times.append(time.perf_counter()-start)
+        if output.returncode != 0:
+            results.append([subcommand, None, ['failed']])
+        else:
+            results.append([subcommand, min(times), _loaded_packages(output.stderr)])
+    return results
+
+
+if __name__ == '__main__':
+    subcommands = _subcommands()
+
+    if len(sys.argv) < 2 or sys.argv[1] in ['-h', '--help', '--list']:
+        print(__doc__)
+        print("Subcommands:\n    " + "\n    ".join(subcommands.keys()))
+
+    elif sys.argv[1] == '--benchmark_imports':
+        names = sys.argv[2:] if len(sys.argv) > 2 else list(subcommands.keys())
+        for name in names:
+            assert name in subcommands, f"Unknown subcommand {name}."
+        print(f"{'subcommand':<36}{'time (s)':>10}   loaded packages")
+        for [name, elapsed, packages] in _benchmark_imports(names):
+            elapsed = '-' if elapsed is None else '%0.2f' %elapsed
+            print(f"{name:<36}{elapsed:>10}   {' '.join(packages)}")
+
+    else:
+        name = sys.argv[1]
+        assert name in subcommands, f"Unknown subcommand {name}, please check python mpro.py --list."
+        sys.argv = [subcommands[name]] + sys.argv[2:]
+        runpy.run_path(subcommands[name], run_name='__main__')
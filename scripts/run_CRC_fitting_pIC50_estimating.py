@@ -2,6 +2,9 @@
 This file is used to fit to one CRC. First, it checks if there is outlier(s) in the CRC. 
 Then, model is fitted. If the model converges, pIC50 is estimated. Otherwise, more samples can be 
 generated and all the samples of multiple runnings are combined before checking the convergence again.
+
+With --prescreen laplace (or svi), the posterior is first approximated. If the approximation is reliable
+(Pareto k-hat lower than --prescreen_khat), pIC50 is estimated from it and NUTS is not run.
 """
 
 import warnings
@@ -20,28 +23,27 @@ import jax
 import jax.numpy as jnp
 import numpyro
 
-import matplotlib.pyplot as plt
-
-from pymbar import timeseries
-
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter("ignore", UserWarning)
 warnings.simplefilter("ignore", RuntimeWarning)
 warnings.filterwarnings("ignore")
 
-from _load_data import load_data_one_inhibitor
+from _load_data import load_data_one_inhibitor, _read_inhibitor_data
 
 from _define_model import Model
-from _CRC_fitting import _run_mcmc_CRC, _expt_check_noise_trend
+from _CRC_fitting import _run_mcmc_CRC, _run_approximate_CRC, _expt_check_noise_trend, _outliers_each_curve
 
-from _MAP_mpro import _map_running
+from _MAP_mpro import _map_running, _load_extra_fields
 from _params_extraction import extract_logK_n_idx, extract_kcat_n_idx
-from _trace_analysis import TraceConverter, _trace_convergence, _convergence_rhat
+from _trace_analysis import TraceConverter, TraceExtraction, _trace_convergence, _convergence_rhat
 from _plotting import plot_data_conc_log, plotting_trace
+from _posterior_predictive import posterior_predictive_bands
 
-from _pIC50 import _adjust_trace, _pIC_hill
+from _pIC50 import _adjust_trace, _pIC
 
 from _save_setting import save_model_setting
+from _chain_method import _use_host_devices
+from _timing import _record_imports, _save_timings
 
 parser = argparse.ArgumentParser()
 
@@ -51,6 +53,7 @@ parser.add_argument( "--prior_infor",                   type=str,
 parser.add_argument( "--shared_params_infor",           type=str,               default="")
 parser.add_argument( "--initial_values",                type=str,               default="")
 parser.add_argument( "--out_dir",                       type=str,               default="")
+parser.add_argument( "--partition_dir",                 type=str,               default="")
 
 parser.add_argument( "--fit_E_S",                       action="store_true",    default=False)
 parser.add_argument( "--fit_E_I",                       action="store_true",    default=False)
@@ -68,6 +71,14 @@ parser.add_argument( "--nburn",                         type=int,
 parser.add_argument( "--nthin",                         type=int,               default=1)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
+parser.add_argument( "--status_every",                  type=int,               default=0)
+parser.add_argument( "--adaptation_file",               type=str,               default="")
+parser.add_argument( "--save_adaptation",               action="store_true",    default=False)
+parser.add_argument( "--dense_mass",                    type=str,               default="diag")
+parser.add_argument( "--decorrelate_logK",              action="store_true",    default=False)
+parser.add_argument( "--chain_method",                  type=str,               default="parallel")
+parser.add_argument( "--map_refine_topk",               type=int,               default=0)
+parser.add_argument( "--chunk_size_MAP",                type=int,               default=None)
 
 parser.add_argument( "--outlier_removal",               action="store_true",    default=False)
 parser.add_argument( "--exclude_first_trace",           action="store_true",    default=False)
@@ -76,12 +87,70 @@ parser.add_argument( "--converged_samples",             type=int,
 
 parser.add_argument( "--enzyme_conc_nM",                type=float,             default="100")
 parser.add_argument( "--substrate_conc_nM",             type=float,             default="1350")
+parser.add_argument( "--pIC_method",                    type=str,               default="hill")
+parser.add_argument( "--n_points",                      type=int,               default=50)
+parser.add_argument( "--adaptive_grid",                 action="store_true",    default=False)
+parser.add_argument( "--posterior_band",                action="store_true",    default=False)
+parser.add_argument( "--posterior_nsamples",            type=int,               default=100)
+
+parser.add_argument( "--prescreen",                     type=str,               default="")
+parser.add_argument( "--prescreen_khat",                type=float,             default=0.7)
+parser.add_argument( "--svi_steps",                     type=int,               default=2000)
 
 args = parser.parse_args()
 
 from jax.config import config
 config.update("jax_enable_x64", True)
-numpyro.set_host_device_count(args.nchain)
+if _use_host_devices(args.chain_method, args.nchain):
+    numpyro.set_host_device_count(args.nchain)
+_record_imports()
+
+
+
+def _fitting_plot(trace, expts, expts_plot, outliers, model, expt_dir):
+    """
+    Finding MAP of the trace and plotting the fitted CRC in expt_dir
+    """
+    [trace_map, map_index] = _map_running(trace=trace.copy(), expts=expts, prior_infor=model.prior_infor, 
+                                          shared_params=model.shared_params, args=model.args,
+                                          extra_fields=_load_extra_fields(expt_dir, model.args.traces_name))
+
+    params_logK, params_kcat = TraceExtraction(trace=trace).extract_params_from_map_and_prior(map_index, model.prior_infor)
+
+    alpha_list = {key: trace[key][map_index] for key in trace.keys() if key.startswith('alpha')}
+    E_list = {key: trace[key][map_index] for key in trace.keys() if key.startswith('dE')}
+
+    n = 0
+    if args.posterior_band:
+        bands = posterior_predictive_bands(expts_plot, trace, model.prior_infor, model.shared_params, n,
+                                           nsamples=args.posterior_nsamples,
+                                           cache_file=os.path.join(expt_dir, 'posterior_bands.pickle'))
+    else:
+        bands = None
+
+    plot_data_conc_log(expts_plot, extract_logK_n_idx(params_logK, n, model.shared_params),
+                       extract_kcat_n_idx(params_kcat, n, model.shared_params),
+                       alpha_list=alpha_list, E_list=E_list, outliers=outliers,
+                       OUTFILE=os.path.join(expt_dir,'EI'), adaptive_grid=args.adaptive_grid,
+                       bands=bands)
+
+
+def _pIC50_estimation(trace, logK_dE_alpha, logDtot, logStot, logItot):
+    """
+    Estimating dimer-only pIC50 from 100 samples of the trace
+
+    Return list of 5 parameters, see _pIC50._pIC
+    """
+    data = az.InferenceData.to_dataframe(az.convert_to_inference_data(trace))
+    
+    _nthin = int(len(data)/100)
+    if logK_dE_alpha is not None:
+        df = _adjust_trace(data.iloc[::_nthin, :].copy(), logK_dE_alpha)
+    else:
+        df = data.iloc[::_nthin, :].copy()
+
+    return _pIC(df, logDtot, logStot, logItot, args.pIC_method, args.adaptive_grid)
+
 
 print("ninter:", args.niters)
 print("nburn:", args.nburn)
@@ -89,9 +158,9 @@ print("nchain:", args.nchain)
 print("nthin:", args.nthin)
 
 ### Data
-df_mers = pd.read_csv(args.input_file)
-
 inhibitor_name = args.name_inhibitor.split()
+df_mers = _read_inhibitor_data(args.input_file, inhibitor_name, args.partition_dir)
+
 for i, name in enumerate(inhibitor_name):
     expts_init, expts_plot = load_data_one_inhibitor(df_mers[(df_mers['Inhibitor_ID']==name)*(df_mers['Drop']!=1.0)],
                                                      multi_var=args.multi_var)
@@ -100,6 +169,7 @@ if len(expts_plot)>0:
     
     ## Outlier detection and trend checking
     [expts_outliers, outliers, _, _] = _expt_check_noise_trend(expts_init)
+    outliers = _outliers_each_curve(expts_init, outliers, expts_plot)
     if args.outlier_removal:
         expts = expts_outliers.copy()
     else:
@@ -132,7 +202,7 @@ if len(expts_plot)>0:
     init_logStot = np.log(args.substrate_conc_nM*1E-9)
     init_logDtot = init_logMtot-np.log(2)
 
-    n_points = 50
+    n_points = args.n_points
     min_conc = 1E-12
     max_conc = 1E-3
 
@@ -153,13 +223,46 @@ if len(expts_plot)>0:
 
     print(f"\nAnalyzing {inhibitor_name[0]}")
 
-    while no_running<=no_limit:
+    name_expt = inhibitor_name[0]
+    prescreen_passed = False
+    if len(args.prescreen)>0:
+        ### Approximation of the posterior, NUTS is only run if it is not reliable
+        for _dir in [os.path.join(args.out_dir, 'prescreen'), os.path.join(args.out_dir, 'prescreen', name_expt),
+                     os.path.join(args.out_dir, 'Convergence', name_expt)]:
+            if not os.path.isdir(_dir):
+                os.mkdir(_dir)
+        expt_dir = os.path.join(args.out_dir, 'prescreen', name_expt)
+
+        print(f'\nPre-screening {name_expt} by {args.prescreen} approximation:')
+        [trace, diagnostics] = _run_approximate_CRC(expts=expts, prior_infor=model.prior_infor, shared_params=model.shared_params,
+                                                    init_values=None, out_dir=expt_dir, args=model.args, method=args.prescreen,
+                                                    khat_threshold=args.prescreen_khat, num_steps=args.svi_steps)
+
+        if diagnostics['passed']:
+            _fitting_plot(trace, expts, expts_plot, outliers, model, expt_dir)
+            save_model_setting(args, OUTDIR=expt_dir, OUTFILE='setting.pickle')
+
+            thetas = _pIC50_estimation(trace, logK_dE_alpha, logDtot, logStot, logItot)
+            pIC50 = thetas[2][thetas[3]>0]
+            mes = f"pIC50 ({args.prescreen} approximation, k-hat = %0.2f): " %diagnostics['khat'] + \
+                "%0.3f" % np.median(pIC50) + " +- %0.3f" % np.std(pIC50) + "\n"
+
+            pickle.dump(trace, open(os.path.join(args.out_dir, 'Convergence', name_expt, "traces.pickle"), "wb"))
+            prescreen_passed = True
+        else:
+            mes = f"The {args.prescreen} approximation is not reliable (k-hat = %0.2f), running NUTS." %diagnostics['khat']
+
+        print(mes)
+        with open(os.path.join(args.out_dir, 'Convergence', name_expt, "log.txt"), "a") as f:
+            print(mes, file=f)
+        _save_timings(expt_dir)
+
+    while no_running<=no_limit and not prescreen_passed:
 
         ### Fitting
         if not os.path.isdir(os.path.join(args.out_dir, f'sampling_{no_running}')):
             os.mkdir(os.path.join(args.out_dir, f'sampling_{no_running}'))
 
-        name_expt = inhibitor_name[0]
         expt_dir = os.path.join(args.out_dir, f'sampling_{no_running}', name_expt)
         last_dir = os.path.join(args.out_dir, f'sampling_{no_running-1}', name_expt)
         
@@ -196,26 +299,14 @@ if len(expts_plot)>0:
                 trace = _run_mcmc_CRC(expts=expts, prior_infor=model.prior_infor, shared_params=model.shared_params, 
                                       init_values=None, last_run_dir=last_dir, out_dir=expt_dir, args=model.args)
 
-            ## Finding MAP
-            [trace_map, map_index] = _map_running(trace=trace.copy(), expts=expts, prior_infor=model.prior_infor, 
-                                                  shared_params=model.shared_params, args=model.args)
-
-            ## Fitting plot
-            params_logK, params_kcat = TraceExtraction(trace=trace).extract_params_from_map_and_prior(map_index, model.prior_infor)
-
-            alpha_list = {key: trace[key][map_index] for key in trace.keys() if key.startswith('alpha')}
-            E_list = {key: trace[key][map_index] for key in trace.keys() if key.startswith('dE')}
-
-            n = 0
-            plot_data_conc_log(expts_plot, extract_logK_n_idx(params_logK, n, model.shared_params),
-                               extract_kcat_n_idx(params_kcat, n, model.shared_params),
-                               alpha_list=alpha_list, E_list=E_list, outliers=outliers,
-                               OUTFILE=os.path.join(expt_dir,'EI'))
+            ## Finding MAP and fitting plot
+            _fitting_plot(trace, expts, expts_plot, outliers, model, expt_dir)
                 
             ## Saving the model fitting condition
             save_model_setting(args, OUTDIR=expt_dir, OUTFILE='setting.pickle')
+            _save_timings(expt_dir)
             
-            del trace, trace_map
+            del trace
 
         ### Extracting all traces.pickles of one experiment from multiple sampling runs
         if not os.path.isdir(os.path.join(args.out_dir, 'Convergence', name_expt)):
@@ -232,16 +323,8 @@ if len(expts_plot)>0:
                                                            key_to_check=key_to_check, one_chain_removal=True)
 
         if flag: #if number of converged samples returned from pymbar is enough
-            data = az.InferenceData.to_dataframe(az.convert_to_inference_data(trace))
-            
             ### Estimating dimer-only pIC50
-            _nthin = int(len(data)/100)
-            if logK_dE_alpha is not None:
-                df = _adjust_trace(data.iloc[::_nthin, :].copy(), logK_dE_alpha)
-            else:
-                df = data.iloc[::_nthin, :].copy()
-
-            thetas = _pIC_hill(df, logDtot, logStot, logItot)
+            thetas = _pIC50_estimation(trace, logK_dE_alpha, logDtot, logStot, logItot)
             pIC50_list = thetas[2]
             hill_list = thetas[3]
             
@@ -256,9 +339,11 @@ if len(expts_plot)>0:
                 
                 pickle.dump(trace, open(os.path.join(args.out_dir, 'Convergence', name_expt, "traces.pickle"), "wb"))
                 plotting_trace(trace, os.path.join(args.out_dir, 'Convergence', name_expt), nchain_updated)
+                _save_timings(os.path.join(args.out_dir, 'Convergence', name_expt))
                 
                 break
 
+        _save_timings(os.path.join(args.out_dir, 'Convergence', name_expt))
         del trace
         no_running += 1
 
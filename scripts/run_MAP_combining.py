@@ -2,14 +2,9 @@ import os
 import argparse
 from glob import glob
 import numpy as np
-import jax
-import jax.numpy as jnp
 
 import pickle
 
-from jax.config import config
-config.update("jax_enable_x64", True)
-
 parser = argparse.ArgumentParser()
 
 parser.add_argument( "--mcmc_dir",                      type=str,               default="")
@@ -2,15 +2,10 @@ import os
 import argparse
 from glob import glob
 import numpy as np
-import jax
-import jax.numpy as jnp
 
 import pickle
 import pandas as pd
 
-from jax.config import config
-config.update("jax_enable_x64", True)
-
 parser = argparse.ArgumentParser()
 
 parser.add_argument( "--data_file",                     type=str,               default="")
@@ -5,7 +5,6 @@ import os
 import argparse
 
 import pickle
-import arviz as az
 import pandas as pd
 
 import jax
@@ -47,6 +46,8 @@ parser.add_argument( "--set_K_S_DI_equal_K_S_DS",       action="store_true",
 parser.add_argument( "--niters",                        type=int,               default=0)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--nsamples_MAP",                  type=str,               default=None)
+parser.add_argument( "--map_refine_topk",               type=int,               default=0)
+parser.add_argument( "--chunk_size_MAP",                type=int,               default=None)
 
 args = parser.parse_args()
 
@@ -6,7 +6,6 @@ import itertools
 import argparse
 
 import pickle
-import arviz as az
 import pandas as pd
 import seaborn as sns
 
@@ -36,6 +35,8 @@ parser.add_argument( "--include_experiments",           type=str,
 parser.add_argument( "--exclude_experiments",           type=str,               default="")
 
 parser.add_argument( "--bootstrapping",                 action="store_true",    default=False)
+parser.add_argument( "--n_bootstrap",                   type=int,               default=100)
+parser.add_argument( "--seed",                          type=int,               default=0)
 parser.add_argument( "--leave_p_out_CV",                action="store_true",    default=False)
 parser.add_argument( "--p_out_CV",                      type=int,               default="10")
 
@@ -144,7 +145,7 @@ for keys, assay_name, change_names in zip([IC50_keys, IC90_keys], [assay_name_50
         os.chdir(os.path.join(args.out_dir, "Bootstrap"))
 
         for _method in ['pearsonr', 'spearmanr', 'kendall', 'RMSD', 'aRMSD']:
-            table = corr_bootstrap_matrix(dat, keys, method=_method)
+            table = corr_bootstrap_matrix(dat, keys, args.n_bootstrap, method=_method, seed=args.seed)
             table = table.rename(index=change_names)
             table.to_csv(f'pIC{keys[i][-2:]}_{_method}.csv')
 
@@ -154,6 +155,6 @@ for keys, assay_name, change_names in zip([IC50_keys, IC90_keys], [assay_name_50
         os.chdir(os.path.join(args.out_dir, "LpOCV"))
 
         for _method in ['pearsonr', 'spearmanr', 'kendall', 'RMSD', 'aRMSD']:
-            table = corr_leave_p_out_matrix(dat, keys, method=_method)
+            table = corr_leave_p_out_matrix(dat, keys, args.p_out_CV, method=_method)
             table = table.rename(index=change_names)
             table.to_csv(f'pIC{keys[i][-2:]}_{_method}.csv')
\ No newline at end of file
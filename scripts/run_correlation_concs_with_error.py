@@ -10,12 +10,7 @@ import itertools
 import argparse
 
 import pickle
-import arviz as az
 import pandas as pd
-import seaborn as sns
-
-import matplotlib
-import matplotlib.pyplot as plt
 
 import jax
 import jax.numpy as jnp
@@ -27,7 +22,7 @@ warnings.simplefilter("ignore", RuntimeWarning)
 from jax.config import config
 config.update("jax_enable_x64", True)
 
-from _pIC50 import table_pIC_hill_one_inhibitor, _pIC_hill_one_inhibitor
+from _pIC50 import _load_thinned_traces, _pIC_sweep
 from _pIC50_correlation import _df_pIC50_pIC90, corr_leave_p_out
 
 parser = argparse.ArgumentParser()
@@ -44,6 +39,9 @@ parser.add_argument( "--inhibit_pIC50_file",            type=str,
 parser.add_argument( "--enzyme_conc_nM",                type=int,               default=100)
 parser.add_argument( "--substrate_conc_nM",             type=int,               default=1350)
 parser.add_argument( "--conc_uncertainnty_log",         type=float,             default=0.1)
+parser.add_argument( "--pIC_method",                    type=str,               default="hill")
+parser.add_argument( "--seed",                          type=int,               default=0)
+parser.add_argument( "--nworkers",                      type=int,               default=1)
 
 parser.add_argument( "--set_K_S_DS_equal_K_S_D",        action="store_true",    default=False)
 parser.add_argument( "--set_K_S_DI_equal_K_S_DS",       action="store_true",    default=False)
@@ -133,57 +131,24 @@ else:
     max_conc = 1E-3
 
     # Introduce random errors to enzyme and substrate concentrations
-    adjusted_init_logDtot = init_logDtot + np.random.normal(loc=0, scale=args.conc_uncertainnty_log, size=n_sim) # uncertainty X% of ln[E] concentration
-    adjusted_init_logStot = init_logStot + np.random.normal(loc=0, scale=args.conc_uncertainnty_log, size=n_sim) # uncertainty X% of ln[S] concentration
-    logItot = np.linspace(np.log(min_conc), np.log(max_conc), n_points)
-
-    df_dimer = pd.DataFrame([np.zeros(n_sim*N), np.zeros(n_sim*N), np.zeros(n_sim*N), np.zeros(n_sim*N), np.zeros(n_sim*N)], 
-                            index=['ID', 'sim', 'pIC50', 'pIC90', 'hill']).T
-
-    row_idx = 0
-    for n, inhibitor in enumerate(inhibitor_list):
-
-        inhibitor_dir = inhibitor[7:12]
-        inhibitor_name = inhibitor[:12]
-
-        print(f"Analyzing {inhibitor_name}")
-
-        # # Loop over simulations
-        # for _ in range(n_sim):
-        #     logD = np.ones(n_points)*adjusted_init_logDtot[_]
-        #     logStot = np.ones(n_points)*adjusted_init_logStot[_]
-
-        #     # pIC50, hill slope, and pIC90 estimation
-        #     df = table_pIC_hill_one_inhibitor(inhibitor, args.mcmc_dir, logD, logStot, logItot,
-        #                                       logK_dE_alpha)
-
-        #     pIC50_list = np.array(df.pIC50)
-        #     pIC90_list = np.array(df.pIC90)
-        #     hill_list = np.array(df.hill)
-        #     print(pIC50_list)
-
-        #     filtered_pIC50 = pIC50_list[hill_list>1]
-        #     filtered_pIC90 = pIC90_list[hill_list>1]
-        #     filtered_hill = hill_list[hill_list>1]
-
-        #     df_dimer.at[row_idx, 'ID'] = inhibitor_name
-        #     df_dimer.at[row_idx, 'sim'] = _
-        #     df_dimer.at[row_idx, 'pIC50'] = np.median(filtered_pIC50)
-        #     df_dimer.at[row_idx, 'pIC90'] = np.median(filtered_pIC90)
-        #     df_dimer.at[row_idx, 'hill'] = np.median(filtered_hill)
-        #     row_idx += 1
-
-        f_table = _pIC_hill_one_inhibitor
-        list_median_std = np.array(list(map(lambda i: f_table(inhibitor, args.mcmc_dir, 
-                                                              np.ones(n_points)*adjusted_init_logDtot[i], np.ones(n_points)*adjusted_init_logStot[i], logItot, 
-                                                              'median', logK_dE_alpha), range(n_sim))))
-        for _ in range(n_sim):
-            df_dimer.at[row_idx, 'ID'] = inhibitor_name
-            df_dimer.at[row_idx, 'sim'] = _
-            df_dimer.at[row_idx, 'pIC50'] = list_median_std[_, 0]
-            df_dimer.at[row_idx, 'pIC90'] = list_median_std[_, 4]
-            df_dimer.at[row_idx, 'hill'] = list_median_std[_, 2]
-            row_idx += 1
+    rng = np.random.default_rng(args.seed)
+    adjusted_init_logDtot = init_logDtot + rng.normal(loc=0, scale=args.conc_uncertainnty_log, size=n_sim) # uncertainty X% of ln[E] concentration
+    adjusted_init_logStot = init_logStot + rng.normal(loc=0, scale=args.conc_uncertainnty_log, size=n_sim) # uncertainty X% of ln[S] concentration
+
+    # pIC50, hill slope, and pIC90 of all simulations, inhibitors and samples of the traces at once
+    [ID_list, params, mask] = _load_thinned_traces(inhibitor_list, args.mcmc_dir, logK_dE_alpha)
+    assert len(ID_list)>0, "No trace found in "+args.mcmc_dir
+    print(f"Analyzing {len(ID_list)} inhibitors under {n_sim} simulated concentrations.")
+
+    [pIC50, hill, pIC90] = _pIC_sweep(params, mask, adjusted_init_logDtot, adjusted_init_logStot, min_conc, max_conc,
+                                      method=args.pIC_method, n_points=n_points, nworkers=args.nworkers)
+
+    ## Median over the samples of each inhibitor in each simulation, ordered by inhibitor then simulation
+    df_dimer = pd.DataFrame({'ID': np.repeat([inhibitor[:12] for inhibitor in ID_list], n_sim),
+                             'sim': np.tile(np.arange(n_sim), len(ID_list)),
+                             'pIC50': np.nanmedian(pIC50, axis=2).T.ravel(),
+                             'pIC90': np.nanmedian(pIC90, axis=2).T.ravel(),
+                             'hill': np.nanmedian(hill, axis=2).T.ravel()})
     
     df_dimer.to_csv("pIC_table.csv", index=True)
 
@@ -224,7 +189,7 @@ for keys, change_names in zip([IC50_keys, IC90_keys], [change_names_50,change_na
                     y = dat[keys[j]]
                     mean_corr, std_corr = corr_leave_p_out(x, y, args.p_out_CV, _method)
                     text = str('%5.3f' %mean_corr) +' ± ' +str('%5.3e' %std_corr)
-                table.iloc[i][keys[j]] = text
+                table.at[i, keys[j]] = text
         table = table.rename(index=change_names)
         table.to_csv(f'pIC{keys[i][-2:]}_{_method}.csv')
         del table
\ No newline at end of file
@@ -21,6 +21,7 @@ warnings.simplefilter("ignore", RuntimeWarning)
 from _load_data_mers import load_data_no_inhibitor, load_data_one_inhibitor
 
 from _define_model import Model
+from _model import EI_fitting
 from _model_fitting import _run_mcmc_EI
 
 from _MAP_mpro import _map_running
@@ -53,6 +54,8 @@ parser.add_argument( "--nburn",                         type=int,
 parser.add_argument( "--nthin",                         type=int,               default=1)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
+parser.add_argument( "--map_refine_topk",               type=int,               default=0)
+parser.add_argument( "--chunk_size_MAP",                type=int,               default=None)
 
 args = parser.parse_args()
 
@@ -85,7 +88,7 @@ trace = _run_mcmc_EI(expts=expts, prior_infor=model.prior_infor, shared_params=m
 
 ## Finding MAP
 [trace_map, map_index] = _map_running(trace=trace.copy(), expts=expts, prior_infor=model.prior_infor, 
-                                      shared_params=model.shared_params, args=model.args)
+                                      shared_params=model.shared_params, args=model.args, model=EI_fitting)
 
 ## Fitting plot
 params_logK, params_kcat = TraceExtraction(trace=trace_map).extract_params_from_map_and_prior(map_index, model.prior_infor)
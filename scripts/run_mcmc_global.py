@@ -23,8 +23,10 @@ from _load_data_mers import load_data_no_inhibitor, load_data_one_inhibitor
 
 from _define_model import Model
 from _model_fitting import _run_mcmc
+from _chain_method import _use_host_devices
+from _timing import _record_imports, _save_timings
 
-from _MAP_mpro import _map_running
+from _MAP_mpro import _map_running, _load_extra_fields
 from _params_extraction import extract_logK_n_idx, extract_kcat_n_idx
 from _trace_analysis import TraceExtraction
 from _plotting import plot_data_conc_log, plotting_trace_global
@@ -61,12 +63,22 @@ parser.add_argument( "--nburn",                         type=int,
 parser.add_argument( "--nthin",                         type=int,               default=1)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
+parser.add_argument( "--status_every",                  type=int,               default=0)
+parser.add_argument( "--adaptation_file",               type=str,               default="")
+parser.add_argument( "--save_adaptation",               action="store_true",    default=False)
+parser.add_argument( "--dense_mass",                    type=str,               default="diag")
+parser.add_argument( "--decorrelate_logK",              action="store_true",    default=False)
+parser.add_argument( "--chain_method",                  type=str,               default="parallel")
+parser.add_argument( "--map_refine_topk",               type=int,               default=0)
+parser.add_argument( "--chunk_size_MAP",                type=int,               default=None)
 
 args = parser.parse_args()
 
 from jax.config import config
 config.update("jax_enable_x64", True)
-numpyro.set_host_device_count(args.nchain)
+if _use_host_devices(args.chain_method, args.nchain):
+    numpyro.set_host_device_count(args.nchain)
+_record_imports()
 
 print("ninter:", args.niters)
 print("nburn:", args.nburn)
@@ -126,7 +138,8 @@ plotting_trace_global(trace=trace, out_dir=os.path.join(args.out_dir, 'Trace_plo
 
 ## Finding MAP
 [trace_map, map_index] = _map_running(trace=trace.copy(), expts=expts, prior_infor=model.prior_infor, 
-                                      shared_params=model.shared_params, args=model.args)
+                                      shared_params=model.shared_params, args=model.args,
+                                      extra_fields=_load_extra_fields(args.out_dir, model.args.traces_name))
 
 ## Fitting plot
 params_logK, params_kcat = TraceExtraction(trace=trace_map).extract_params_from_map_and_prior(map_index, model.prior_infor)
@@ -170,4 +183,6 @@ for i in range(len(inhibitor_name)):
                        OUTFILE=os.path.join(args.out_dir, 'Fitting', 'ESI_'+str(i)))
 
 ## Saving the model fitting condition
-save_model_setting(model.args, OUTDIR=args.out_dir, OUTFILE='setting.pickle')
\ No newline at end of file
+save_model_setting(model.args, OUTDIR=args.out_dir, OUTFILE='setting.pickle')
+
+_save_timings(args.out_dir)
\ No newline at end of file
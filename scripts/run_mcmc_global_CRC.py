@@ -15,7 +15,7 @@ warnings.simplefilter("ignore", UserWarning)
 warnings.simplefilter("ignore", RuntimeWarning)
 
 from _model_mers import global_fitting
-from _load_data_mers import load_data_no_inhibitor, load_data_one_inhibitor
+from _load_data_mers import load_data_campaign
 from _plotting import plot_data_conc_log, plotting_trace_global
 from _MAP_finding_mpro import map_finding
 
@@ -24,6 +24,8 @@ from _params_extraction import extract_logK_n_idx, extract_kcat_n_idx
 from _trace_analysis import TraceExtraction
 
 from _save_setting import save_model_setting
+from _chain_method import _use_host_devices
+from _timing import _record_imports, _save_timings
 
 parser = argparse.ArgumentParser()
 
@@ -55,32 +57,43 @@ parser.add_argument( "--nburn",                         type=int,
 parser.add_argument( "--nthin",                         type=int,               default=1)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
+parser.add_argument( "--status_every",                  type=int,               default=0)
+parser.add_argument( "--adaptation_file",               type=str,               default="")
+parser.add_argument( "--save_adaptation",               action="store_true",    default=False)
+parser.add_argument( "--dense_mass",                    type=str,               default="diag")
+parser.add_argument( "--decorrelate_logK",              action="store_true",    default=False)
+parser.add_argument( "--chain_method",                  type=str,               default="parallel")
+parser.add_argument( "--map_refine_topk",               type=int,               default=0)
+parser.add_argument( "--chunk_size_MAP",                type=int,               default=None)
 
 args = parser.parse_args()
 
 from jax.config import config
 config.update("jax_enable_x64", True)
-numpyro.set_host_device_count(args.nchain)
+if _use_host_devices(args.chain_method, args.nchain):
+    numpyro.set_host_device_count(args.nchain)
+_record_imports()
 
 print("ninter:", args.niters)
 print("nburn:", args.nburn)
 print("nchain:", args.nchain)
 print("nthin:", args.nthin)
 
-df_mers = pd.read_csv(args.input_file)
 if len(args.list_inhibitor)>0:
     inhibitor_name = np.unique(args.list_inhibitor.split())
 else:
-    inhibitor_name = np.unique(df_mers[df_mers['Inhibitor (nM)']>0.0]['Inhibitor_ID'])
+    inhibitor_name = None
+
+## Reading the csv file once for the datasets of all inhibitors
+[expts_no_I, expts_plot_no_I, expts_inhibitor] = load_data_campaign(args.input_file, multi_var=args.multi_var,
+                                                                    inhibitor_list=inhibitor_name)
+inhibitor_name = list(expts_inhibitor.keys())
 
-expts_no_I, expts_plot_no_I = load_data_no_inhibitor(df_mers[df_mers['Inhibitor (nM)']==0.0], 
-                                                     multi_var=args.multi_var)
 no_expt = [len(expts_plot_no_I)]
 expts = expts_no_I
 expts_plot = expts_plot_no_I
 for i, name in enumerate(inhibitor_name):
-    expts_, expts_plot_ = load_data_one_inhibitor(df_mers[(df_mers['Inhibitor_ID']==name)*(df_mers['Drop']!=1)],
-                                                  multi_var=args.multi_var)
+    expts_, expts_plot_ = expts_inhibitor[name]
     expts = expts + expts_
     expts_plot = expts_plot + expts_plot_
     no_expt.append(len(expts_plot_))
@@ -163,4 +176,6 @@ for i in range(len(inhibitor_name)):
                        OUTFILE=os.path.join(args.out_dir, 'Fitting', 'ESI_'+str(i)))
 
 ## Saving the model fitting condition
-save_model_setting(model.args, OUTDIR=args.out_dir, OUTFILE='setting.pickle')
\ No newline at end of file
+save_model_setting(model.args, OUTDIR=args.out_dir, OUTFILE='setting.pickle')
+
+_save_timings(args.out_dir)
\ No newline at end of file
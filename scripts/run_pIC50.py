@@ -12,10 +12,7 @@ import argparse
 import glob
 
 import pickle
-import arviz as az
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 
 import jax
 import jax.numpy as jnp
@@ -28,7 +25,7 @@ from _kinetics import ReactionRate_DimerOnly
 from _model import _dE_find_prior
 from _load_data_mers import load_data_one_inhibitor
 from _CRC_fitting import _expt_check_noise_trend
-from _pIC50 import table_pIC_hill_one_inhibitor
+from _pIC50 import table_pIC_hill_one_inhibitor, _map_inhibitors
 
 from jax.config import config
 config.update("jax_enable_x64", True)
@@ -50,6 +47,10 @@ parser.add_argument( "--exclude_experiments",           type=str,
 
 parser.add_argument( "--enzyme_conc_nM",                type=float,             default="100")
 parser.add_argument( "--substrate_conc_nM",             type=float,             default="1350")
+parser.add_argument( "--pIC_method",                    type=str,               default="hill")
+parser.add_argument( "--n_points",                      type=int,               default=50)
+parser.add_argument( "--adaptive_grid",                 action="store_true",    default=False)
+parser.add_argument( "--nworkers",                      type=int,               default=1)
 
 args = parser.parse_args()
 
@@ -86,7 +87,7 @@ init_logMtot = np.log(args.enzyme_conc_nM*1E-9)
 init_logStot = np.log(args.substrate_conc_nM*1E-9)
 init_logDtot = init_logMtot-np.log(2)
 
-n_points = 50
+n_points = args.n_points
 min_conc = 1E-12
 max_conc = 1E-3
 
@@ -140,6 +141,11 @@ params_name = params_name + other_params_name
 N = len(inhibitor_list)
 table = pd.DataFrame([np.zeros(N)], params_name).T
 
+# pIC50, hill slope, and pIC90 estimation
+df_list = _map_inhibitors(table_pIC_hill_one_inhibitor, inhibitor_list, 
+                          [args.mcmc_dir, logD, logStot, logItot, logK_dE_alpha, 'traces.pickle', 
+                           args.out_dir, args.pIC_method, args.adaptive_grid], args.nworkers, script_path=__file__)
+
 ID_list = []
 for n, inhibitor in enumerate(inhibitor_list):
 
@@ -148,9 +154,8 @@ for n, inhibitor in enumerate(inhibitor_list):
 
     ID_list.append(inhibitor_name)
 
-    # pIC50, hill slope, and pIC90 estimation
-    df = table_pIC_hill_one_inhibitor(inhibitor, args.mcmc_dir, logD, logStot, logItot,
-                                      logK_dE_alpha, 'traces.pickle', args.out_dir)
+    df = df_list[n]
+    df_list[n] = None
     if df is not None:
         print(f"Analyzing {inhibitor_name}")
         for name in kinetic_params_name:
@@ -12,10 +12,7 @@ import itertools
 import argparse
 
 import pickle
-import arviz as az
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 from scipy.optimize import minimize
 
 import jax
@@ -25,6 +22,7 @@ from jax.config import config
 config.update("jax_enable_x64", True)
 
 from _pIC50 import _pd_mean_std_pIC, _correct_ID, table_pIC_hill_multi_inhibitor
+from _pIC50 import _load_thinned_traces, _median_pIC50_multi_inhibitor
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter("ignore", UserWarning)
@@ -44,8 +42,23 @@ parser.add_argument( "--set_K_S_DI_equal_K_S_DS",       action="store_true",
 
 parser.add_argument( "--exclude_experiments",           type=str,               default="")
 
+parser.add_argument( "--pIC_method",                    type=str,               default="hill")
+parser.add_argument( "--n_points",                      type=int,               default=50)
+parser.add_argument( "--adaptive_grid",                 action="store_true",    default=False)
+
+parser.add_argument( "--optimizer",                     type=str,               default="COBYLA")
+parser.add_argument( "--nsamples",                      type=int,               default=100)
+parser.add_argument( "--n_scan",                        type=int,               default=20)
+parser.add_argument( "--nworkers",                      type=int,               default=1)
+
 args = parser.parse_args()
 
+## The gradient-based optimizers estimate the pIC50 directly from the reaction rate, without simulating the CRCs
+if args.optimizer != 'COBYLA':
+    ignored = [f'--{name}' for name in ['pIC_method', 'n_points', 'adaptive_grid'] if getattr(args, name) != parser.get_default(name)]
+    if len(ignored)>0:
+        parser.error(f"{', '.join(ignored)} can only be used with --optimizer COBYLA.")
+
 df_mers = pd.read_csv(args.inhibitor_file)
 _inhibitor_list = np.unique(df_mers[df_mers['Inhibitor (nM)']>0.0]['Inhibitor_ID'])
 
@@ -73,7 +86,7 @@ _df_cell.insert(len(_df_cell.columns), 'cell_pIC50', -np.log10(_df_cell.IC50*1E-
 df_cell = _correct_ID(_pd_mean_std_pIC(_df_cell, 'cell_pIC50'))
 
 
-def f_find_conc(init_logconc, inhibitor_list, mcmc_dir, n_points = 50, min_conc_I=1E-12, max_conc_I=1E-3):
+def f_find_conc(init_logconc, inhibitor_list, mcmc_dir, n_points = 50, min_conc_I=1E-12, max_conc_I=1E-3, adaptive=False):
     """
     For a set of inhibitors, dimer-only pIC50s can be simulated given the specified values of 
     dimer/substrate concentrations and kinetic parameters from mcmc trace.
@@ -88,6 +101,7 @@ def f_find_conc(init_logconc, inhibitor_list, mcmc_dir, n_points = 50, min_conc_
     n_points        : numer of datapoints to simulate concentration-response curve
     min_conc_I      : float, minimum value of inhibitor concentration
     max_conc_I      : float, maximum value of inhibitor concentration
+    adaptive        : bool, simulating the CRCs on the adaptive grid of inhibitor concentrations
     ----------
 
     """
@@ -97,7 +111,9 @@ def f_find_conc(init_logconc, inhibitor_list, mcmc_dir, n_points = 50, min_conc_
 
     table = table_pIC_hill_multi_inhibitor(inhibitor_list=inhibitor_list, mcmc_dir=mcmc_dir,
                                            logDtot=logDtot, logStot=logStot, logItot=logItot,
-                                           measure='median', logK_dE_alpha=logK_dE_alpha)
+                                           measure='median', logK_dE_alpha=logK_dE_alpha,
+                                           method=args.pIC_method, adaptive=adaptive, nworkers=args.nworkers,
+                                           script_path=__file__)
     if table is None:
         return 0
     else:
@@ -108,9 +124,56 @@ def f_find_conc(init_logconc, inhibitor_list, mcmc_dir, n_points = 50, min_conc_
         return RMSD
 
 
-res = minimize(f_find_conc, x0=np.log(1*1E-6), method='COBYLA', tol=1E-6,
-               bounds=((-21, -3),), args=(inhibitor_list, args.mcmc_dir))
-init_logconc = res.x[0]
+def f_RMSD(init_logconc, params, mask, cell_pIC50, min_conc_I=1E-12, max_conc_I=1E-3):
+    """
+    Differentiable deviation between dimer-only pIC50s and cellular pIC50s. The dimer-only pIC50s are 
+    estimated directly from the reaction rate (_pIC_direct) for all samples of all inhibitors at once.
+    
+    Parameters:
+    ----------
+    init_logconc    : initial concentrations under ln scale.
+    params          : list of arrays (ninhibitors, nsamples) of the parameters from _load_thinned_traces
+    mask            : boolean array (ninhibitors, nsamples) of the samples from _load_thinned_traces
+    cell_pIC50      : vector of cellular pIC50 of the inhibitors
+    min_conc_I      : float, minimum value of inhibitor concentration
+    max_conc_I      : float, maximum value of inhibitor concentration
+    ----------
+    """
+    pIC50 = _median_pIC50_multi_inhibitor(init_logconc-np.log(2), init_logconc+np.log(1E3), 
+                                          params, mask, min_conc_I, max_conc_I)
+    return jnp.sqrt(jnp.nanmean((pIC50 - cell_pIC50)**2))
+
+
+if args.optimizer == 'COBYLA':
+    res = minimize(f_find_conc, x0=np.log(1*1E-6), method='COBYLA', tol=1E-6,
+                   bounds=((-21, -3),), args=(inhibitor_list, args.mcmc_dir, args.n_points, 1E-12, 1E-3, args.adaptive_grid))
+    init_logconc = res.x[0]
+else:
+    ## Loading the traces once for all evaluations of the objective function
+    [IDs, params, mask] = _load_thinned_traces(inhibitor_list, args.mcmc_dir, logK_dE_alpha, 'traces.pickle', args.nsamples)
+    assert len(IDs)>0, "No trace found in "+args.mcmc_dir
+    dat = pd.merge(pd.DataFrame({'ID': IDs, 'idx': np.arange(len(IDs))}), df_cell[['ID', 'cell_pIC50']], on='ID', how='inner')
+    assert len(dat)>0, "No inhibitor has both the trace and the cellular pIC50."
+    params = [param[dat.idx.values] for param in params]
+    mask = mask[dat.idx.values]
+    cell_pIC50 = jnp.array(dat.cell_pIC50.values)
+
+    ## Scanning the grid of concentrations in one batched pass
+    logconc_scan = np.linspace(-21, -3, args.n_scan)
+    RMSD_scan = np.array(jax.jit(jax.vmap(lambda x: f_RMSD(x, params, mask, cell_pIC50)))(logconc_scan))
+    pd.DataFrame({'init_logconc': logconc_scan, 'RMSD': RMSD_scan}).to_csv(os.path.join(args.out_dir, "concentrations_scan.csv"), index=False)
+    x0 = logconc_scan[np.nanargmin(RMSD_scan)]
+    print("Best concentration from the scan under ln scale: %.3f, RMSD = %.4f" %(x0, np.nanmin(RMSD_scan)))
+
+    ## Gradient-based optimization from the best point of the scan
+    f_value_grad = jax.jit(jax.value_and_grad(lambda x: f_RMSD(x, params, mask, cell_pIC50)))
+    def f_objective(x):
+        [value, grad] = f_value_grad(x[0])
+        return float(value), np.array([grad])
+
+    res = minimize(f_objective, x0=[x0], jac=True, method=args.optimizer, bounds=((-21, -3),))
+    init_logconc = res.x[0]
+    print("RMSD =", round(float(res.fun), 4))
 
 init_logDtot = init_logconc-np.log(2)
 init_logStot = init_logconc+np.log(1E3)
@@ -0,0 +1,118 @@
+"""
+Estimating the dimer-only pIC50 for a list of inhibitor giving their traces.pickle files in mcmc_dir,
+under every combination of the enzyme and substrate concentrations. The traces are loaded once and
+the pIC50, hill slope, and pIC90 of all conditions are estimated together. The results are saved
+as a tidy table with one row for each inhibitor and each condition.
+"""
+
+import warnings
+import numpy as np
+import os
+import itertools
+import argparse
+import time
+
+import pickle
+import pandas as pd
+
+import jax
+jax.config.update("jax_enable_x64", True)
+
+from _pIC50 import _load_thinned_traces, _pIC_sweep
+
+warnings.simplefilter(action='ignore', category=FutureWarning)
+warnings.simplefilter("ignore", UserWarning)
+warnings.simplefilter("ignore", RuntimeWarning)
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument( "--inhibitor_file",                type=str,               default="")
+parser.add_argument( "--mcmc_dir",                      type=str,               default="")
+parser.add_argument( "--out_dir",                       type=str,               default="")
+parser.add_argument( "--out_file",                      type=str,               default="pIC50_sweep.csv")
+parser.add_argument( "--logK_dE_alpha_file",            type=str,               default="")
+
+parser.add_argument( "--set_K_S_DS_equal_K_S_D",        action="store_true",    default=False)
+parser.add_argument( "--set_K_S_DI_equal_K_S_DS",       action="store_true",    default=False)
+
+parser.add_argument( "--include_experiments",           type=str,               default="")
+parser.add_argument( "--exclude_experiments",           type=str,               default="")
+
+parser.add_argument( "--enzyme_conc_nM",                type=str,               default="100")
+parser.add_argument( "--substrate_conc_nM",             type=str,               default="1350")
+
+parser.add_argument( "--pIC_method",                    type=str,               default="direct")
+parser.add_argument( "--n_points",                      type=int,               default=50)
+parser.add_argument( "--adaptive_grid",                 action="store_true",    default=False)
+parser.add_argument( "--measure",                       type=str,               default="median")
+
+parser.add_argument( "--nsamples",                      type=int,               default=100)
+parser.add_argument( "--chunk_size",                    type=int,               default=10000)
+parser.add_argument( "--nworkers",                      type=int,               default=1)
+
+args = parser.parse_args()
+
+assert args.measure in ['mean', 'median'], print("Please check the statistical measure again.")
+
+df_mers = pd.read_csv(args.inhibitor_file)
+_inhibitor_list = np.unique(df_mers[df_mers['Inhibitor (nM)']>0.0]['Inhibitor_ID'])
+
+include_experiments = args.include_experiments.split()
+exclude_experiments = args.exclude_experiments.split()
+if len(include_experiments)>0:
+    inhibitor_list = [name for name in _inhibitor_list if (name[:12] not in exclude_experiments) and (name[:12] in include_experiments)]
+else:
+    inhibitor_list = [name for name in _inhibitor_list if name[:12] not in exclude_experiments]
+
+if len(args.logK_dE_alpha_file)>0 and os.path.isfile(args.logK_dE_alpha_file):
+    logK_dE_alpha = pickle.load(open(args.logK_dE_alpha_file, "rb"))
+
+    if args.set_K_S_DS_equal_K_S_D:
+        logK_dE_alpha['logK_S_DS'] = logK_dE_alpha['logK_S_D']
+    if args.set_K_S_DI_equal_K_S_DS:
+        logK_dE_alpha['logK_S_DI'] = logK_dE_alpha['logK_S_DS']
+
+    for key in ['logKd', 'logK_S_D', 'logK_S_DS', 'kcat_DS', 'kcat_DSS']:
+        assert key in logK_dE_alpha.keys(), f"Please provide {key} in logK_dE_alpha_file."
+else:
+    logK_dE_alpha = None
+
+## Grid of conditions
+enzyme_conc_nM = [float(conc) for conc in args.enzyme_conc_nM.split()]
+substrate_conc_nM = [float(conc) for conc in args.substrate_conc_nM.split()]
+conditions = list(itertools.product(enzyme_conc_nM, substrate_conc_nM))
+
+logDtot = np.array([np.log(E*1E-9)-np.log(2) for (E, S) in conditions])
+logStot = np.array([np.log(S*1E-9) for (E, S) in conditions])
+
+## Loading traces once
+start = time.time()
+[ID_list, params, mask] = _load_thinned_traces(inhibitor_list, args.mcmc_dir, logK_dE_alpha, 'traces.pickle', args.nsamples)
+assert len(ID_list)>0, "No trace found in "+args.mcmc_dir
+print(f"Loaded {len(ID_list)} inhibitors in {time.time()-start:.1f} s.")
+
+start = time.time()
+[pIC50, hill, pIC90] = _pIC_sweep(params, mask, logDtot, logStot, method=args.pIC_method,
+                                  n_points=args.n_points, adaptive=args.adaptive_grid,
+                                  chunk_size=args.chunk_size, nworkers=args.nworkers)
+print(f"Estimated {len(conditions)} conditions in {time.time()-start:.1f} s.")
+
+if args.measure == 'mean':
+    f_measure = np.nanmean
+else:
+    f_measure = np.nanmedian
+
+table = []
+for i, (E, S) in enumerate(conditions):
+    for n, inhibitor in enumerate(ID_list):
+        row = {'ID': inhibitor, 'enzyme_conc_nM': E, 'substrate_conc_nM': S}
+        for name, values in zip(['pIC50', 'hill', 'pIC90'], [pIC50[i, n], hill[i, n], pIC90[i, n]]):
+            row[name] = f_measure(values)
+            row[name+'_std'] = np.nanstd(values)
+        row['nsamples'] = int(np.sum(np.isfinite(pIC50[i, n])))
+        table.append(row)
+table = pd.DataFrame(table)
+
+if not os.path.exists(args.out_dir):
+    os.makedirs(args.out_dir)
+table.to_csv(os.path.join(args.out_dir, args.out_file), index=False)
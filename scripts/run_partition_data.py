@@ -0,0 +1,24 @@
+"""
+This file is used to partition the csv file of a campaign by inhibitor once, before submitting the
+per-inhibitor jobs. Each job then loads only the partition of its inhibitor (--partition_dir).
+"""
+
+import os
+import time
+import argparse
+
+from _load_data import _write_partitions
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument( "--input_file",                    type=str,               default="")
+parser.add_argument( "--partition_dir",                 type=str,               default="")
+
+args = parser.parse_args()
+
+assert os.path.isfile(args.input_file), "Please provide the input_file."
+assert len(args.partition_dir)>0, "Please provide the partition_dir."
+
+start = time.time()
+index = _write_partitions(args.input_file, args.partition_dir)
+print(f"Saved {len(index['partitions'])} partitions to {args.partition_dir} in {time.time()-start:.1f} s.")
@@ -0,0 +1,89 @@
+"""
+This file is used to compare the settings of NUTS (diagonal, block-dense or dense mass matrix, with or without
+the decorrelating reparameterization of the binding constants, and the chain method) on the same model, e.g. the
+MERS global model fitted by run_mcmc_global.py. Each setting is run one after another in its own folder of out_dir,
+and the ESS per second, the ESS per cpu second (throughput per core) and the number of divergences reported in
+sampling_efficiency.json are summarized in sampler_benchmark.csv. The settings already finished are not run again.
+
+A setting is the mass matrix followed by the options joined by '+', e.g. diag+decorrelate or diag+vectorized.
+"""
+
+import os
+import json
+import shlex
+import argparse
+import subprocess
+import pandas as pd
+
+from _chain_method import CHAIN_METHODS
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument( "--running_script",                type=str,               default="")
+parser.add_argument( "--options",                       type=str,               default="")
+parser.add_argument( "--out_dir",                       type=str,               default="")
+
+parser.add_argument( "--settings",                      type=str,               default="diag block dense diag+decorrelate block+decorrelate")
+
+args = parser.parse_args()
+
+assert len(args.running_script)>0, "Please provide the running_script, e.g. run_mcmc_global.py."
+assert not '--out_dir' in args.options, "The output folder of each setting is created in out_dir."
+
+if not os.path.isdir(args.out_dir):
+    os.mkdir(args.out_dir)
+
+table = []
+for setting in args.settings.split():
+    [dense_mass, *setting_options] = setting.split('+')
+    assert dense_mass in ['diag', 'dense', 'block'], "The mass matrix should be diag, dense or block."
+    for option in setting_options:
+        assert option in ['decorrelate']+CHAIN_METHODS, "The options should be decorrelate or a chain method."
+
+    if 'decorrelate' in setting_options:
+        decorrelate_logK = " --decorrelate_logK "
+    else:
+        decorrelate_logK = " "
+
+    chain_methods = [option for option in setting_options if option in CHAIN_METHODS]
+    if len(chain_methods)>0:
+        chain_method = " --chain_method " + chain_methods[-1]
+    else:
+        chain_method = " "
+
+    ## Each setting runs in its own folder, the paths given to the running script should be absolute
+    out_dir = os.path.abspath(os.path.join(args.out_dir, setting))
+    efficiency_file = os.path.join(out_dir, 'sampling_efficiency.json')
+    if not os.path.isfile(efficiency_file):
+        if not os.path.isdir(out_dir):
+            os.mkdir(out_dir)
+        command = '''python ''' + shlex.quote(os.path.abspath(args.running_script)) + ''' ''' + args.options + \
+            ''' --out_dir ''' + shlex.quote(out_dir) + ''' --dense_mass ''' + dense_mass + decorrelate_logK + chain_method
+        print("Running", setting)
+        with open(os.path.join(out_dir, 'benchmark.log'), 'w') as log:
+            output = subprocess.run(command, shell=True, cwd=out_dir, stdout=log, stderr=subprocess.STDOUT)
+        if output.returncode != 0 or not os.path.isfile(efficiency_file):
+            print("Failed", setting, ", please check", os.path.join(out_dir, 'benchmark.log'))
+            table.append({'setting': setting})
+            continue
+
+    efficiency = json.load(open(efficiency_file))
+    table.append({'setting': setting, 'elapsed_time': efficiency['elapsed_time'],
+                  'ess_min': efficiency['ess_min'], 'ess_median': efficiency['ess_median'],
+                  'ess_min_per_second': efficiency['ess_min_per_second'],
+                  'ess_median_per_second': efficiency['ess_median_per_second'],
+                  'chain_method': efficiency.get('chain_method', None),
+                  'cpu_time': efficiency.get('cpu_time', None),
+                  'ess_min_per_cpu_second': efficiency.get('ess_min_per_cpu_second', None),
+                  'divergences': efficiency.get('divergences', None)})
+
+table = pd.DataFrame(table)
+if 'ess_min_per_second' in table.columns:
+    ## Gain compared to the first setting
+    table['gain_ess_min_per_second'] = table['ess_min_per_second']/table['ess_min_per_second'].iloc[0]
+if 'ess_min_per_cpu_second' in table.columns:
+    ess_per_cpu_second = pd.to_numeric(table['ess_min_per_cpu_second'])
+    table['gain_ess_min_per_cpu_second'] = ess_per_cpu_second/ess_per_cpu_second.iloc[0]
+pd.set_option('display.width', 200)
+print(table.to_string(index=False, float_format=lambda x: '%.3f' %x))
+table.to_csv(os.path.join(args.out_dir, 'sampler_benchmark.csv'), index=False)
@@ -0,0 +1,45 @@
+"""
+This file is used to run the jobs added to a queue file by submit_*.py --queue_file on the local machine.
+The jobs run in parallel given the number of cpu cores (nchain of each job) and the memory. The scheduler
+can be stopped and run again with the same queue file, the unfinished jobs are then resumed.
+"""
+
+import os
+import argparse
+
+from _scheduler import _run_queue
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument( "--queue_file",                    type=str,               default="")
+parser.add_argument( "--status_file",                   type=str,               default="")
+
+parser.add_argument( "--ncpu",                          type=int,               default=0)
+parser.add_argument( "--memory_gb",                     type=float,             default=0.)
+parser.add_argument( "--memory_per_job_gb",             type=float,             default=0.)
+parser.add_argument( "--max_retries",                   type=int,               default=1)
+parser.add_argument( "--poll",                          type=float,             default=5.)
+parser.add_argument( "--retry_failed",                  action="store_true",    default=False)
+
+args = parser.parse_args()
+
+assert os.path.isfile(args.queue_file), "Please provide the queue_file."
+
+if args.ncpu>0:
+    ncpu = args.ncpu
+else:
+    ncpu = None
+
+if args.memory_gb>0:
+    memory_gb = args.memory_gb
+else:
+    memory_gb = None
+
+if len(args.status_file)>0:
+    status_file = args.status_file
+else:
+    status_file = os.path.splitext(args.queue_file)[0]+'_status.csv'
+
+_run_queue(args.queue_file, ncpu=ncpu, memory_gb=memory_gb, memory_per_job_gb=args.memory_per_job_gb,
+           max_retries=args.max_retries, poll=args.poll, status_file=status_file,
+           retry_failed=args.retry_failed)
@@ -0,0 +1,53 @@
+"""
+This file is used to collect the status.json files reported by the running mcmc jobs (--status_every)
+and summarize the progress and convergence of all jobs in one table, without loading the traces.
+"""
+
+import os
+import json
+import time
+import argparse
+from glob import glob
+import pandas as pd
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument( "--mcmc_dir",                      type=str,               default="")
+parser.add_argument( "--out_file",                      type=str,               default="")
+
+parser.add_argument( "--rhat_threshold",                type=float,             default=1.1)
+parser.add_argument( "--ess_threshold",                 type=float,             default=400)
+
+args = parser.parse_args()
+
+status_files = glob(os.path.join(args.mcmc_dir, "**", "status.json"), recursive=True)
+assert len(status_files)>0, "No status.json found in "+args.mcmc_dir
+status_files.sort()
+
+table = []
+for status_file in status_files:
+    try:
+        status = json.load(open(status_file))
+    except (json.JSONDecodeError, OSError):
+        continue
+    max_rhat = status.get('max_rhat', None)
+    min_ess = status.get('min_ess', None)
+    if max_rhat is None or min_ess is None:
+        converged = False
+    else:
+        converged = max_rhat < args.rhat_threshold and min_ess > args.ess_threshold
+    table.append({'run': os.path.relpath(os.path.dirname(status_file), args.mcmc_dir),
+                  'phase': status.get('phase', None),
+                  'progress': status.get('progress', None),
+                  'nsample_per_chain': status.get('nsample_per_chain', None),
+                  'max_rhat': max_rhat, 'min_ess': min_ess, 'converged': converged,
+                  'elapsed_time': status.get('elapsed_time', None),
+                  'last_update (s)': time.time()-os.path.getmtime(status_file)})
+
+table = pd.DataFrame(table)
+pd.set_option('display.max_rows', None)
+pd.set_option('display.width', 200)
+print(table.to_string(index=False, float_format=lambda x: '%.3f' %x))
+
+if len(args.out_file)>0:
+    table.to_csv(args.out_file, index=False)
@@ -0,0 +1,59 @@
+"""
+This file is used to summarize the timings.json files (see _timing.py) of all fits in a campaign directory,
+e.g. the output directory of submit_CRC_pIC50.py. The time, cpu time, jax compilation time and peak memory
+are summarized by phase in timing_summary.csv, and the total time of the top-level phases of each output
+directory is reported in timing_by_dir.csv. All records are saved in timing_records.csv.
+"""
+
+import os
+import argparse
+import pandas as pd
+
+from _timing import _load_timings
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument( "--campaign_dir",                  type=str,               default="")
+parser.add_argument( "--out_dir",                       type=str,               default="")
+
+args = parser.parse_args()
+
+assert os.path.isdir(args.campaign_dir), "Please provide the campaign_dir."
+if len(args.out_dir)>0:
+    out_dir = args.out_dir
+else:
+    out_dir = args.campaign_dir
+if not os.path.isdir(out_dir):
+    os.mkdir(out_dir)
+
+records = pd.DataFrame(_load_timings(args.campaign_dir))
+if len(records)==0:
+    print("There is no timings.json found in", args.campaign_dir)
+else:
+    records.to_csv(os.path.join(out_dir, 'timing_records.csv'), index=False)
+
+    ## The phases without parent do not overlap, their sum is the total time of the runs
+    top_level = records['parent']==''
+    total_time = records.loc[top_level, 'elapsed_time'].sum()
+
+    summary = records.groupby('phase').agg(count=('elapsed_time', 'size'),
+                                           elapsed_time=('elapsed_time', 'sum'),
+                                           mean_elapsed_time=('elapsed_time', 'mean'),
+                                           max_elapsed_time=('elapsed_time', 'max'),
+                                           cpu_time=('cpu_time', 'sum'),
+                                           compile_time=('compile_time', 'sum'),
+                                           peak_rss_mb=('peak_rss_mb', 'max'))
+    summary['fraction_of_total'] = summary['elapsed_time']/total_time
+    summary = summary.sort_values('elapsed_time', ascending=False)
+    summary.to_csv(os.path.join(out_dir, 'timing_summary.csv'))
+
+    by_dir = records[top_level].groupby('out_dir').agg(elapsed_time=('elapsed_time', 'sum'),
+                                                       cpu_time=('cpu_time', 'sum'),
+                                                       compile_time=('compile_time', 'sum'))
+    by_dir['peak_rss_mb'] = records.groupby('out_dir')['peak_rss_mb'].max()
+    by_dir = by_dir.sort_values('elapsed_time', ascending=False)
+    by_dir.to_csv(os.path.join(out_dir, 'timing_by_dir.csv'))
+
+    pd.set_option('display.width', 200)
+    print(f"{len(records)} phases in {records['out_dir'].nunique()} directories, total time: {total_time:.1f} s")
+    print(summary.to_string(float_format=lambda x: '%.3f' %x))
@@ -4,7 +4,6 @@ from glob import glob
 import numpy as np
 
 import pickle
-from pymbar import timeseries
 
 from _trace_analysis import _combining_multi_trace
 from _plotting import plotting_trace
@@ -0,0 +1,89 @@
+"""
+This code is designed to keep one process running to fit many concentration-response curves, given the
+requests in request_dir (submit_CRC.py --request_dir). Each request has the same options as
+run_CRC_fitting.py and the results are saved in the same way. The imports, the JAX initialization and
+the compiled functions are shared by all requests instead of being repeated for each job.
+"""
+
+import warnings
+import shlex
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+import numpyro
+
+warnings.simplefilter(action='ignore', category=FutureWarning)
+warnings.simplefilter("ignore", UserWarning)
+warnings.simplefilter("ignore", RuntimeWarning)
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument( "--request_dir",                   type=str,               default="")
+parser.add_argument( "--nchain",                        type=int,               default=4)
+parser.add_argument( "--chain_method",                  type=str,               default="parallel")
+parser.add_argument( "--compilation_cache_dir",         type=str,               default="")
+parser.add_argument( "--poll",                          type=float,             default=2.)
+parser.add_argument( "--max_requests",                  type=int,               default=0)
+parser.add_argument( "--idle_timeout",                  type=float,             default=0.)
+
+args = parser.parse_args()
+
+assert len(args.request_dir)>0, "Please provide the request_dir."
+
+## The number of devices is fixed when JAX starts, the requests use up to nchain parallel chains.
+## With --chain_method vectorized or sequential, no device is added and the chains of the requests share one core.
+from _chain_method import _use_host_devices
+from jax.config import config
+config.update("jax_enable_x64", True)
+if _use_host_devices(args.chain_method, args.nchain):
+    numpyro.set_host_device_count(args.nchain)
+
+## The compiled functions are also saved on disk and reused by the next workers
+if len(args.compilation_cache_dir)>0:
+    config.update("jax_compilation_cache_dir", args.compilation_cache_dir)
+    config.update("jax_persistent_cache_min_compile_time_secs", 0)
+
+from _load_data import _read_inhibitor_data
+from _CRC_fitting import _CRC_fitting_one_inhibitor
+from _worker import _serve_requests, _CRC_fitting_parser
+from _timing import _record_imports
+
+_record_imports()
+
+## Options of each request, the same as run_CRC_fitting.py
+fitting_parser = _CRC_fitting_parser()
+
+
+def f_request(options):
+    fitting_args = fitting_parser.parse_args(shlex.split(options))
+    if fitting_args.nchain > args.nchain:
+        print(f"Only {args.nchain} chains can run in parallel, the other chains run sequentially.")
+
+    print("ninter:", fitting_args.niters)
+    print("nburn:", fitting_args.nburn)
+    print("nchain:", fitting_args.nchain)
+    print("nthin:", fitting_args.nthin)
+
+    inhibitor_name = np.array([fitting_args.name_inhibitor])
+    df_mers = _read_inhibitor_data(fitting_args.input_file, inhibitor_name, fitting_args.partition_dir)
+    try:
+        _CRC_fitting_one_inhibitor(df_mers, fitting_args)
+    finally:
+        plt.close('all')
+
+
+if args.max_requests>0:
+    max_requests = args.max_requests
+else:
+    max_requests = None
+
+if args.idle_timeout>0:
+    idle_timeout = args.idle_timeout
+else:
+    idle_timeout = None
+
+nserved = _serve_requests(args.request_dir, f_request, poll=args.poll, max_requests=max_requests,
+                          idle_timeout=idle_timeout)
+print(f"Served {nserved} request(s).")
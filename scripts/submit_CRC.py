@@ -9,6 +9,9 @@ import argparse
 import numpy as np
 import pandas as pd
 
+from _scheduler import _add_jobs
+from _worker import _submit_request
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument( "--input_file",                    type=str,               default="")
@@ -36,9 +39,19 @@ parser.add_argument( "--nburn",                         type=int,
 parser.add_argument( "--nthin",                         type=int,               default=1)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
+parser.add_argument( "--status_every",                  type=int,               default=0)
+parser.add_argument( "--adaptation_file",               type=str,               default="")
+parser.add_argument( "--save_adaptation",               action="store_true",    default=False)
+parser.add_argument( "--dense_mass",                    type=str,               default="diag")
+parser.add_argument( "--decorrelate_logK",              action="store_true",    default=False)
+parser.add_argument( "--chain_method",                  type=str,               default="parallel")
 
 parser.add_argument( "--outlier_removal",               action="store_true",    default=False)
 
+parser.add_argument( "--queue_file",                    type=str,               default="")
+parser.add_argument( "--request_dir",                   type=str,               default="")
+parser.add_argument( "--memory_gb",                     type=float,             default=0.)
+
 args = parser.parse_args()
 
 if args.fit_E_S: 
@@ -96,16 +109,28 @@ if args.outlier_removal:
 else:
     outlier_removal = " "
 
+if len(args.adaptation_file)>0:
+    adaptation_file = " --adaptation_file " + args.adaptation_file
+else:
+    adaptation_file = " "
+
+if args.save_adaptation:
+    save_adaptation = " --save_adaptation "
+else:
+    save_adaptation = " "
+
+if args.decorrelate_logK:
+    decorrelate_logK = " --decorrelate_logK "
+else:
+    decorrelate_logK = " "
+
 if not os.path.isdir(args.out_dir):
     os.mkdir(args.out_dir)
 
 qsub_file = os.path.join(args.out_dir, f"CRC.sh")
 log_file = os.path.join(args.out_dir, f"CRC.log")
 
-qsub_script = '''#!/bin/bash
-conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n date \n((''' + \
-    '''python ''' + args.running_script + \
-    ''' --name_inhibitor ''' + args.name_inhibitor + \
+options = ''' --name_inhibitor ''' + args.name_inhibitor + \
     ''' --input_file ''' + args.input_file + prior_infor + shared_params + \
     fit_E_S + fit_E_I + map_file + ''' --out_dir ''' + args.out_dir + \
     multi_var + multi_alpha + set_lognormal_dE + ''' --dE %0.5f '''%args.dE + \
@@ -114,8 +139,33 @@ conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n date \n((''' + \
     ''' --nburn %d '''%args.nburn + \
     ''' --nthin %d '''%args.nthin + \
     ''' --nchain %d '''%args.nchain + \
-    ''' --random_key %d '''%args.random_key + outlier_removal + \
-    '''\n\n'''
-open(qsub_file, "w").write(qsub_script)
-qsub_script = ''') 2>&1) | tee ''' + log_file
-open(qsub_file, "a").write(qsub_script)
\ No newline at end of file
+    ''' --random_key %d '''%args.random_key + \
+    ''' --status_every %d '''%args.status_every + adaptation_file + save_adaptation + \
+    ''' --dense_mass ''' + args.dense_mass + decorrelate_logK + \
+    ''' --chain_method ''' + args.chain_method + outlier_removal
+command = '''python ''' + args.running_script + options
+
+if len(args.request_dir)>0:
+    ## Fitting by a running worker (run_worker.py)
+    request_id = os.path.basename(os.path.normpath(args.out_dir))+'_'+args.name_inhibitor
+    print("Adding " + _submit_request(args.request_dir, options, request_id, log_file=log_file))
+elif len(args.queue_file)>0:
+    ## The vectorized or sequential chains of one job run on one core
+    if args.chain_method in ['vectorized', 'sequential']:
+        ncpu = 1
+    else:
+        ncpu = args.nchain
+    if args.memory_gb>0:
+        memory_gb = args.memory_gb
+    else:
+        memory_gb = None
+    job = {'id': os.path.abspath(qsub_file), 'command': command, 'cwd': args.out_dir,
+           'log_file': log_file, 'ncpu': ncpu, 'memory_gb': memory_gb}
+    if _add_jobs(args.queue_file, [job])>0:
+        print("Adding " + qsub_file + " to " + args.queue_file)
+else:
+    qsub_script = '''#!/bin/bash
+conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n date \n((''' + command + '''\n\n'''
+    open(qsub_file, "w").write(qsub_script)
+    qsub_script = ''') 2>&1) | tee ''' + log_file
+    open(qsub_file, "a").write(qsub_script)
\ No newline at end of file
@@ -10,6 +10,8 @@ import argparse
 import numpy as np
 import pandas as pd
 
+from _scheduler import _add_jobs
+
 parser = argparse.ArgumentParser() 
 
 parser.add_argument( "--input_file",                    type=str,               default="")
@@ -18,6 +20,7 @@ parser.add_argument( "--prior_infor",                   type=str,
 parser.add_argument( "--shared_params_infor",           type=str,               default="")
 parser.add_argument( "--map_file",                      type=str,               default="")
 parser.add_argument( "--out_dir",                       type=str,               default="")
+parser.add_argument( "--partition_dir",                 type=str,               default="")
 
 parser.add_argument( "--running_script",                type=str,               default="")
 
@@ -49,6 +52,9 @@ parser.add_argument( "--converged_samples",             type=int,
 parser.add_argument( "--enzyme_conc_nM",                type=float,             default="100")
 parser.add_argument( "--substrate_conc_nM",             type=float,             default="1350")
 
+parser.add_argument( "--queue_file",                    type=str,               default="")
+parser.add_argument( "--memory_gb",                     type=float,             default=0.)
+
 args = parser.parse_args()
 
 if args.fit_E_S: 
@@ -116,6 +122,11 @@ if args.key_to_check:
 else:
     key_to_check = ""
 
+if len(args.partition_dir)>0:
+    partition_dir = " --partition_dir " + args.partition_dir
+else:
+    partition_dir = " "
+
 name_inhibitors = args.name_inhibitor.split()
 if len(name_inhibitors) == 0:
     df_mers = pd.read_csv(args.input_file)
@@ -132,6 +143,12 @@ if args.split_by != 0:
 else: 
     inhibitor_multi_list = inhibitor_list
 
+if args.memory_gb>0:
+    memory_gb = args.memory_gb
+else:
+    memory_gb = None
+jobs = []
+
 for list_idx, _inhibitor_list in enumerate(inhibitor_multi_list):
 
     if not os.path.isdir(args.out_dir):
@@ -143,19 +160,19 @@ for list_idx, _inhibitor_list in enumerate(inhibitor_multi_list):
     qsub_file = os.path.join(args.out_dir, 'running_files', f"{list_idx}.sh")
     log_file = os.path.join(args.out_dir, 'running_files', f"{list_idx}.log")
 
-    qsub_script = '''#!/bin/bash
+    if len(args.queue_file)==0:
+        qsub_script = '''#!/bin/bash
 conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n\n(('''
-    open(qsub_file, "w").write(qsub_script)
+        open(qsub_file, "w").write(qsub_script)
 
-    for n, inhibitor in enumerate(_inhibitor_list):
+    for n, inhibitor in enumerate(np.atleast_1d(_inhibitor_list)):
 
         inhibitor_dir = inhibitor
         inhibitor_name = inhibitor
 
-        qsub_script = '''date \n''' + \
-        '''python ''' + args.running_script + \
+        command = '''python ''' + args.running_script + \
         ''' --name_inhibitor ''' + inhibitor_name + \
-        ''' --input_file ''' + args.input_file + prior_infor + shared_params + \
+        ''' --input_file ''' + args.input_file + partition_dir + prior_infor + shared_params + \
         map_file + ''' --out_dir ''' + args.out_dir + \
         fit_E_S + fit_E_I + multi_var + multi_alpha + set_lognormal_dE + ''' --dE %0.5f '''%args.dE + \
         set_K_S_DS_equal_K_S_D + set_K_S_DI_equal_K_S_DS + \
@@ -167,10 +184,22 @@ conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n\n(('''
         outlier_removal + exclude_first_trace + key_to_check + \
         ''' --converged_samples %d '''%args.converged_samples +\
         ''' --enzyme_conc_nM %d '''%args.enzyme_conc_nM + \
-        ''' --substrate_conc_nM %d '''%args.substrate_conc_nM + \
-        '''\n\n'''
-
+        ''' --substrate_conc_nM %d '''%args.substrate_conc_nM
+
+        if len(args.queue_file)>0:
+            ## One job for each inhibitor, running in parallel by the scheduler
+            jobs.append({'id': os.path.abspath(os.path.join(args.out_dir, 'running_files', inhibitor_name)),
+                         'command': command, 'cwd': args.out_dir,
+                         'log_file': os.path.join(args.out_dir, 'running_files', f"{inhibitor_name}.log"),
+                         'ncpu': args.nchain, 'memory_gb': memory_gb})
+        else:
+            qsub_script = '''date \n''' + command + '''\n\n'''
+            open(qsub_file, "a").write(qsub_script)
+
+    if len(args.queue_file)==0:
+        qsub_script = ''') 2>&1) | tee ''' + log_file
         open(qsub_file, "a").write(qsub_script)
 
-    qsub_script = ''') 2>&1) | tee ''' + log_file
-    open(qsub_file, "a").write(qsub_script)
\ No newline at end of file
+if len(args.queue_file)>0:
+    nadded = _add_jobs(args.queue_file, jobs)
+    print(f"Adding {nadded} jobs to " + args.queue_file)
\ No newline at end of file
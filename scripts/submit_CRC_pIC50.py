@@ -5,6 +5,8 @@ import argparse
 import numpy as np
 import pandas as pd
 
+from _scheduler import _add_jobs
+
 parser = argparse.ArgumentParser() 
 
 parser.add_argument( "--input_file",                    type=str,               default="")
@@ -13,6 +15,7 @@ parser.add_argument( "--prior_infor",                   type=str,
 parser.add_argument( "--shared_params_infor",           type=str,               default="")
 parser.add_argument( "--map_file",                      type=str,               default="")
 parser.add_argument( "--out_dir",                       type=str,               default="")
+parser.add_argument( "--partition_dir",                 type=str,               default="")
 
 parser.add_argument( "--running_script",                type=str,               default="")
 
@@ -32,15 +35,32 @@ parser.add_argument( "--nburn",                         type=int,
 parser.add_argument( "--nthin",                         type=int,               default=1)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
+parser.add_argument( "--status_every",                  type=int,               default=0)
+parser.add_argument( "--adaptation_file",               type=str,               default="")
+parser.add_argument( "--save_adaptation",               action="store_true",    default=False)
+parser.add_argument( "--dense_mass",                    type=str,               default="diag")
+parser.add_argument( "--decorrelate_logK",              action="store_true",    default=False)
+parser.add_argument( "--chain_method",                  type=str,               default="parallel")
 
 parser.add_argument( "--outlier_removal",               action="store_true",    default=False)
 parser.add_argument( "--exclude_first_trace",           action="store_true",    default=False)
 parser.add_argument( "--key_to_check",                  type=str,               default="")
 parser.add_argument( "--converged_samples",             type=int,               default=500)
+parser.add_argument( "--pIC_method",                    type=str,               default="hill")
+parser.add_argument( "--n_points",                      type=int,               default=50)
+parser.add_argument( "--adaptive_grid",                 action="store_true",    default=False)
+parser.add_argument( "--posterior_band",                action="store_true",    default=False)
+parser.add_argument( "--posterior_nsamples",            type=int,               default=100)
+parser.add_argument( "--prescreen",                     type=str,               default="")
+parser.add_argument( "--prescreen_khat",                type=float,             default=0.7)
+parser.add_argument( "--svi_steps",                     type=int,               default=2000)
 
 parser.add_argument( "--enzyme_conc_nM",                type=float,             default="100")
 parser.add_argument( "--substrate_conc_nM",             type=float,             default="1350")
 
+parser.add_argument( "--queue_file",                    type=str,               default="")
+parser.add_argument( "--memory_gb",                     type=float,             default=0.)
+
 args = parser.parse_args()
 
 if args.fit_E_S: 
@@ -108,6 +128,41 @@ if args.key_to_check:
 else:
     key_to_check = ""
 
+if args.adaptive_grid:
+    adaptive_grid = " --adaptive_grid "
+else:
+    adaptive_grid = " "
+
+if len(args.partition_dir)>0:
+    partition_dir = " --partition_dir " + args.partition_dir
+else:
+    partition_dir = " "
+
+if args.posterior_band:
+    posterior_band = " --posterior_band --posterior_nsamples %d " %args.posterior_nsamples
+else:
+    posterior_band = " "
+
+if len(args.prescreen)>0:
+    prescreen = " --prescreen " + args.prescreen + " --prescreen_khat %0.3f --svi_steps %d " %(args.prescreen_khat, args.svi_steps)
+else:
+    prescreen = " "
+
+if len(args.adaptation_file)>0:
+    adaptation_file = " --adaptation_file " + args.adaptation_file
+else:
+    adaptation_file = " "
+
+if args.save_adaptation:
+    save_adaptation = " --save_adaptation "
+else:
+    save_adaptation = " "
+
+if args.decorrelate_logK:
+    decorrelate_logK = " --decorrelate_logK "
+else:
+    decorrelate_logK = " "
+
 if not os.path.isdir(args.out_dir):
     os.mkdir(args.out_dir)
 
@@ -117,11 +172,9 @@ if not os.path.isdir(args.out_dir):
 qsub_file = os.path.join(args.out_dir, f"CRC_pIC50.sh")
 log_file = os.path.join(args.out_dir, f"CRC_pIC50.log")
 
-qsub_script = '''#!/bin/bash
-conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n date \n((''' + \
-    '''python ''' + args.running_script + \
+command = '''python ''' + args.running_script + \
     ''' --name_inhibitor ''' + args.name_inhibitor + \
-    ''' --input_file ''' + args.input_file + prior_infor + shared_params + \
+    ''' --input_file ''' + args.input_file + partition_dir + prior_infor + shared_params + \
     fit_E_S + fit_E_I + map_file + ''' --out_dir ''' + args.out_dir + \
     multi_var + multi_alpha + set_lognormal_dE + ''' --dE %0.5f '''%args.dE + \
     set_K_S_DS_equal_K_S_D + set_K_S_DI_equal_K_S_DS + \
@@ -130,11 +183,33 @@ conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n date \n((''' + \
     ''' --nthin %d '''%args.nthin + \
     ''' --nchain %d '''%args.nchain + \
     ''' --random_key %d '''%args.random_key + \
+    ''' --status_every %d '''%args.status_every + adaptation_file + save_adaptation + \
+    ''' --dense_mass ''' + args.dense_mass + decorrelate_logK + \
+    ''' --chain_method ''' + args.chain_method + \
     outlier_removal + exclude_first_trace + key_to_check + \
     ''' --converged_samples %d '''%args.converged_samples +\
     ''' --enzyme_conc_nM %d '''%args.enzyme_conc_nM + \
     ''' --substrate_conc_nM %d '''%args.substrate_conc_nM + \
-    '''\n\n'''
-open(qsub_file, "w").write(qsub_script)
-qsub_script = ''') 2>&1) | tee ''' + log_file
-open(qsub_file, "a").write(qsub_script)
+    ''' --pIC_method ''' + args.pIC_method + \
+    ''' --n_points %d '''%args.n_points + adaptive_grid + posterior_band + prescreen
+
+if len(args.queue_file)>0:
+    ## The vectorized or sequential chains of one job run on one core
+    if args.chain_method in ['vectorized', 'sequential']:
+        ncpu = 1
+    else:
+        ncpu = args.nchain
+    if args.memory_gb>0:
+        memory_gb = args.memory_gb
+    else:
+        memory_gb = None
+    job = {'id': os.path.abspath(qsub_file), 'command': command, 'cwd': args.out_dir,
+           'log_file': log_file, 'ncpu': ncpu, 'memory_gb': memory_gb}
+    if _add_jobs(args.queue_file, [job])>0:
+        print("Adding " + qsub_file + " to " + args.queue_file)
+else:
+    qsub_script = '''#!/bin/bash
+conda activate mpro ''' + '''\ncd ''' + args.out_dir + '''\n date \n((''' + command + '''\n\n'''
+    open(qsub_file, "w").write(qsub_script)
+    qsub_script = ''') 2>&1) | tee ''' + log_file
+    open(qsub_file, "a").write(qsub_script)
@@ -12,6 +12,8 @@ import argparse
 import numpy as np
 import pandas as pd
 
+from _scheduler import _add_jobs
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument( "--input_file",                    type=str,               default="")
@@ -40,6 +42,9 @@ parser.add_argument( "--nthin",                         type=int,
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
 
+parser.add_argument( "--queue_file",                    type=str,               default="")
+parser.add_argument( "--memory_gb",                     type=float,             default=0.)
+
 args = parser.parse_args()
 
 if args.fit_E_S: 
@@ -77,6 +82,12 @@ else:
 if not os.path.isdir(args.out_dir):
     os.mkdir(args.out_dir)
 
+if args.memory_gb>0:
+    memory_gb = args.memory_gb
+else:
+    memory_gb = None
+jobs = []
+
 for n, inhibitor in enumerate(inhibitor_list):
 
     inhibitor_dir = inhibitor[7:12]
@@ -111,6 +122,23 @@ for n, inhibitor in enumerate(inhibitor_list):
     log_file  = os.path.join(args.out_dir, inhibitor_dir, inhibitor_dir+".log")
     out_dir = os.path.join(args.out_dir, inhibitor_dir)
 
+    command = '''python ''' + args.running_script + \
+    ''' --input_file ''' + args.input_file + prior_infor + shared_params + \
+    map_file + last_run_dir + ''' --out_dir ''' + out_dir + \
+    ''' --name_inhibitor ''' + inhibitor_name + \
+    fit_E_S + fit_E_I + multi_var + multi_alpha + \
+    set_lognormal_dE + ''' --dE %0.5f '''%args.dE + \
+    ''' --niters %d '''%args.niters + \
+    ''' --nburn %d '''%args.nburn + \
+    ''' --nthin %d '''%args.nthin + \
+    ''' --nchain %d '''%args.nchain + \
+    ''' --random_key %d '''%args.random_key
+
+    if len(args.queue_file)>0:
+        jobs.append({'id': os.path.abspath(qsub_file), 'command': command, 'cwd': out_dir,
+                     'log_file': log_file, 'ncpu': args.nchain, 'memory_gb': memory_gb})
+        continue
+
     qsub_script = '''#!/bin/bash
 #SBATCH --partition=RM-shared
 #SBATCH --nodes=1
@@ -121,20 +149,12 @@ for n, inhibitor in enumerate(inhibitor_list):
 module load anaconda3/2022.10
 conda activate mpro
 cd ''' + out_dir + '''\n''' + \
-    '''date\n''' + \
-    '''python ''' + args.running_script + \
-    ''' --input_file ''' + args.input_file + prior_infor + shared_params + \
-    map_file + last_run_dir + ''' --out_dir ''' + out_dir + \
-    ''' --name_inhibitor ''' + inhibitor_name + \
-    fit_E_S + fit_E_I + multi_var + multi_alpha + \
-    set_lognormal_dE + ''' --dE %0.5f '''%args.dE + \
-    ''' --niters %d '''%args.niters + \
-    ''' --nburn %d '''%args.nburn + \
-    ''' --nthin %d '''%args.nthin + \
-    ''' --nchain %d '''%args.nchain + \
-    ''' --random_key %d '''%args.random_key + \
-    '''\ndate \n''' 
+    '''date\n''' + command + '''\ndate \n'''
 
     print("Submitting " + qsub_file)
     open(qsub_file, "w").write(qsub_script)
-    # os.system("sbatch %s"%qsub_file)
\ No newline at end of file
+    # os.system("sbatch %s"%qsub_file)
+
+if len(args.queue_file)>0:
+    nadded = _add_jobs(args.queue_file, jobs)
+    print(f"Adding {nadded} jobs to " + args.queue_file)
\ No newline at end of file
@@ -8,6 +8,8 @@ import os
 import glob
 import argparse
 
+from _scheduler import _add_jobs
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument( "--input_file",                    type=str,               default="")
@@ -38,6 +40,12 @@ parser.add_argument( "--nburn",                         type=int,
 parser.add_argument( "--nthin",                         type=int,               default=1)
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=0)
+parser.add_argument( "--dense_mass",                    type=str,               default="diag")
+parser.add_argument( "--decorrelate_logK",              action="store_true",    default=False)
+parser.add_argument( "--chain_method",                  type=str,               default="parallel")
+
+parser.add_argument( "--queue_file",                    type=str,               default="")
+parser.add_argument( "--memory_gb",                     type=float,             default=0.)
 
 args = parser.parse_args()
 
@@ -103,24 +111,18 @@ if len(args.last_run_dir)>0:
 else:
     last_run_dir = " "
 
+if args.decorrelate_logK:
+    decorrelate_logK = " --decorrelate_logK "
+else:
+    decorrelate_logK = " "
+
 qsub_file = os.path.join(args.out_dir, "global.job")
 log_file  = os.path.join(args.out_dir, "global.log")
 
 if not os.path.isdir(args.out_dir):
     os.mkdir(args.out_dir)
 
-qsub_script = '''#!/bin/bash
-#SBATCH --partition=RM-shared
-#SBATCH --nodes=1
-#SBATCH --time=48:00:00
-#SBATCH --ntasks-per-node=4
-#SBATCH -o %s '''%log_file + '''
-
-module load anaconda3/2022.10
-conda activate mpro
-cd ''' + args.out_dir + '''\n''' + \
-    '''date\n''' + \
-    '''python ''' + args.running_script + \
+command = '''python ''' + args.running_script + \
     ''' --input_file ''' + args.input_file + prior_infor + shared_params + \
     list_inhibitor + last_run_dir + map_file + ''' --out_dir ''' + args.out_dir + \
     fit_E_S + fit_E_I + multi_var + multi_alpha + \
@@ -131,8 +133,36 @@ cd ''' + args.out_dir + '''\n''' + \
     ''' --nthin %d '''%args.nthin + \
     ''' --nchain %d '''%args.nchain + \
     ''' --random_key %d '''%args.random_key + \
-    '''\ndate \n''' 
+    ''' --dense_mass ''' + args.dense_mass + decorrelate_logK + \
+    ''' --chain_method ''' + args.chain_method
+
+if len(args.queue_file)>0:
+    ## The vectorized or sequential chains of one job run on one core
+    if args.chain_method in ['vectorized', 'sequential']:
+        ncpu = 1
+    else:
+        ncpu = args.nchain
+    if args.memory_gb>0:
+        memory_gb = args.memory_gb
+    else:
+        memory_gb = None
+    job = {'id': os.path.abspath(qsub_file), 'command': command, 'cwd': args.out_dir,
+           'log_file': log_file, 'ncpu': ncpu, 'memory_gb': memory_gb}
+    if _add_jobs(args.queue_file, [job])>0:
+        print("Adding " + qsub_file + " to " + args.queue_file)
+else:
+    qsub_script = '''#!/bin/bash
+#SBATCH --partition=RM-shared
+#SBATCH --nodes=1
+#SBATCH --time=48:00:00
+#SBATCH --ntasks-per-node=4
+#SBATCH -o %s '''%log_file + '''
+
+module load anaconda3/2022.10
+conda activate mpro
+cd ''' + args.out_dir + '''\n''' + \
+    '''date\n''' + command + '''\ndate \n'''
 
-print("Submitting " + qsub_file)
-open(qsub_file, "w").write(qsub_script)
-os.system("sbatch %s"%qsub_file)
\ No newline at end of file
+    print("Submitting " + qsub_file)
+    open(qsub_file, "w").write(qsub_script)
+    os.system("sbatch %s"%qsub_file)
\ No newline at end of file
@@ -10,6 +10,8 @@ import argparse
 import numpy as np
 import pandas as pd
 
+from _scheduler import _add_jobs
+
 parser = argparse.ArgumentParser() 
 
 parser.add_argument( "--running_script",                type=str,               default="")
@@ -45,6 +47,9 @@ parser.add_argument( "--nthin",                         type=int,
 parser.add_argument( "--nchain",                        type=int,               default=4)
 parser.add_argument( "--random_key",                    type=int,               default=1)
 
+parser.add_argument( "--queue_file",                    type=str,               default="")
+parser.add_argument( "--memory_gb",                     type=float,             default=0.)
+
 args = parser.parse_args()
 
 file_name = 'sars_2'
@@ -133,18 +138,7 @@ else:
 qsub_file = os.path.join(args.out_dir, file_name+".job")
 log_file  = os.path.join(args.out_dir, file_name+".log")
 
-qsub_script = '''#!/bin/bash
-#SBATCH --partition=RM-shared
-#SBATCH --nodes=1
-#SBATCH --time=72:00:00
-#SBATCH --ntasks-per-node=4
-#SBATCH -o %s '''%log_file + '''
-
-module load anaconda3/2022.10
-conda activate mpro
-cd ''' + args.out_dir + '''\n''' + \
-    '''date\n''' + \
-    '''python ''' + args.running_script + \
+command = '''python ''' + args.running_script + \
     prior_infor + shared_params + initial_values + last_run_dir + \
     ''' --out_dir ''' + args.out_dir + \
     fit_mutant_kinetics + fit_mutant_AUC + fit_mutant_ICE + fit_wildtype_Nashed + fit_wildtype_Vuong + \
@@ -155,9 +149,30 @@ cd ''' + args.out_dir + '''\n''' + \
     ''' --nburn %d '''%args.nburn + \
     ''' --nthin %d '''%args.nthin + \
     ''' --nchain %d '''%args.nchain + \
-    ''' --random_key %d '''%args.random_key + \
-    '''\ndate \n''' 
+    ''' --random_key %d '''%args.random_key
+
+if len(args.queue_file)>0:
+    if args.memory_gb>0:
+        memory_gb = args.memory_gb
+    else:
+        memory_gb = None
+    job = {'id': os.path.abspath(qsub_file), 'command': command, 'cwd': args.out_dir,
+           'log_file': log_file, 'ncpu': args.nchain, 'memory_gb': memory_gb}
+    if _add_jobs(args.queue_file, [job])>0:
+        print("Adding " + qsub_file + " to " + args.queue_file)
+else:
+    qsub_script = '''#!/bin/bash
+#SBATCH --partition=RM-shared
+#SBATCH --nodes=1
+#SBATCH --time=72:00:00
+#SBATCH --ntasks-per-node=4
+#SBATCH -o %s '''%log_file + '''
+
+module load anaconda3/2022.10
+conda activate mpro
+cd ''' + args.out_dir + '''\n''' + \
+    '''date\n''' + command + '''\ndate \n'''
 
-print("Submitting " + qsub_file)
-open(qsub_file, "w").write(qsub_script)
-# os.system("sbatch %s"%qsub_file)
\ No newline at end of file
+    print("Submitting " + qsub_file)
+    open(qsub_file, "w").write(qsub_script)
+    # os.system("sbatch %s"%qsub_file)
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import matplotlib
+matplotlib.use('Agg')
+
+from _load_data import load_data_one_inhibitor
+from _CRC_fitting import _expt_check_noise_trend, _outliers_each_curve
+from _plotting import plot_data_conc_log
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'CRC', 'input')
+
+
+def _multi_plate_inhibitor():
+    """
+    Return the data of ID_14973 measured on two plates, the second plate with two enzyme concentrations
+    of 24 and 20 data points, with the rows shuffled
+    """
+    df = pd.read_csv(os.path.join(INPUT_DIR, 'Input.csv'))
+    df = df[df['Inhibitor_ID']=='ID_14973']
+    df_2 = df.assign(Plate='19702-MERS2')
+    df_3 = df.assign(Plate='19702-MERS2')[:20].copy()
+    df_3['Enzyme (nM)'] = 100
+    df_3['v (nM.min^{-1})'] *= 2
+    df = pd.concat([df, df_2, df_3], ignore_index=True)
+    return df.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def test_outliers_each_curve_multi_plate():
+    df = _multi_plate_inhibitor()
+    for multi_var in [True, False]:
+        expts, expts_plot = load_data_one_inhibitor(df, multi_var=multi_var)
+        assert [len(curve['v']) for curve in expts_plot] == [24, 24, 20]
+
+        ## Outlier at the first row of df in each CRC
+        if multi_var:
+            outliers = []
+            for i in range(len(expts[0]['CRC'])):
+                rows = np.concatenate([curve['rows'] for curve in expts_plot if curve['plate']==expts[0]['plate'][i]])
+                outliers.append(rows==0)
+        else:
+            outliers = [np.arange(len(df))==0]
+
+        outliers_plot = _outliers_each_curve(expts, outliers, expts_plot)
+        assert [len(mask) for mask in outliers_plot] == [len(curve['v']) for curve in expts_plot]
+        assert sum(np.sum(mask) for mask in outliers_plot) == 1
+        for curve, mask in zip(expts_plot, outliers_plot):
+            np.testing.assert_array_equal(mask, curve['rows']==0)
+
+
+def test_plot_outliers_multi_plate(tmp_path):
+    df = _multi_plate_inhibitor()
+    df.loc[0, 'v (nM.min^{-1})'] *= 10
+    expts, expts_plot = load_data_one_inhibitor(df, multi_var=True)
+    [_, outliers, _, _] = _expt_check_noise_trend(expts)
+    outliers = _outliers_each_curve(expts, outliers, expts_plot)
+    assert [len(mask) for mask in outliers] == [len(curve['v']) for curve in expts_plot]
+
+    params_logK = [-9.4, -8.1, -15.3, -17.0, -6.2, -20.1, -17.1, -13.0]
+    params_kcat = [0., 4.2, 1.9, 0.17]
+    plot_data_conc_log(expts_plot, params_logK, params_kcat, outliers=outliers,
+                       OUTFILE=os.path.join(str(tmp_path), 'CRC'))
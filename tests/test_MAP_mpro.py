@@ -0,0 +1,67 @@
+import os
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+import jax
+from numpyro.infer import Predictive
+
+from _load_data import load_data_one_inhibitor
+from _define_model import Model
+from _model import global_fitting
+from _MAP_mpro import _map_finding
+from _MAP_refinement import _log_density_trace, _potential_energy_matches
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'CRC', 'input')
+
+
+def _small_trace(tmp_path, nsamples=20):
+    """
+    Return [trace, expts, model] with nsamples drawn from the prior of the CRC model of one inhibitor.
+    The first sample is used as initial values, so that args.alpha_list and args.E_list are not empty.
+    """
+    df = pd.read_csv(os.path.join(INPUT_DIR, 'Input.csv'))
+    name = 'ID_14973'
+    expts, _ = load_data_one_inhibitor(df[(df['Inhibitor_ID']==name)*(df['Drop']!=1.0)], multi_var=True)
+
+    args = SimpleNamespace(name_inhibitor=name, prior_infor=os.path.join(INPUT_DIR, 'Prior.json'), shared_params_infor='',
+                           initial_values='', last_run_dir='', out_dir=str(tmp_path), fit_E_S=True, fit_E_I=True,
+                           multi_var=True, multi_alpha=False, set_lognormal_dE=True, dE=0.1, niters=nsamples, nburn=0,
+                           nthin=1, nchain=1, map_refine_topk=0)
+    model = Model(len(expts))
+    model.check_model(args)
+    model_kwargs = {'experiments': expts, 'prior_infor': model.prior_infor, 'shared_params': model.shared_params, 'args': model.args}
+
+    samples = Predictive(global_fitting, num_samples=nsamples)(jax.random.PRNGKey(0), **model_kwargs)
+    trace = {key: np.asarray(value) for key, value in samples.items() if not key.startswith('CRC')}
+
+    init_file = os.path.join(str(tmp_path), 'map.pickle')
+    pickle.dump({key: trace[key][0] for key in trace.keys()}, open(init_file, 'wb'))
+    args.initial_values = init_file
+    model = Model(len(expts))
+    model.check_model(args)
+    return [trace, expts, model]
+
+
+def test_map_finding_agrees_with_log_density(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    [trace, expts, model] = _small_trace(tmp_path)
+    model_kwargs = {'experiments': expts, 'prior_infor': model.prior_infor, 'shared_params': model.shared_params, 'args': model.args}
+
+    log_density = _log_density_trace(global_fitting, model_kwargs, trace)
+    [map_index, _, log_probs] = _map_finding(trace, expts, model.prior_infor, model.args, show_progress=False)
+
+    assert map_index == np.nanargmax(log_density)
+    np.testing.assert_allclose(log_probs, log_density, rtol=1e-8)
+
+
+def test_potential_energy_matches_trace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    [trace, expts, model] = _small_trace(tmp_path)
+    model_kwargs = {'experiments': expts, 'prior_infor': model.prior_infor, 'shared_params': model.shared_params, 'args': model.args}
+
+    log_density = _log_density_trace(global_fitting, model_kwargs, trace)
+    assert _potential_energy_matches(global_fitting, model_kwargs, trace, log_density)
+    assert not _potential_energy_matches(global_fitting, model_kwargs, trace, log_density[::-1])
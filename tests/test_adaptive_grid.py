@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from _adaptive_grid import _adaptive_grid
+
+
+def _hill(x, x50=-6., hill=1.):
+    return 1./(1. + 10**(hill*(x - x50)))
+
+
+@pytest.mark.parametrize('dense_fraction', [0.5, 0.7, 0.98, 1.])
+@pytest.mark.parametrize('n_points', [3, 5, 12, 50])
+def test_grid_includes_endpoints(dense_fraction, n_points):
+    x = _adaptive_grid(_hill, -9., -3., n_points=n_points, dense_fraction=dense_fraction)
+    assert len(x) == n_points
+    assert x[0] == -9. and x[-1] == -3.
+    assert np.all(np.diff(x) > 0)
+
+
+def test_grid_is_dense_in_transition():
+    x = _adaptive_grid(_hill, -12., -3., n_points=50)
+    assert np.sum((x >= -8.)*(x <= -4.)) >= 35
+    assert x[0] == -12. and x[-1] == -3.
+
+
+def test_flat_curve_gives_even_grid():
+    x = _adaptive_grid(lambda x: np.ones_like(x), -9., -3., n_points=20)
+    np.testing.assert_allclose(x, np.linspace(-9., -3., 20))
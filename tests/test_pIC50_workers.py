@@ -0,0 +1,48 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+
+HELPER = """
+def _square(x, offset):
+    return x*x + offset
+"""
+
+SCRIPT = """
+import os
+import sys
+sys.path[:0] = [{script_dir!r}, {tmp_dir!r}]
+from _pIC50 import _map_inhibitors
+from _helper import _square
+
+with open(os.path.join({tmp_dir!r}, 'runs.txt'), 'a') as f:
+    print('run', file=f)
+print(_map_inhibitors(_square, [1, 2, 3], [1], nworkers=2, show_progress=False, script_path={script_path}))
+"""
+
+
+@pytest.mark.parametrize('launcher', ['script', 'runpy', 'command'])
+def test_map_inhibitors_spawn(tmp_path, launcher):
+    tmp_dir = str(tmp_path)
+    with open(os.path.join(tmp_dir, '_helper.py'), 'w') as f:
+        f.write(HELPER)
+    script_file = os.path.join(tmp_dir, 'run_square.py')
+    script_path = 'None' if launcher == 'command' else '__file__'
+    code = SCRIPT.format(script_dir=SCRIPT_DIR, tmp_dir=tmp_dir, script_path=script_path)
+    with open(script_file, 'w') as f:
+        f.write(code)
+
+    if launcher == 'script':
+        command = [sys.executable, script_file]
+    elif launcher == 'runpy':
+        command = [sys.executable, '-c', f"import runpy; runpy.run_path({script_file!r}, run_name='__main__')"]
+    else:
+        command = [sys.executable, '-c', code]
+    output = subprocess.run(command, capture_output=True, text=True, timeout=300, cwd=tmp_dir)
+
+    assert output.returncode == 0, output.stderr
+    assert output.stdout.strip().splitlines()[-1] == '[2, 5, 10]'
+    assert open(os.path.join(tmp_dir, 'runs.txt')).read().count('run') == 1